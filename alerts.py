@@ -0,0 +1,219 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+
+from circuit import backoff_delay
+
+# ======================
+# CONFIG
+# ======================
+# ALERT_ENDPOINT ชี้ไป stub ในเครื่องได้ตอนทดสอบ (รับ JSON แบบเดียวกับ Resend)
+ALERT_ENDPOINT = os.getenv("ALERT_ENDPOINT", "https://api.resend.com/emails")
+
+ALERT_QUEUE_SIZE = 100
+ALERT_RETRIES = 3
+ALERT_TIMEOUT = 10              # วินาที ต่อ request
+ALERT_RATE_PER_MINUTE = 5       # ส่งได้สูงสุดกี่ฉบับต่อนาที
+ALERT_DEDUPE_WINDOW = 3600      # key เดิมส่งซ้ำได้อีกครั้งหลังกี่วินาที (default)
+
+
+class AlertSendError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class ResendSender:
+    """ส่งเมลผ่าน Resend API (หรือ endpoint อื่นที่รับ payload เดียวกัน)"""
+
+    def __init__(self, endpoint=ALERT_ENDPOINT):
+        self.endpoint = endpoint
+        self.api_key = os.getenv("RESEND_API_KEY")
+        self.to_email = os.getenv("ALERT_EMAIL_TO")
+        self.from_email = os.getenv("ALERT_EMAIL_FROM")
+
+    @property
+    def configured(self):
+        return bool(self.api_key and self.to_email and self.from_email)
+
+    async def send(self, session, subject, body):
+        async with session.post(
+            self.endpoint,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "from": self.from_email,  # เช่น oncall@resend.dev
+                "to": [self.to_email],
+                "subject": subject,
+                "text": body,
+            },
+        ) as response:
+            if 200 <= response.status < 300:
+                return
+
+            text = await response.text()
+            # 429 / 5xx → ลองใหม่ได้ / 4xx อื่น (key ผิด, payload ผิด) → ลองซ้ำก็ไม่ผ่าน
+            retryable = response.status == 429 or response.status >= 500
+            raise AlertSendError(f"HTTP {response.status}: {text[:200]}", retryable)
+
+
+class AlertDispatcher:
+    """
+    คิวแจ้งเตือนแบบ async (ไม่บล็อก event loop / ไม่ขวางการบันทึกเคส)
+    - dedupe ด้วย alert key (key เดิมภายใน cooldown → ข้าม)
+    - จำกัดอัตราส่ง / retry แบบ backoff + jitter
+    - ใช้ aiohttp session เดียวตลอดอายุบอท
+    """
+
+    def __init__(
+        self,
+        sender,
+        queue_size=ALERT_QUEUE_SIZE,
+        rate_per_minute=ALERT_RATE_PER_MINUTE
+    ):
+        self.sender = sender
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._min_gap = 60.0 / rate_per_minute
+        self._last_send = 0.0
+        self._last_sent = {}     # key → time.monotonic() ที่รับเข้าคิวล่าสุด
+        self._session = None
+        self._task = None
+
+        self._stats = {
+            "queued": 0,
+            "sent": 0,
+            "failed": 0,
+            "deduped": 0,
+            "dropped": 0,
+            "retries": 0,
+        }
+
+    # ======================
+    # PRODUCER
+    # ======================
+    def notify(self, key, subject, body, cooldown=ALERT_DEDUPE_WINDOW):
+        """
+        เข้าคิวแล้วกลับทันที
+        คืน future ของผลการส่ง (ผล None = สำเร็จ / str = error)
+        คืน None = ถูกข้ามเพราะซ้ำ / คิวเต็ม
+        """
+        now = time.monotonic()
+        last = self._last_sent.get(key)
+        if last is not None and now - last < cooldown:
+            self._stats["deduped"] += 1
+            return None
+
+        done = asyncio.get_running_loop().create_future()
+
+        try:
+            self._queue.put_nowait((key, subject, body, done))
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            print(f"⚠️ Alert queue full, drop | {key}")
+            return None
+
+        self._last_sent[key] = now
+        self._stats["queued"] += 1
+        return done
+
+    def reset(self, key):
+        """เหตุการณ์จบแล้ว (เช่น DB กลับมา) → ครั้งหน้าแจ้งได้ทันที"""
+        self._last_sent.pop(key, None)
+
+    # ======================
+    # LIFECYCLE
+    # ======================
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=15):
+        if self._task is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Alert queue stop timeout, pending={self._queue.qsize()}")
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=ALERT_TIMEOUT)
+            )
+        return self._session
+
+    # ======================
+    # CONSUMER
+    # ======================
+    async def _run(self):
+        while True:
+            key, subject, body, done = await self._queue.get()
+
+            try:
+                # rate limit: เว้นระยะระหว่างฉบับ
+                wait = self._last_send + self._min_gap - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                await self._deliver(key, subject, body)
+                self._stats["sent"] += 1
+                if not done.done():
+                    done.set_result(None)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["failed"] += 1
+                # ส่งไม่ออก → ไม่นับเป็นส่งแล้ว ครั้งหน้าแจ้งได้เลย
+                self._last_sent.pop(key, None)
+                print(f"❌ Alert send failed | {key}:", e)
+                if not done.done():
+                    done.set_result(str(e))
+
+            finally:
+                self._last_send = time.monotonic()
+                self._queue.task_done()
+
+    async def _deliver(self, key, subject, body):
+        if not self.sender.configured:
+            raise AlertSendError("alert sender ENV not set", retryable=False)
+
+        session = self._get_session()
+
+        for attempt in range(ALERT_RETRIES):
+            try:
+                await self.sender.send(session, subject, body)
+                print(f"📧 Alert sent | {key}")
+                return
+            except (AlertSendError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = getattr(e, "retryable", True)
+                if not retryable or attempt == ALERT_RETRIES - 1:
+                    raise
+
+                self._stats["retries"] += 1
+                print(f"⚠️ Alert send retry {attempt+1}/{ALERT_RETRIES} | {key}:", e)
+                await asyncio.sleep(backoff_delay(attempt, base=1.0, cap=30.0))
+
+    # ======================
+    # METRICS
+    # ======================
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        return stats
@@ -1,12 +1,24 @@
 from discord.ext import commands
 from audit.audit_helpers import find_duplicate_person_in_message
-from audit.audit_export import export_audit_csv, export_audit_xlsx
+from audit.audit_export import export_audit, EXPORT_PART_LIMIT
+from audit.audit_jobs import ExportJobRunner
 from datetime import datetime
+import asyncio
 import discord
-import os
+
+
+UPLOAD_MARGIN = 256 * 1024   # เผื่อ overhead ของ multipart ตอนอัปโหลดไฟล์
+
+
+def _format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} MB"
+    return f"{size / 1024:.0f} KB"
 
 
 def setup_audit_commands(bot, get_conn, is_pbt):
+    """ลงทะเบียน !audit / คืน ExportJobRunner ให้ bot ปิดตอน shutdown"""
+    export_jobs = ExportJobRunner()
 
     @commands.command(name="audit")
     @is_pbt()
@@ -22,7 +34,9 @@ def setup_audit_commands(bot, get_conn, is_pbt):
         # audit person
         # =====================
         if subcmd == "person":
-            rows = find_duplicate_person_in_message(get_conn)
+            rows = await asyncio.to_thread(
+                find_duplicate_person_in_message, get_conn
+            )
 
             if not rows:
                 await ctx.send("✅ ไม่พบการแท็กซ้ำ")
@@ -70,63 +84,88 @@ def setup_audit_commands(bot, get_conn, is_pbt):
                 )
                 return
 
-            files = []
-            temp_paths = []   # 👈 เพิ่ม
-            count = None
-
-            # ===== CSV =====
-            if export_type in ("csv", "both"):
-                csv_file, count = export_audit_csv(
-                    get_conn, start_date, end_date
-                )
+            async def deliver(ctx, result):
+                outputs, count = result
 
                 if count == 0:
                     await ctx.send("📭 ไม่มี audit log ในช่วงวันที่นี้")
                     return
 
-                files.append(
-                    discord.File(
-                        fp=csv_file,
-                        filename=f"audit_{start_date}_{end_date}.csv"
-                    )
-                )
+                parts = [
+                    (label, part)
+                    for kind, label in (("csv", "CSV"), ("excel", "Excel"))
+                    for part in outputs.get(kind, [])
+                ]
 
-            # ===== Excel =====
-            if export_type in ("excel", "both"):
-                xlsx_path, excel_count = export_audit_xlsx(
-                    get_conn, start_date, end_date
+                await ctx.send(
+                    f"🧾 Audit log {count} รายการ\n"
+                    f"📅 ช่วงวันที่ {start_date} → {end_date}\n"
+                    f"📦 {len(parts)} ไฟล์ | รวม "
+                    f"{_format_size(sum(part['bytes'] for _, part in parts))}"
                 )
 
-                if count is None:
-                    count = excel_count
+                # 1 ไฟล์ต่อข้อความ → ไม่ชนลิมิตขนาดรวมต่อข้อความ
+                for label, part in parts:
+                    detail = (
+                        f"{label} `{part['filename']}` | "
+                        f"{part['rows']:,} รายการ | {_format_size(part['bytes'])}"
+                    )
 
-                if count == 0:
-                    await ctx.send("📭 ไม่มี audit log ในช่วงวันที่นี้")
-                    return
+                    if part["bytes"] > upload_limit:
+                        await ctx.send(f"⚠️ {detail} ใหญ่เกินลิมิตอัปโหลด ข้ามไฟล์นี้")
+                        continue
 
-                files.append(
-                    discord.File(
-                        fp=xlsx_path,
-                        filename=f"audit_{start_date}_{end_date}.xlsx"
+                    await ctx.send(
+                        content=f"📎 {detail}",
+                        file=discord.File(fp=part["fp"], filename=part["filename"])
                     )
+
+            # ลิมิตไฟล์แนบของ server (เผื่อ overhead ของ multipart)
+            upload_limit = ctx.guild.filesize_limit if ctx.guild else EXPORT_PART_LIMIT
+            part_limit = upload_limit - UPLOAD_MARGIN
+
+            # query เดียว อ่านรอบเดียว → CSV + Excel พร้อมกัน (รันเป็น job นอก event loop)
+            export_jobs.submit(
+                ctx,
+                f"{export_type} {start_date} → {end_date}",
+                export_audit,
+                (get_conn, start_date, end_date, export_type, part_limit),
+                deliver
+            )
+            return
+
+        # =====================
+        # audit jobs / cancel
+        # =====================
+        if subcmd == "jobs":
+            jobs = export_jobs.jobs()
+            if not jobs:
+                await ctx.send("📭 ไม่มี export ที่กำลังทำงาน")
+                return
+
+            msg = "🗂️ **Export jobs**\n\n"
+            for job in jobs:
+                msg += (
+                    f"- #{job.id} | {job.label} | {job.state} | "
+                    f"{job.rows:,} รายการ | {job.elapsed()} วินาที | โดย {job.owner}\n"
                 )
 
-                temp_paths.append(xlsx_path)   # 👈 สำคัญ
+            await ctx.send(msg)
+            return
+
+        if subcmd == "cancel":
+            try:
+                job_id = int(export_type)
+            except (TypeError, ValueError):
+                await ctx.send("❌ ใช้ `!audit cancel <job id>` (ดู id จาก `!audit jobs`)")
+                return
 
-            await ctx.send(
-                content=(
-                    f"🧾 Audit log {count} รายการ\n"
-                    f"📅 ช่วงวันที่ {start_date} → {end_date}"
-                ),
-                files=files
-            )
+            job = export_jobs.cancel(job_id)
+            if job is None:
+                await ctx.send(f"❌ ไม่พบ export #{job_id}")
+                return
 
-            # ===== cleanup temp files (xlsx only) =====
-            for path in temp_paths:
-                try:
-                    os.remove(path)
-                except Exception as e:
-                    print("⚠️ temp file cleanup failed:", e)
+            await ctx.send(f"🛑 กำลังยกเลิก export #{job_id}")
             return
 
         # =====================
@@ -137,8 +176,13 @@ def setup_audit_commands(bot, get_conn, is_pbt):
             "- `!audit person`\n"
             "- `!audit export csv DD/MM/YYYY [DD/MM/YYYY]`\n"
             "- `!audit export excel DD/MM/YYYY [DD/MM/YYYY]`\n"
-            "- `!audit export DD/MM/YYYY [DD/MM/YYYY]` (ส่งทั้ง CSV + Excel)"
+            "- `!audit export DD/MM/YYYY [DD/MM/YYYY]` (ส่งทั้ง CSV + Excel)\n"
+            "  ↳ CSV ส่งเป็น .zip / ไฟล์ใหญ่เกินลิมิตจะแบ่งเป็นหลาย part\n"
+            "- `!audit jobs` (export ที่กำลังทำงาน)\n"
+            "- `!audit cancel <job id>`"
         )
 
     # register command
     bot.add_command(audit)
+
+    return export_jobs
@@ -1,98 +1,197 @@
 import csv
 import io
-from datetime import datetime
+import zipfile
+import zlib
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, PatternFill, Alignment
-import tempfile
-import os
 
-def export_audit_csv(get_conn, start_date, end_date):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    action,
-                    actor,
-                    target,
-                    channel,
-                    message_id,
-                    detail,
-                    created_at
-                FROM audit_logs
-                WHERE created_at::date BETWEEN %s AND %s
-                ORDER BY created_at ASC
-            """, (start_date, end_date))
-
-            rows = cur.fetchall()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    writer.writerow([
-        "action",
-        "actor",
-        "target",
-        "channel",
-        "message_id",
-        "detail",
-        "created_at"
-    ])
-
-    for row in rows:
-        writer.writerow(row)
-
-    output.seek(0)
-    return output, len(rows)
-
-def export_audit_xlsx(get_conn, start_date, end_date):
+# ช่วงวันแบบ range → ใช้ index created_at ได้ (ไม่ cast ::date ทุก row)
+# date เทียบกับ timestamptz = เที่ยงคืนตาม timezone ของ session (เหมือน ::date เดิม)
+AUDIT_EXPORT_SQL = """
+    SELECT
+        action,
+        actor,
+        target,
+        channel,
+        message_id,
+        detail,
+        created_at
+    FROM audit_logs
+    WHERE created_at >= %s::date
+      AND created_at < %s::date + 1
+    ORDER BY created_at ASC
+"""
+
+AUDIT_FETCH_SIZE = 2000   # จำนวน row ต่อรอบที่ดึงจาก server-side cursor
+
+
+def stream_audit_rows(get_conn, start_date, end_date, fetch_size=AUDIT_FETCH_SIZE):
+    """
+    ดึง audit log ทีละก้อนผ่าน named (server-side) cursor
+    หน่วยความจำคงที่ไม่ว่าช่วงวันจะยาวแค่ไหน
+    """
     with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    action,
-                    actor,
-                    target,
-                    channel,
-                    message_id,
-                    detail,
-                    created_at
-                FROM audit_logs
-                WHERE created_at::date BETWEEN %s AND %s
-                ORDER BY created_at ASC
-            """, (start_date, end_date))
-            rows = cur.fetchall()
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Audit Logs"
-
-    headers = [
-        "Action",
-        "Actor",
-        "Target",
-        "Channel",
-        "Message ID",
-        "Detail",
-        "Created At"
-    ]
-
-    # ===== Header style =====
-    header_font = Font(bold=True)
-    header_fill = PatternFill("solid", fgColor="DDDDDD")
-    center_align = Alignment(vertical="center")
-
-    ws.append(headers)
-
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=1, column=col)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_align
-
-    # ===== Data rows =====
-    for row in rows:
-        ws.append([
+        with conn.cursor(name="audit_export") as cur:
+            cur.itersize = fetch_size
+            cur.execute(AUDIT_EXPORT_SQL, (start_date, end_date))
+
+            for row in cur:
+                yield row
+
+
+CSV_HEADERS = [
+    "action",
+    "actor",
+    "target",
+    "channel",
+    "message_id",
+    "detail",
+    "created_at"
+]
+
+# ======================
+# PARTS (ไฟล์แนบ Discord มีขนาดจำกัด)
+# ======================
+# แต่ละ part = ไฟล์ที่เปิดได้เองครบ (มี header ของตัวเอง)
+# part = {"filename", "fp", "bytes", "rows"}
+EXPORT_PART_LIMIT = 8 * 1024 * 1024
+CSV_PART_MARGIN = 512 * 1024      # zlib ยังพักข้อมูลไว้ใน buffer บางส่วน → ตัด part ก่อนถึงลิมิต
+XLSX_CELL_OVERHEAD = 5            # byte ต่อ cell ของ XML (ref / index) หลังบีบอัด (วัดจากไฟล์จริงได้ ~4)
+
+
+def _part_filename(basename, ext, index, total):
+    if total == 1:
+        return f"{basename}{ext}"
+    return f"{basename}_part{index}of{total}{ext}"
+
+
+class AuditCsvExport:
+    """
+    CSV บีบอัดเป็น .zip ระหว่างเขียน (stream ผ่าน ZipFile.open)
+    ขนาดที่บีบอัดแล้วใกล้ part_limit → ปิด part แล้วเริ่มไฟล์ใหม่
+    """
+
+    def __init__(self, basename, part_limit=EXPORT_PART_LIMIT):
+        self.basename = basename
+        self.part_limit = max(part_limit - CSV_PART_MARGIN, part_limit // 2)
+        self.parts = []
+        self._open_part()
+
+    def _open_part(self):
+        index = len(self.parts) + 1
+        inner = (
+            f"{self.basename}.csv"
+            if index == 1 else
+            f"{self.basename}_part{index}.csv"
+        )
+
+        self._buffer = io.BytesIO()
+        self._zip = zipfile.ZipFile(self._buffer, "w", compression=zipfile.ZIP_DEFLATED)
+        self._text = io.TextIOWrapper(
+            self._zip.open(inner, "w", force_zip64=True),
+            encoding="utf-8",
+            newline=""
+        )
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(CSV_HEADERS)
+        self._rows = 0
+
+    def _close_part(self):
+        self._text.close()
+        self._zip.close()
+
+        self.parts.append({
+            "fp": self._buffer,
+            "bytes": self._buffer.tell(),
+            "rows": self._rows,
+        })
+        self._buffer.seek(0)
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self._rows += 1
+
+        if self._buffer.tell() >= self.part_limit:
+            self._close_part()
+            self._open_part()
+
+    def finish(self):
+        self._close_part()
+
+        total = len(self.parts)
+        for index, part in enumerate(self.parts, start=1):
+            part["filename"] = _part_filename(self.basename, ".csv.zip", index, total)
+
+        return self.parts
+
+
+XLSX_HEADERS = [
+    "Action",
+    "Actor",
+    "Target",
+    "Channel",
+    "Message ID",
+    "Detail",
+    "Created At"
+]
+XLSX_MAX_WIDTH = 40
+XLSX_WIDTH_SAMPLE_ROWS = 500   # ความกว้าง column คิดจาก row ช่วงแรกเท่านี้
+
+
+class AuditXlsxExport:
+    """
+    Excel แบบ write-only (เขียน row ลง stream ทันที ไม่เก็บ cell ไว้ทั้งชีท)
+    write-only ต้องกำหนดความกว้าง column ก่อน row แรก
+    → พัก row ช่วงแรกไว้ (XLSX_WIDTH_SAMPLE_ROWS) วัดความกว้างระหว่างเขียน แล้วค่อยปล่อยทั้งก้อน
+    """
+
+    def __init__(self):
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet("Audit Logs")
+
+        self._widths = [len(h) for h in XLSX_HEADERS]
+        self._pending = []
+        self._started = False
+
+    def _track_widths(self, values):
+        for i, value in enumerate(values):
+            if value:
+                self._widths[i] = max(self._widths[i], len(str(value)))
+
+    def _start(self):
+        ws = self._ws
+
+        # ===== Auto width (จาก row ที่วัดไว้) =====
+        for i, width in enumerate(self._widths, start=1):
+            ws.column_dimensions[get_column_letter(i)].width = min(width + 2, XLSX_MAX_WIDTH)
+
+        # ===== Freeze header =====
+        ws.freeze_panes = "A2"
+
+        # ===== Header style =====
+        header_font = Font(bold=True)
+        header_fill = PatternFill("solid", fgColor="DDDDDD")
+        center_align = Alignment(vertical="center")
+
+        header = []
+        for title in XLSX_HEADERS:
+            cell = WriteOnlyCell(ws, value=title)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = center_align
+            header.append(cell)
+        ws.append(header)
+
+        for values in self._pending:
+            ws.append(values)
+
+        self._pending = []
+        self._started = True
+
+    def write(self, row):
+        values = [
             row[0],
             row[1],
             row[2],
@@ -100,24 +199,110 @@ def export_audit_xlsx(get_conn, start_date, end_date):
             row[4],
             row[5],
             row[6].strftime("%Y-%m-%d %H:%M:%S")
-        ])
+        ]
+
+        if self._started:
+            self._ws.append(values)
+            return
+
+        self._track_widths(values)
+        self._pending.append(values)
+
+        if len(self._pending) >= XLSX_WIDTH_SAMPLE_ROWS:
+            self._start()
+
+    def finish(self):
+        if not self._started:
+            self._start()
+
+        output = io.BytesIO()
+        self._wb.save(output)
+        output.seek(0)
+        return output
+
+
+class AuditXlsxParts:
+    """
+    แบ่ง Excel เป็นหลายไฟล์ (xlsx เป็น zip บีบอัดอยู่แล้ว)
+    ขนาดจริงรู้ตอน save เท่านั้น → บีบอัดค่าของแต่ละ row ด้วย zlib ไปพร้อมกัน (ใกล้เคียงที่ zip ทำจริง)
+    + XML ต่อ cell แล้วตัด part เมื่อค่าประมาณถึงลิมิต
+    """
+
+    def __init__(self, basename, part_limit=EXPORT_PART_LIMIT):
+        self.basename = basename
+        self.part_limit = part_limit
+        self.parts = []
+        self._open_part()
+
+    def _open_part(self):
+        self._book = AuditXlsxExport()
+        self._deflate = zlib.compressobj()
+        self._estimate = 0
+        self._rows = 0
+
+    def _close_part(self):
+        fp = self._book.finish()
+        self.parts.append({
+            "fp": fp,
+            "bytes": fp.getbuffer().nbytes,
+            "rows": self._rows,
+        })
+
+    def write(self, row):
+        self._book.write(row)
+        self._rows += 1
+        values = [str(value) for value in row if value is not None]
+        self._estimate += (
+            len(self._deflate.compress("\t".join(values).encode("utf-8")))
+            + XLSX_CELL_OVERHEAD * len(values)
+        )
+
+        if self._estimate >= self.part_limit:
+            self._close_part()
+            self._open_part()
+
+    def finish(self):
+        self._close_part()
+
+        total = len(self.parts)
+        for index, part in enumerate(self.parts, start=1):
+            part["filename"] = _part_filename(self.basename, ".xlsx", index, total)
+
+        return self.parts
+
 
-    # ===== Freeze header =====
-    ws.freeze_panes = "A2"
+def export_audit(
+    get_conn,
+    start_date,
+    end_date,
+    export_type="both",
+    part_limit=EXPORT_PART_LIMIT,
+    progress=None
+):
+    """
+    query เดียว / อ่านรอบเดียว → ส่งแต่ละ row เข้าทุก writer พร้อมกัน
+    progress(จำนวน row) ถูกเรียกทุก AUDIT_FETCH_SIZE row (โยน exception เพื่อหยุดได้)
+    คืน ({"csv": [part, ...], "excel": [part, ...]}, จำนวน row)
+    """
+    basename = f"audit_{start_date}_{end_date}"
 
-    # ===== Auto width =====
-    for col in ws.columns:
-        max_length = 0
-        col_letter = get_column_letter(col[0].column)
+    writers = {}
+    if export_type in ("csv", "both"):
+        writers["csv"] = AuditCsvExport(basename, part_limit)
+    if export_type in ("excel", "both"):
+        writers["excel"] = AuditXlsxParts(basename, part_limit)
 
-        for cell in col:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
+    if progress:
+        progress(0)
 
-        ws.column_dimensions[col_letter].width = min(max_length + 2, 40)
+    count = 0
+    for row in stream_audit_rows(get_conn, start_date, end_date):
+        for writer in writers.values():
+            writer.write(row)
+        count += 1
 
-    filename = f"audit_{start_date}_{end_date}.xlsx"
-    path = os.path.join(tempfile.gettempdir(), filename)
-    wb.save(path)
+        if progress and count % AUDIT_FETCH_SIZE == 0:
+            progress(count)
 
-    return path, len(rows)
\ No newline at end of file
+    outputs = {kind: writer.finish() for kind, writer in writers.items()}
+    return outputs, count
@@ -4,9 +4,10 @@ def find_duplicate_person_in_message(get_conn):
     with get_conn() as conn:
         with conn.cursor() as cur:
             cur.execute("""
-                SELECT message_id, name, COUNT(*)
-                FROM cases
-                GROUP BY message_id, name
+                SELECT c.message_id, COALESCE(o.display_name, MIN(c.name)), COUNT(*)
+                FROM cases c
+                LEFT JOIN officers o ON o.id = c.officer_id
+                GROUP BY c.message_id, c.officer_id, o.display_name
                 HAVING COUNT(*) > 1
             """)
             return cur.fetchall()
@@ -0,0 +1,154 @@
+# audit/audit_jobs.py
+import asyncio
+import functools
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ======================
+# CONFIG
+# ======================
+EXPORT_MAX_JOBS = 2              # export ที่รันพร้อมกันได้สูงสุด (ที่เหลือรอคิว)
+EXPORT_PROGRESS_INTERVAL = 3.0   # แก้ข้อความ progress ทุกกี่วินาที
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ExportJob:
+    def __init__(self, job_id, owner, label):
+        self.id = job_id
+        self.owner = owner
+        self.label = label
+        self.state = "queued"     # queued / running / done / failed / cancelled
+        self.rows = 0
+        self.created = time.monotonic()
+        self.cancel_event = threading.Event()
+        self.task = None
+
+    def progress(self, rows):
+        """เรียกจาก worker thread ระหว่าง export → โยน ExportCancelled ถ้าถูกสั่งยกเลิก"""
+        self.rows = rows
+        if self.cancel_event.is_set():
+            raise ExportCancelled()
+
+    def elapsed(self):
+        return int(time.monotonic() - self.created)
+
+
+class ExportJobRunner:
+    """
+    รัน export เป็น background job บน thread pool แยก (ไม่ใช้ default executor ร่วมกับงานอื่น)
+    จำกัดจำนวน job พร้อมกัน / แก้ข้อความ progress / ยกเลิกได้ / ส่งไฟล์เมื่อเสร็จ
+    """
+
+    def __init__(self, max_jobs=EXPORT_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_jobs,
+            thread_name_prefix="audit-export"
+        )
+        self._slots = asyncio.Semaphore(max_jobs)
+        self._ids = itertools.count(1)
+        self._jobs = {}
+
+    # ======================
+    # SUBMIT / CANCEL
+    # ======================
+    def submit(self, ctx, label, func, args, deliver):
+        """
+        func(*args, progress=job.progress) รันใน thread
+        deliver(ctx, result) รันบน event loop เมื่อเสร็จ
+        """
+        job = ExportJob(next(self._ids), str(ctx.author), label)
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(ctx, job, func, args, deliver))
+        return job
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+
+        job.cancel_event.set()
+        if job.state == "queued":
+            # ยังไม่ได้ slot → ยกเลิก task ได้เลย
+            job.task.cancel()
+
+        return job
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    async def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.cancel_event.set()
+            job.task.cancel()
+
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # ======================
+    # WORKER
+    # ======================
+    @staticmethod
+    async def _edit(message, content):
+        try:
+            await message.edit(content=content)
+        except Exception as e:
+            print("⚠️ export progress edit failed:", e)
+
+    async def _run(self, ctx, job, func, args, deliver):
+        status = await ctx.send(f"⏳ Export #{job.id} ({job.label}) รอคิว...")
+
+        try:
+            async with self._slots:
+                if job.cancel_event.is_set():
+                    raise ExportCancelled()
+
+                job.state = "running"
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(
+                    self._executor,
+                    functools.partial(func, *args, progress=job.progress)
+                )
+
+                while True:
+                    done, _ = await asyncio.wait({future}, timeout=EXPORT_PROGRESS_INTERVAL)
+                    if done:
+                        break
+
+                    await self._edit(
+                        status,
+                        f"⏳ Export #{job.id} ({job.label}) | "
+                        f"{job.rows:,} รายการ | {job.elapsed()} วินาที\n"
+                        f"ยกเลิก: `!audit cancel {job.id}`"
+                    )
+
+                result = future.result()
+
+            job.state = "done"
+            await self._edit(
+                status,
+                f"✅ Export #{job.id} ({job.label}) เสร็จใน {job.elapsed()} วินาที"
+            )
+            await deliver(ctx, result)
+
+        except ExportCancelled:
+            job.state = "cancelled"
+            await self._edit(status, f"🛑 Export #{job.id} ({job.label}) ถูกยกเลิก")
+
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            job.cancel_event.set()
+            await self._edit(status, f"🛑 Export #{job.id} ({job.label}) ถูกยกเลิก")
+            raise
+
+        except Exception as e:
+            job.state = "failed"
+            print(f"❌ export job #{job.id} error:", e)
+            await self._edit(status, f"❌ Export #{job.id} ({job.label}) ผิดพลาด: {e}")
+
+        finally:
+            self._jobs.pop(job.id, None)
@@ -0,0 +1,160 @@
+# audit/audit_sink.py
+import asyncio
+import time
+from datetime import datetime, timezone
+
+# ======================
+# CONFIG
+# ======================
+AUDIT_FLUSH_ROWS = 100        # flush เมื่อสะสมครบกี่ event
+AUDIT_FLUSH_INTERVAL = 2.0    # หรือทุกกี่วินาที
+AUDIT_MAX_BUFFER = 5000       # DB ล่มนาน → เก็บไว้ได้สูงสุด (เกินนี้ทิ้งอันเก่าสุด)
+
+AUDIT_INSERT_SQL = """
+    INSERT INTO audit_logs
+        (action, actor, target, channel, message_id, detail, created_at)
+    VALUES
+        {values}
+"""
+
+
+class AuditSink:
+    """
+    buffer audit log ในหน่วยความจำ แล้วเขียนเป็น multi-row INSERT
+    log() ไม่แตะ DB → เรียกจาก event handler ได้โดยไม่ต้องรอ
+    created_at เก็บตอนเกิด event (ไม่ใช่ตอน flush)
+    """
+
+    def __init__(
+        self,
+        transaction,
+        flush_rows=AUDIT_FLUSH_ROWS,
+        flush_interval=AUDIT_FLUSH_INTERVAL,
+        max_buffer=AUDIT_MAX_BUFFER
+    ):
+        self._transaction = transaction
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self._buffer = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._closing = False
+
+        self._stats = {
+            "logged": 0,
+            "written": 0,
+            "batches": 0,
+            "failures": 0,
+            "dropped": 0,
+            "last_flush_ms": 0.0,
+        }
+
+    # ======================
+    # PRODUCER
+    # ======================
+    def log(
+        self,
+        action: str,
+        actor: str = None,
+        target: str = None,
+        channel: str = None,
+        message_id: str = None,
+        detail: str = None
+    ):
+        if len(self._buffer) >= self.max_buffer:
+            self._buffer.pop(0)
+            self._stats["dropped"] += 1
+
+        self._buffer.append((
+            action,
+            actor,
+            target,
+            channel,
+            message_id,
+            detail,
+            datetime.now(timezone.utc)
+        ))
+        self._stats["logged"] += 1
+
+        if len(self._buffer) >= self.flush_rows:
+            self._wakeup.set()
+
+    # ======================
+    # FLUSH
+    # ======================
+    async def flush(self):
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.flush_rows]
+                del self._buffer[:len(batch)]
+
+                started = time.perf_counter()
+                try:
+                    await self._write(batch)
+                except asyncio.CancelledError:
+                    # ถูก cancel ระหว่างเขียน → batch ยังไม่ถูกนับว่าเขียนแล้ว ใส่คืนก่อนออก
+                    self._buffer[:0] = batch
+                    raise
+                except Exception as e:
+                    # ใส่คืนหัวคิว รอ flush รอบถัดไป
+                    self._buffer[:0] = batch
+                    del self._buffer[:max(0, len(self._buffer) - self.max_buffer)]
+                    self._stats["failures"] += 1
+                    print(f"❌ audit flush error ({len(batch)} events):", e)
+                    return
+
+                self._stats["batches"] += 1
+                self._stats["written"] += len(batch)
+                self._stats["last_flush_ms"] = (time.perf_counter() - started) * 1000
+
+    async def _write(self, batch):
+        values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+        params = [v for row in batch for v in row]
+
+        async with self._transaction() as cur:
+            await cur.execute(AUDIT_INSERT_SQL.format(values=values), params)
+
+    # ======================
+    # LIFECYCLE
+    # ======================
+    def start(self):
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+            print("🧾 Audit sink started")
+
+    async def stop(self):
+        # ไม่ cancel → ให้ loop เขียน batch ที่ค้างอยู่ให้จบแล้วออกเอง
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        # flush รอบสุดท้ายก่อนปิด pool
+        await self.flush()
+        if self._buffer:
+            print(f"⚠️ Audit sink stopped with {len(self._buffer)} unwritten events")
+        else:
+            print("🧾 Audit sink stopped")
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            await self.flush()
+
+    # ======================
+    # METRICS
+    # ======================
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["pending"] = len(self._buffer)
+        return stats
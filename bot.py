@@ -2,25 +2,36 @@
 # IMPORTS
 # ======================
 import os
-import re
 import discord
-import time
-import psycopg2
 from datetime import datetime, timedelta
 from discord.ext import commands
 from audit.audit_commands import setup_audit_commands
+from audit.audit_sink import AuditSink
 from discord import Embed
 from datetime import timezone
 import asyncio
 import random
-import requests
+
+from db import get_conn, pool_stats, close_pool, db_circuit
+from circuit import CircuitOpenError
+import db_async
+from ingest import CaseIngestQueue
+from spool import CaseSpool
+from alerts import AlertDispatcher, ResendSender
+from meta_store import BotMetaStore
+from rollup import refresh_rollup
+from migrations import run_migrations, explain_hot_queries
+from names import normalize_name
+from officers import upsert_officers
+from sheet_outbox import SheetOutbox, enqueue_sheet_write
 
 from sheet import (
-    get_sheet,
     get_sheet_by_date,
-    find_day_column_safe,
-    write_body_case_total,
-    build_name_row_map
+    drop_stale_handles,
+    get_synced_case_layout,
+    note_own_write,
+    sheet_scheduler,
+    write_body_case_total
 )
 
 # ======================
@@ -66,6 +77,9 @@ DAILY_REPORT_CHANNEL_ID = 1449425399397482789  # ห้องรายงาน
 
 TH_TZ = timezone(timedelta(hours=7))
 
+# bot_meta (dashboard id / lock ต่าง ๆ) อ่านจาก memory, เขียนผ่านลง DB
+meta_store = BotMetaStore(default_tz=TH_TZ)
+
 # ======================
 # PERMISSION CHECK
 # ======================
@@ -78,277 +92,321 @@ def is_pbt():
 # DB HELPERS
 # ======================
 
-def send_email_alert(subject, body):
-    api_key = os.getenv("RESEND_API_KEY")
-    to_email = os.getenv("ALERT_EMAIL_TO")
-    from_email = os.getenv("ALERT_EMAIL_FROM")
+# แจ้งเตือนผ่านคิว async (aiohttp) → ไม่บล็อก event loop
+alert_dispatcher = AlertDispatcher(ResendSender())
 
-    if not api_key or not to_email or not from_email:
-        print("⚠️ Resend ENV not set, skip email alert")
-        return
 
-    try:
-        response = requests.post(
-            "https://api.resend.com/emails",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "from": from_email,  # เช่น oncall@resend.dev
-                "to": [to_email],
-                "subject": subject,
-                "text": body,
-            },
-            timeout=10,
+CASE_UPSERT_SQL = """
+    INSERT INTO cases
+     (date, name, channel, case_type, cases, message_id, is_uphill, norm_name, officer_id)
+    VALUES
+     {values}
+
+    ON CONFLICT (message_id, officer_id)
+    DO UPDATE SET
+        name = EXCLUDED.name,
+        is_deleted = FALSE,
+        cases = EXCLUDED.cases,
+        case_type = EXCLUDED.case_type,
+        channel = EXCLUDED.channel,
+        date = EXCLUDED.date,
+        is_uphill = EXCLUDED.is_uphill,
+        norm_name = EXCLUDED.norm_name;
+"""
+
+
+def build_case_rows(message, case_type: str, case_value: int) -> list:
+    """
+    แปลง 1 ข้อความ → rows ของ cases (1 row ต่อคนที่ถูกแท็ก)
+    กันคนซ้ำในโพสเดียว (ตาม discord id ไม่ใช่ชื่อ → ชื่อเล่นซ้ำกัน 2 คนก็ยังแยก row)
+    เพราะ ON CONFLICT แก้ row เดิมซ้ำใน statement เดียวไม่ได้
+    row สุดท้ายคือ discord id → _upsert_case_rows แปลงเป็น officer_id
+    """
+    message_date = message.created_at.astimezone(TH_TZ).date()
+    uphill = is_uphill_case(message.content)
+
+    rows = {}
+    for member in set(message.mentions):
+        rows[member.id] = (
+            message_date,
+            member.display_name,
+            message.channel.name,
+            case_type,
+            case_value,
+            str(message.id),
+            uphill,
+            normalize_name(member.display_name),
+            member.id
         )
 
-        if 200 <= response.status_code < 300:
-            print("📧 Resend email sent successfully")
-        else:
-            print("❌ Resend email failed:", response.text)
+    return list(rows.values())
 
-    except Exception as e:
-        print("❌ Resend exception:", e)
 
+async def _upsert_case_rows(cur, rows):
+    officer_ids = await upsert_officers(
+        cur,
+        {row[8]: (row[1], row[7]) for row in rows}
+    )
 
-def get_conn(retries=3, delay=2):
-    if not DATABASE_URL:
-        raise RuntimeError("DATABASE_URL not set")
+    values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(rows))
+    params = []
+    for row in rows:
+        params.extend(row[:8])
+        params.append(officer_ids[row[8]])
 
-    for attempt in range(retries):
-        try:
-            return psycopg2.connect(
-                DATABASE_URL,
-                connect_timeout=10,
-                sslmode="require",
-                keepalives=1,
-                keepalives_idle=30,
-                keepalives_interval=10,
-                keepalives_count=5
-            )
-        except psycopg2.OperationalError as e:
-            print(f"⚠️ DB connect failed (attempt {attempt+1}/{retries}):", e)
-            time.sleep(delay)
-
-    raise RuntimeError("❌ Database connection failed after retries")
-
-def save_case_pg(
-    name: str,
-    channel: str,
-    case_type: str,
-    cases: int,
-    message_id: int,
-    message_date,
-    is_uphill: bool = False
-):
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO cases
-                     (date, name, channel, case_type, cases, message_id, is_uphill)
-                    VALUES
-                     (%s, %s, %s, %s, %s, %s, %s)
-
-                    ON CONFLICT (message_id, name)
-                    DO UPDATE SET
-                        is_deleted = FALSE,
-                        cases = EXCLUDED.cases,
-                        case_type = EXCLUDED.case_type,
-                        channel = EXCLUDED.channel,
-                        date = EXCLUDED.date,
-                        is_uphill = EXCLUDED.is_uphill;
-                """, (
-                    message_date,
-                    name,
-                    channel,
-                    case_type,
-                    cases,
-                    str(message_id),
-                    is_uphill
-                ))
-        print(
-            f"✅ Saved | {name} | {case_type} | +{cases} | "
-            f"date={message_date} | msg={message_id}"
+    await cur.execute(CASE_UPSERT_SQL.format(values=values), params)
+
+
+async def save_case_batch(batch: list):
+    """
+    flush ของ case_queue: หลายโพส → INSERT เดียว / commit เดียว
+    batch = [(message_id, rows), ...]
+    """
+    rows = {}
+    for message_id, message_rows in batch:
+        for row in message_rows:
+            # โพสเดียวกันเข้าคิวซ้ำ (backfill + live) → เอาอันล่าสุด
+            rows[(row[5], row[8])] = row
+
+    async with db_async.transaction() as cur:
+        await _upsert_case_rows(cur, list(rows.values()))
+        await refresh_rollup(cur, [message_id for message_id, _ in batch])
+
+    print(f"✅ Saved batch | {len(batch)} โพส | {len(rows)} เคส")
+
+
+async def _replace_message_cases(message_id: int, rows: list):
+    """soft-delete เคสเดิม + บันทึกใหม่ ใน transaction เดียว / คืนจำนวน row ที่ถูก soft-delete"""
+    async with db_async.transaction() as cur:
+        await cur.execute(
+            """
+            UPDATE cases
+            SET is_deleted = TRUE
+            WHERE message_id = %s
+              AND is_deleted = FALSE
+            """,
+            (str(message_id),)
         )
+        deleted = cur.rowcount
+
+        if rows:
+            await _upsert_case_rows(cur, rows)
+
+        await refresh_rollup(cur, [message_id])
+
+    return deleted
+
+
+async def _delete_message_cases(message_id: int):
+    async with db_async.transaction() as cur:
+        await cur.execute(
+            """
+            UPDATE cases
+            SET is_deleted = TRUE
+            WHERE message_id = %s
+              AND is_deleted = FALSE
+            """,
+            (str(message_id),)
+        )
+        deleted = cur.rowcount
+
+        if deleted > 0:
+            await refresh_rollup(cur, [message_id])
+
+    return deleted
+
+
+# ======================
+# CASE WRITE SPOOL
+# ======================
+# DB ปฏิเสธ (ล่ม / circuit open / error) → งานเขียนลง journal บนดิสก์ แล้ว replay ตามลำดับ
+case_spool = CaseSpool()
+
+
+def _decode_rows(rows):
+    # row จาก spool: date เป็น ISO string / list แทน tuple
+    return [
+        (datetime.fromisoformat(row[0]).date(), *row[1:])
+        if isinstance(row[0], str) else tuple(row)
+        for row in rows
+    ]
+
+
+async def apply_case_op(record: dict):
+    op = record["op"]
+
+    if op == "upsert":
+        batch = [
+            (message_id, _decode_rows(rows))
+            for message_id, rows in record["batch"]
+        ]
+        return await save_case_batch(batch)
+
+    if op == "replace":
+        return await _replace_message_cases(
+            record["message_id"],
+            _decode_rows(record["rows"])
+        )
+
+    if op == "delete":
+        return await _delete_message_cases(record["message_id"])
+
+    raise ValueError(f"unknown case op: {op}")
+
+
+def is_transient_db_error(error) -> bool:
+    return isinstance(error, (CircuitOpenError, *db_async.TRANSIENT_ERRORS))
+
+
+async def write_case_op(record: dict):
+    """
+    เขียนเคสลง DB / ไม่สำเร็จ → ลง spool แทน
+    คืนผลของ op (None = ถูก spool ไว้ replay ทีหลัง)
+    """
+    if case_spool.pending:
+        # ยังมีของค้าง / กำลังเขียนลง spool → ต่อท้ายไปก่อน กันลำดับสลับกับของเก่า
+        await case_spool.append([record])
+        return None
+
+    try:
+        return await apply_case_op(record)
     except Exception as e:
-        print("❌ DB error:", e)
-        
-async def save_case_async(
-    name: str,
-    channel: str,
-    case_type: str,
-    cases: int,
-    message_id: int,
-    message_date,
-    is_uphill: bool = False
-):
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(
-        None,
-        save_case_pg,
-        name,
-        channel,
-        case_type,
-        cases,
-        message_id,
-        message_date,
-        is_uphill
-    )
-
-def is_message_saved(message_id: int) -> bool:
+        print(f"❌ DB error ({record['op']}), spooled:", e)
+        await case_spool.append([record])
+        return None
+
+
+async def flush_case_batch(batch: list):
+    await write_case_op({"op": "upsert", "batch": batch})
+
+
+case_queue = CaseIngestQueue(flush_case_batch)
+
+
+async def replace_message_cases(message_id: int, rows: list):
+    """
+    ใช้ตอนแก้ข้อความ: soft-delete เคสเดิม + บันทึกใหม่ ใน transaction เดียว
+    คืนจำนวน row เดิมที่ถูก soft-delete (None = DB ไม่พร้อม ลง spool แล้ว)
+    """
+    return await write_case_op({
+        "op": "replace",
+        "message_id": message_id,
+        "rows": rows
+    })
+
+async def is_message_saved_async(message_id: int) -> bool:
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT 1 FROM cases WHERE message_id = %s LIMIT 1",
-                    (str(message_id),)
-                )
-                return cur.fetchone() is not None
+        row = await db_async.fetchrow(
+            "SELECT 1 FROM cases WHERE message_id = %s LIMIT 1",
+            (str(message_id),)
+        )
+        return row is not None
     except Exception as e:
         print("❌ DB check error:", e)
         return True  # กันพลาด ไม่ insert ซ้ำ
-        
-# ===== ASYNC WRAPPER (FIX 2) =====
-async def is_message_saved_async(message_id: int) -> bool:
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(
-        None,
-        is_message_saved,   # ← เรียกของเดิม
-        message_id
-    )      
-
-def get_last_online():
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT value FROM bot_meta WHERE key = 'last_online'"
-                )
-                row = cur.fetchone()
-                if not row:
-                    return None
 
-                dt = datetime.fromisoformat(row[0])
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=TH_TZ)
-
-                return dt
+async def get_last_online():
+    try:
+        return await meta_store.get("last_online")
     except Exception as e:
         print("❌ get_last_online error:", e)
         return None
 
 
-def set_last_online(dt: datetime):
+async def set_last_online(dt: datetime):
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO bot_meta (key, value)
-                    VALUES ('last_online', %s)
-                    ON CONFLICT (key)
-                    DO UPDATE SET value = EXCLUDED.value
-                """, (dt.isoformat(),))
+        await meta_store.set("last_online", dt)
     except Exception as e:
         print("❌ set_last_online error:", e)
  
-def get_last_daily_report():
+async def get_last_daily_report():
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT value FROM bot_meta WHERE key = 'last_daily_report'"
-                )
-                row = cur.fetchone()
-                return row[0] if row else None
+        return await meta_store.get("last_daily_report")
     except Exception as e:
         print("❌ get_last_daily_report error:", e)
         return None
 
 
-def set_last_daily_report(date_str: str):
+async def set_last_daily_report(date_str: str):
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO bot_meta (key, value)
-                    VALUES ('last_daily_report', %s)
-                    ON CONFLICT (key)
-                    DO UPDATE SET value = EXCLUDED.value
-                """, (date_str,))
+        await meta_store.set("last_daily_report", date_str)
     except Exception as e:
         print("❌ set_last_daily_report error:", e)
 
-def get_post_summary_by_range(start_date, end_date):
+async def get_post_summary_by_range(start_date, end_date):
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT
-                        COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'normal') AS normal_posts,
-                        COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'case10') AS point10_posts
-                    FROM cases
-                    WHERE date BETWEEN %s AND %s
-                      AND is_deleted = FALSE
-                """, (start_date, end_date))
-                row = cur.fetchone()
-                return row if row else (0, 0)
+        row = await db_async.fetchrow("""
+            SELECT
+                COALESCE(SUM(posts) FILTER (WHERE case_type = 'normal'), 0) AS normal_posts,
+                COALESCE(SUM(posts) FILTER (WHERE case_type = 'case10'), 0) AS point10_posts
+            FROM case_daily_posts
+            WHERE date BETWEEN %s AND %s
+        """, (start_date, end_date))
+        return row if row else (0, 0)
     except Exception as e:
         print("❌ get_post_summary_by_range DB error:", e)
         return (0, 0)
 
 
-def get_post_summary_by_name_and_date(name, date):
+# ค้นด้วยชื่อ → officer_id (ทุกชื่อเล่นที่เคยใช้ + norm_name ล่าสุด)
+# ใช้เป็น subquery: officer_id IN (...) / ต้องส่ง keyword 2 ครั้ง
+OFFICER_SEARCH_SQL = """
+    SELECT n.officer_id FROM officer_names n WHERE n.name ILIKE %s
+    UNION
+    SELECT o.id FROM officers o WHERE o.norm_name ILIKE %s
+"""
+
+
+async def get_post_summary_by_name_and_date(name, date):
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT
-                        COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'normal') AS normal_posts,
-                        COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'case10') AS point10_posts
-                    FROM cases
-                    WHERE date = %s
-                      AND name ILIKE %s
-                      AND is_deleted = FALSE
-                """, (date, f"%{name}%"))
-                row = cur.fetchone()
-                return row if row else (0, 0)
+        row = await db_async.fetchrow(f"""
+            SELECT
+                COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'normal') AS normal_posts,
+                COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'case10') AS point10_posts
+            FROM cases
+            WHERE date = %s
+              AND officer_id IN ({OFFICER_SEARCH_SQL})
+              AND is_deleted = FALSE
+        """, (date, f"%{name}%", f"%{name}%"))
+        return row if row else (0, 0)
     except Exception as e:
         print("❌ get_post_summary_by_name_and_date DB error:", e)
         return (0, 0)
 
 
-def count_posts_by_type(start_date, end_date=None):
+async def count_posts_by_type(start_date, end_date=None):
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                if end_date:
-                    cur.execute("""
-                        SELECT
-                            COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'normal') AS normal_posts,
-                            COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'case10') AS point10_posts,
-                            COUNT(DISTINCT message_id) AS total_posts
-                        FROM cases
-                        WHERE date BETWEEN %s AND %s
-                          AND is_deleted = FALSE
-                    """, (start_date, end_date))
-                else:
-                    cur.execute("""
-                        SELECT
-                            COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'normal') AS normal_posts,
-                            COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'case10') AS point10_posts,
-                            COUNT(DISTINCT message_id) AS total_posts
-                        FROM cases
-                        WHERE date = %s
-                          AND is_deleted = FALSE
-                    """, (start_date,))
-                row = cur.fetchone()
-                return row if row else (0, 0, 0)
+        if end_date:
+            row = await db_async.fetchrow("""
+                SELECT
+                    COALESCE(SUM(posts) FILTER (WHERE case_type = 'normal'), 0) AS normal_posts,
+                    COALESCE(SUM(posts) FILTER (WHERE case_type = 'case10'), 0) AS point10_posts,
+                    COALESCE(SUM(posts), 0) AS total_posts
+                FROM case_daily_posts
+                WHERE date BETWEEN %s AND %s
+            """, (start_date, end_date))
+        else:
+            row = await db_async.fetchrow("""
+                SELECT
+                    COALESCE(SUM(posts) FILTER (WHERE case_type = 'normal'), 0) AS normal_posts,
+                    COALESCE(SUM(posts) FILTER (WHERE case_type = 'case10'), 0) AS point10_posts,
+                    COALESCE(SUM(posts), 0) AS total_posts
+                FROM case_daily_posts
+                WHERE date = %s
+            """, (start_date,))
+        return row if row else (0, 0, 0)
     except Exception as e:
         print("❌ count_posts_by_type DB error:", e)
         return (0, 0, 0)
 
+audit_sink = AuditSink(db_async.transaction)
+
+# ======================
+# SHEET OUTBOX (งานเขียนชีท บันทึกใน DB ก่อน แล้ว drainer เขียนทีหลัง)
+# ======================
+sheet_outbox = SheetOutbox(db_async.transaction)
+
+
 def write_audit(
     action: str,
     actor: str = None,
@@ -357,80 +415,96 @@ def write_audit(
     message_id: str = None,
     detail: str = None
 ):
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO audit_logs
-                        (action, actor, target, channel, message_id, detail)
-                    VALUES
-                        (%s, %s, %s, %s, %s, %s)
-                """, (
-                    action,
-                    actor,
-                    target,
-                    channel,
-                    message_id,
-                    detail
-                ))
-    except Exception as e:
-        print("❌ audit log error:", e)
-# ===== ASYNC WRAPPER (FIX AUDIT) =====
-async def write_audit_async(**kwargs):
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(
-        None,
-        lambda: write_audit(**kwargs)
+    # เข้า buffer อย่างเดียว → audit_sink เขียนลง DB เป็น batch
+    audit_sink.log(action, actor, target, channel, message_id, detail)
+
+DAY_SNAPSHOT_SQL = """
+    WITH per_officer AS (
+        SELECT
+            r.officer_id,
+            COALESCE(o.display_name, r.name) AS name,
+            COALESCE(o.norm_name, r.norm_name) AS norm_name,
+            r.case_type,
+            SUM(r.posts) AS inc,
+            SUM(r.cases) AS total
+        FROM case_daily_rollup r
+        LEFT JOIN officers o ON o.id = r.officer_id
+        WHERE r.date = %s
+        GROUP BY 1, 2, 3, 4
+    ),
+    day_posts AS (
+        SELECT
+            COALESCE(SUM(posts) FILTER (WHERE case_type = 'normal'), 0) AS normal_posts,
+            COALESCE(SUM(posts) FILTER (WHERE case_type = 'case10'), 0) AS point10_posts
+        FROM case_daily_posts
+        WHERE date = %s
     )
+    SELECT p.normal_posts, p.point10_posts, s.officer_id, s.name, s.case_type, s.inc, s.total
+    FROM day_posts p
+    LEFT JOIN per_officer s ON TRUE
+    ORDER BY s.norm_name, s.name
+"""
+
+
+async def get_day_snapshot(day, top_n=5) -> dict:
+    """
+    สรุปของวันใน query เดียว (1 round trip / ตัวเลขทุกส่วนมาจาก snapshot เดียวกัน)
+    ใช้ร่วมกันระหว่าง dashboard / !today / daily report
+    officers = {officer_id: {...}} เรียงตาม norm_name แล้ว (ชื่อที่แสดงอยู่ใน "name")
+    top = [(name, total_cases)] มาก → น้อย
+    """
+    snapshot = {
+        "date": day,
+        "officers": {},
+        "normal_cases": 0,
+        "point10_cases": 0,
+        "normal_posts": 0,
+        "point10_posts": 0,
+        "top": [],
+    }
 
-def get_post_summary_by_date(date):
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT
-                        COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'normal') AS normal_posts,
-                        COUNT(DISTINCT message_id) FILTER (WHERE case_type = 'case10') AS point10_posts
-                    FROM cases
-                    WHERE date = %s
-                      AND is_deleted = FALSE
-                """, (date,))
-                row = cur.fetchone()
-                return row if row else (0, 0)
+        rows = await db_async.fetch(DAY_SNAPSHOT_SQL, (day, day))
     except Exception as e:
-        print("❌ get_post_summary_by_date DB error:", e)
-        return (0, 0)
+        print("❌ get_day_snapshot DB error:", e)
+        # กัน dashboard / report พังทั้งระบบ
+        return snapshot
 
+    officers = snapshot["officers"]
 
-def get_today_summary():
-    today = today_th()
+    for normal_posts, point10_posts, officer_id, name, ctype, inc, total in rows:
+        snapshot["normal_posts"] = normal_posts
+        snapshot["point10_posts"] = point10_posts
 
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT
-                        SUM(cases) FILTER (WHERE case_type = 'normal') AS normal_cases,
-                        SUM(cases) FILTER (WHERE case_type = 'case10') AS point10_cases
-                    FROM cases
-                    WHERE date = %s
-                      AND is_deleted = FALSE
-                """, (today,))
-                row = cur.fetchone()
-
-                if not row:
-                    return 0, 0, 0
-
-                normal = row[0] or 0
-                point10 = row[1] or 0
-                total = normal + point10
-
-                return normal, point10, total
+        if officer_id is None:
+            continue  # วันที่ยังไม่มีเคส (LEFT JOIN ว่าง)
 
-    except Exception as e:
-        print("❌ get_today_summary DB error:", e)
-        # กัน dashboard พังทั้งระบบ
-        return 0, 0, 0
+        d = officers.setdefault(officer_id, {
+            "name": name,
+            "normal_cases": 0, "normal_posts": 0,
+            "point10_cases": 0, "point10_posts": 0
+        })
+
+        if ctype == "normal":
+            d["normal_cases"] += total
+            d["normal_posts"] += inc
+            snapshot["normal_cases"] += total
+        else:
+            d["point10_cases"] += total
+            d["point10_posts"] += inc
+            snapshot["point10_cases"] += total
+
+    ranked = sorted(
+        officers.values(),
+        key=lambda d: d["normal_cases"] + d["point10_cases"],
+        reverse=True
+    )
+    snapshot["top"] = [
+        (d["name"], d["normal_cases"] + d["point10_cases"])
+        for d in ranked[:top_n]
+    ]
+
+    return snapshot
 
 
 async def random_react_dashboard(msg, count=5):
@@ -486,58 +560,30 @@ def parse_date_smart(date_str: str):
 
     return target
 
-def get_last_body_sync():
+async def get_last_body_sync():
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT value FROM bot_meta
-                    WHERE key = 'body_last_synced'
-                """)
-                row = cur.fetchone()
-                return row[0] if row else None
+        return await meta_store.get("body_last_synced")
     except Exception as e:
         print("❌ get_last_body_sync error:", e)
         return None
 
 
-def set_last_body_sync(date_str: str):
+async def set_last_body_sync(date_str: str):
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO bot_meta (key, value)
-                    VALUES ('body_last_synced', %s)
-                    ON CONFLICT (key)
-                    DO UPDATE SET value = EXCLUDED.value
-                """, (date_str,))
+        await meta_store.set("body_last_synced", date_str)
     except Exception as e:
         print("❌ set_last_body_sync error:", e)
 
-def get_body_dashboard_message_id():
+async def get_body_dashboard_message_id():
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT value FROM bot_meta
-                    WHERE key = 'body_dashboard_message_id'
-                """)
-                row = cur.fetchone()
-                return int(row[0]) if row else None
+        return await meta_store.get("body_dashboard_message_id")
     except Exception as e:
         print("❌ get_body_dashboard_message_id error:", e)
         return None
 
 
-def set_body_dashboard_message_id(msg_id: int):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO bot_meta (key, value)
-                VALUES ('body_dashboard_message_id', %s)
-                ON CONFLICT (key)
-                DO UPDATE SET value = EXCLUDED.value
-            """, (str(msg_id),))
+async def set_body_dashboard_message_id(msg_id: int):
+    await meta_store.set("body_dashboard_message_id", msg_id)
 
 # ======================
 # UTILS
@@ -545,32 +591,13 @@ def set_body_dashboard_message_id(msg_id: int):
 def is_uphill_case(message_content: str) -> bool:
     return "(ขึ้นเขา)" in message_content
 
-def normalize_name(name: str):
-    if not name:
-        return ""
-
-    name = name.lower()
-
-    # ลบ +เลขหน้า
-    name = re.sub(r"\+?\d+", "", name)
-
-    # ลบ tag [xxx]
-    name = re.sub(r"\[.*?\]", "", name)
-
-    # เปลี่ยน whitespace ทุกชนิด → space เดียว
-    name = re.sub(r"\s+", " ", name)
-
-    return name.strip()
-
-
-
 def get_week_range_sun_sat():
     today = today_th()
     start = today - timedelta(days=(today.weekday() + 1) % 7)
     end = start + timedelta(days=6)
     return start, end
 
-def process_case_message(message):
+async def process_case_message(message):
     # เลือกประเภทเคส
     if message.channel.id == CASE10_CHANNEL_ID:
         case_type = "case10"
@@ -581,22 +608,10 @@ def process_case_message(message):
     else:
         return
 
-    message_date = message.created_at.astimezone(TH_TZ).date()
-    uphill = is_uphill_case(message.content)
-    unique_members = set(message.mentions)
-
-    for member in unique_members:
-        asyncio.create_task(
-            save_case_async(
-                member.display_name,
-                message.channel.name,
-                case_type,
-                case_value,
-                message.id,
-                message_date,
-                uphill
-            )
-        )
+    await case_queue.put(
+        message.id,
+        build_case_rows(message, case_type, case_value)
+    )
 
 def get_body_work_window(work_date):
     """
@@ -613,36 +628,45 @@ def get_body_work_window(work_date):
 
     return start, end
 
-def save_body_case_daily_split(result):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO body_case_daily (
-                    work_date,
-                    start_time,
-                    end_time,
-                    chub_posts,
-                    wrap_posts,
-                    total_posts,
-                    synced_at
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
-                ON CONFLICT (work_date)
-                DO UPDATE SET
-                    start_time = EXCLUDED.start_time,
-                    end_time = EXCLUDED.end_time,
-                    chub_posts = EXCLUDED.chub_posts,
-                    wrap_posts = EXCLUDED.wrap_posts,
-                    total_posts = EXCLUDED.total_posts,
-                    synced_at = NOW();
-            """, (
-                result["date"],
-                result["start"],
-                result["end"],
-                result["chub"],
-                result["wrap"],
-                result["total"]
-            ))
+async def save_body_case_daily_split(result):
+    # ยอดของวัน + งานเขียนชีท อยู่ใน transaction เดียวกัน (commit แล้ว = ชีทจะถูกเขียนแน่นอน)
+    async with db_async.transaction() as cur:
+        await cur.execute("""
+            INSERT INTO body_case_daily (
+                work_date,
+                start_time,
+                end_time,
+                chub_posts,
+                wrap_posts,
+                total_posts,
+                synced_at
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (work_date)
+            DO UPDATE SET
+                start_time = EXCLUDED.start_time,
+                end_time = EXCLUDED.end_time,
+                chub_posts = EXCLUDED.chub_posts,
+                wrap_posts = EXCLUDED.wrap_posts,
+                total_posts = EXCLUDED.total_posts,
+                synced_at = NOW();
+        """, (
+            result["date"],
+            result["start"],
+            result["end"],
+            result["chub"],
+            result["wrap"],
+            result["total"]
+        ))
+
+        await enqueue_sheet_write(
+            cur,
+            "body_total",
+            result["date"].isoformat(),
+            {"date": result["date"].isoformat(), "total": result["total"]}
+        )
+
+    sheet_outbox.poke()
 
 def now_th():
     return datetime.now(TH_TZ)
@@ -665,25 +689,14 @@ def build_case_footer(
         f"🚨 คดีจุด 10: {point10_cases} เคส ({point10_posts} คดี)\n"
         f"🔒 ระบบป้องกันการนับซ้ำอัตโนมัติ"
     )
-def build_today_embed():
-    today = today_th()
+async def build_today_embed(snapshot=None):
+    if snapshot is None:
+        snapshot = await get_day_snapshot(today_th())
 
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT name, case_type, COUNT(*) AS inc, SUM(cases) AS total
-                    FROM cases
-                    WHERE date = %s
-                    AND is_deleted = FALSE
-                    GROUP BY name, case_type
-                """, (today,))
-                rows = cur.fetchall()
-    except Exception as e:
-        print("❌ build_today_embed DB error:", e)
-        rows = []
+    today = snapshot["date"]
+    summary = snapshot["officers"]
 
-    if not rows:
+    if not summary:
         embed = Embed(
             description="📭 วันนี้ยังไม่มีคดี",
             color=0x2f3136
@@ -697,27 +710,8 @@ def build_today_embed():
         color=0x2ecc71
     )
 
-    summary = {}
-    total_normal_posts = 0
-    total_point10_posts = 0
-
-    for name, ctype, inc, total in rows:
-        summary.setdefault(name, {
-            "normal_cases": 0, "normal_posts": 0,
-            "point10_cases": 0, "point10_posts": 0
-        })
-
-        if ctype == "normal":
-            summary[name]["normal_cases"] += total
-            summary[name]["normal_posts"] += inc
-            total_normal_posts += inc
-        else:
-            summary[name]["point10_cases"] += total
-            summary[name]["point10_posts"] += inc
-            total_point10_posts += inc
-
-    for name in sorted(summary.keys(), key=normalize_name):
-        d = summary[name]
+    # เรียงตาม norm_name มาจาก SQL แล้ว
+    for d in summary.values():
         value = ""
         if d["normal_cases"]:
             value += f"📂 คดีปกติ: {d['normal_cases']} เคส ({d['normal_posts']} คดี)\n"
@@ -725,22 +719,15 @@ def build_today_embed():
             value += f"🚨 คดีจุด 10: {d['point10_cases']} เคส ({d['point10_posts']} คดี)\n"
 
         value += f"📊 **รวมทั้งหมด: {d['normal_cases'] + d['point10_cases']} เคส**"
-        embed.add_field(name=f"👤 {name}", value=value, inline=False)
-
-    # 🔒 กัน DB ล่มตอน footer อีกชั้น
-    try:
-        normal_posts, point10_posts = get_post_summary_by_date(today)
-    except Exception as e:
-        print("❌ footer summary error:", e)
-        normal_posts, point10_posts = 0, 0
+        embed.add_field(name=f"👤 {d['name']}", value=value, inline=False)
 
     embed.set_footer(
         text=(
             build_case_footer(
-                normal_cases=sum(v["normal_cases"] for v in summary.values()),
-                normal_posts=normal_posts,
-                point10_cases=sum(v["point10_cases"] for v in summary.values()),
-                point10_posts=point10_posts
+                normal_cases=snapshot["normal_cases"],
+                normal_posts=snapshot["normal_posts"],
+                point10_cases=snapshot["point10_cases"],
+                point10_posts=snapshot["point10_posts"]
             )
             + "\n"
             + SYSTEM_FOOTER
@@ -749,56 +736,32 @@ def build_today_embed():
 
     return embed
 
-def get_top_officers_today(limit=5):
-    today = today_th()
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT name, SUM(cases) AS total_cases
-                    FROM cases
-                    WHERE date = %s
-                      AND is_deleted = FALSE
-                    GROUP BY name
-                    ORDER BY total_cases DESC
-                    LIMIT %s
-                """, (today, limit))
-                return cur.fetchall()
-    except Exception as e:
-        print("❌ get_top_officers_today DB error:", e)
-        return []
-
-def build_top_officers_text(limit=5):
-    rows = get_top_officers_today(limit)
-
-    if not rows:
+def build_top_officers_text(top: list):
+    if not top:
         return "ยังไม่มีข้อมูล"
 
     medals = ["🥇", "🥈", "🥉", "🏅", "🏅"]
     lines = []
 
-    for i, (name, total) in enumerate(rows):
+    for i, (name, total) in enumerate(top):
         medal = medals[i] if i < len(medals) else "👮"
         lines.append(f"{medal} {name} — {total} เคส")
 
     return "\n".join(lines)
  
  
-def build_dashboard_embed():
-    # 🔒 ชั้นที่ 1: summary หลัก (กัน DB ล่มแล้วในฟังก์ชัน)
-    normal, point10, total = get_today_summary()
+async def build_dashboard_embed(snapshot=None):
+    # 🔒 snapshot กัน DB ล่มแล้วในฟังก์ชัน (ได้ค่า 0 แทน)
+    if snapshot is None:
+        snapshot = await get_day_snapshot(today_th())
 
-    # 🔒 ชั้นที่ 2: footer (กัน DB ล่มแยกอีกชั้น)
-    try:
-        normal_posts, point10_posts = get_post_summary_by_date(today_th())
-    except Exception as e:
-        print("❌ dashboard footer DB error:", e)
-        normal_posts, point10_posts = 0, 0
+    normal = snapshot["normal_cases"]
+    point10 = snapshot["point10_cases"]
 
     embed = Embed(
         title="📊 Police Case Management Dashboard",
         description=(
-            f"📅 วันที่: {today_th().strftime('%d/%m/%Y')}\n"
+            f"📅 วันที่: {snapshot['date'].strftime('%d/%m/%Y')}\n"
             f"⏱️ อัพเดทล่าสุด: {now_th().strftime('%H:%M')}"
         ),
         color=0x3498db
@@ -807,16 +770,16 @@ def build_dashboard_embed():
     embed.add_field(
         name="📈 Summary Today",
         value=(
-            f"📂 คดีปกติ: {normal} เคส ({normal_posts} คดี)\n"
-            f"🚨 คดีจุด 10: {point10} เคส ({point10_posts} คดี)\n"
-            f"📊 รวมทั้งหมด: **{total} เคส**"
+            f"📂 คดีปกติ: {normal} เคส ({snapshot['normal_posts']} คดี)\n"
+            f"🚨 คดีจุด 10: {point10} เคส ({snapshot['point10_posts']} คดี)\n"
+            f"📊 รวมทั้งหมด: **{normal + point10} เคส**"
         ),
         inline=False
     )
 
     embed.add_field(
         name="👮 Top Officers (Today)",
-        value=build_top_officers_text(),
+        value=build_top_officers_text(snapshot["top"]),
         inline=False
     )
 
@@ -826,29 +789,15 @@ def build_dashboard_embed():
 
     return embed
 
-def get_dashboard_message_id():
+async def get_dashboard_message_id():
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT value FROM bot_meta
-                    WHERE key = 'dashboard_message_id'
-                """)
-                row = cur.fetchone()
-                return int(row[0]) if row else None
+        return await meta_store.get("dashboard_message_id")
     except Exception as e:
         print("❌ get_dashboard_message_id error:", e)
         return None
 
-def set_dashboard_message_id(msg_id: int):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO bot_meta (key, value)
-                VALUES ('dashboard_message_id', %s)
-                ON CONFLICT (key)
-                DO UPDATE SET value = EXCLUDED.value
-            """, (str(msg_id),))
+async def set_dashboard_message_id(msg_id: int):
+    await meta_store.set("dashboard_message_id", msg_id)
 
 async def dashboard_updater():
     await bot.wait_until_ready()
@@ -860,13 +809,13 @@ async def dashboard_updater():
         await asyncio.sleep(wait_sec)
 
         try:
-            embed = build_dashboard_embed()
+            embed = await build_dashboard_embed()
         except Exception as e:
             print("❌ build_dashboard_embed crash:", e)
             continue  # 🔥 กัน loop ตาย
 
         try:
-            msg_id = get_dashboard_message_id()
+            msg_id = await get_dashboard_message_id()
         except Exception as e:
             print("❌ get_dashboard_message_id DB error:", e)
             continue
@@ -880,32 +829,30 @@ async def dashboard_updater():
                 msg = await channel.send(embed=embed)
                 await msg.pin()
                 await random_react_dashboard(msg, count=5)
-                set_dashboard_message_id(msg.id)
+                await set_dashboard_message_id(msg.id)
 
         except Exception as e:
             print("❌ Dashboard update error:", e)
 
-def get_top_officers_week(limit=5):
+async def get_top_officers_week(limit=5):
     start, end = get_week_range_sun_sat()
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    name,
-                    SUM(cases) AS total_cases,
-                    COUNT(DISTINCT message_id) AS total_posts
-                FROM cases
-                WHERE date BETWEEN %s AND %s
-                  AND is_deleted = FALSE
-                GROUP BY name
-                ORDER BY total_cases DESC
-                LIMIT %s
-            """, (start, end, limit))
-            return cur.fetchall(), start, end
-
-def build_weekly_ranking_embed():
-    rows, start, end = get_top_officers_week()
+    rows = await db_async.fetch("""
+        SELECT
+            COALESCE(o.display_name, r.name) AS name,
+            SUM(r.cases) AS total_cases,
+            SUM(r.posts) AS total_posts
+        FROM case_daily_rollup r
+        LEFT JOIN officers o ON o.id = r.officer_id
+        WHERE r.date BETWEEN %s AND %s
+        GROUP BY r.officer_id, COALESCE(o.display_name, r.name)
+        ORDER BY total_cases DESC
+        LIMIT %s
+    """, (start, end, limit))
+    return rows, start, end
+
+async def build_weekly_ranking_embed():
+    rows, start, end = await get_top_officers_week()
 
     embed = Embed(
         title="🥇 Officer Ranking — This Week",
@@ -946,29 +893,15 @@ def build_weekly_ranking_embed():
     return embed
 
 
-def get_weekly_ranking_message_id():
+async def get_weekly_ranking_message_id():
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT value FROM bot_meta
-                    WHERE key = 'weekly_ranking_message_id'
-                """)
-                row = cur.fetchone()
-                return int(row[0]) if row else None
+        return await meta_store.get("weekly_ranking_message_id")
     except Exception as e:
         print("❌ get_weekly_ranking_message_id error:", e)
         return None
 
-def set_weekly_ranking_message_id(msg_id: int):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO bot_meta (key, value)
-                VALUES ('weekly_ranking_message_id', %s)
-                ON CONFLICT (key)
-                DO UPDATE SET value = EXCLUDED.value
-            """, (str(msg_id),))
+async def set_weekly_ranking_message_id(msg_id: int):
+    await meta_store.set("weekly_ranking_message_id", msg_id)
 
 def seconds_until_saturday_2359():
     now = now_th()
@@ -996,14 +929,14 @@ async def weekly_ranking_updater():
         await asyncio.sleep(wait_sec)
 
         try:
-            embed = build_weekly_ranking_embed()
+            embed = await build_weekly_ranking_embed()
         except Exception as e:
             print("❌ weekly embed error:", e)
             await asyncio.sleep(60)
             continue
 
         try:
-            msg_id = get_weekly_ranking_message_id()
+            msg_id = await get_weekly_ranking_message_id()
         except Exception as e:
             print("❌ weekly msg_id DB error:", e)
             await asyncio.sleep(60)
@@ -1018,7 +951,7 @@ async def weekly_ranking_updater():
                 msg = await channel.send(embed=embed)
                 await msg.pin()
                 await random_react_dashboard(msg, count=10)
-                set_weekly_ranking_message_id(msg.id)
+                await set_weekly_ranking_message_id(msg.id)
         except Exception as e:
             print("❌ Weekly ranking update error:", e)
 
@@ -1034,7 +967,7 @@ def build_body_dashboard_embed(result, work_date):
             f"🧪 ชุบ: {result['wrap']} เคส\n"
             f"🧳 ช่วยอุ้ม/ห่อ: {result['chub']} เคส\n"
             f"📦 **รวมทั้งหมด: {result['total']} เคส**\n\n"
-            f"🧾 เขียนลง Google Sheet เรียบร้อยแล้ว"
+            f"📤 บันทึกแล้ว รอเขียนลง Google Sheet (คิว) — ถ้าเขียนไม่สำเร็จจะแจ้งในห้องนี้"
         ),
         color=0xe67e22
     )
@@ -1052,7 +985,52 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+class CaseBot(commands.Bot):
+    async def setup_hook(self):
+        try:
+            await run_migrations()
+        except Exception as e:
+            # schema ไม่ครบ (column / table ใหม่) → ไม่เปิดบอท กันเขียนข้อมูลผิดรูป
+            print("❌ schema migration failed, abort startup:", e)
+            raise RuntimeError("schema migration failed") from e
+
+        case_queue.start()
+        audit_sink.start()
+        alert_dispatcher.start()
+        case_spool.start_replayer(
+            apply_case_op,
+            is_transient_db_error,
+            ready=db_circuit.available
+        )
+        sheet_outbox.start(
+            SHEET_OUTBOX_HANDLERS,
+            on_result=on_sheet_outbox_result,
+            ready=db_circuit.available
+        )
+
+        try:
+            await meta_store.load()
+        except Exception as e:
+            # โหลดไม่ได้ตอนบูต → จะลองใหม่ตอนอ่านครั้งแรก
+            print("⚠️ bot_meta preload failed:", e)
+
+        meta_store.start_listener()
+
+    async def close(self):
+        await super().close()
+        # flush เคส / audit ที่ค้างก่อนปิด pool
+        await case_queue.stop()
+        await case_spool.stop()
+        await audit_sink.stop()
+        await audit_export_jobs.shutdown()
+        await sheet_outbox.stop()
+        await alert_dispatcher.stop()
+        await meta_store.stop_listener()
+        # ปิด async pool ตอน shutdown (sync pool ปิดหลัง bot.run)
+        await db_async.close_pool()
+
+
+bot = CaseBot(command_prefix="!", intents=intents)
 
 @bot.check
 async def restrict_commands_to_channel(ctx):
@@ -1093,16 +1071,17 @@ async def daily_today_report():
         await asyncio.sleep(sleep_seconds)
 
         today_str = today_th().isoformat()
-        last_sent = get_last_daily_report()
+        last_sent = await get_last_daily_report()
 
         if last_sent == today_str:
             print("ℹ️ Daily report already sent today, skip")
         else:
             channel = bot.get_channel(DAILY_REPORT_CHANNEL_ID)
             if channel:
-                embed = build_today_embed()
+                snapshot = await get_day_snapshot(today_th())
+                embed = await build_today_embed(snapshot)
                 await channel.send(embed=embed)
-                set_last_daily_report(today_str)
+                await set_last_daily_report(today_str)
                 print("✅ Daily report sent")
                 
         await asyncio.sleep(60)
@@ -1129,38 +1108,9 @@ async def daily_sheet_auto_sync():
         target_date = today_th()
 
         try:
-            written, skipped = await asyncio.to_thread(
-                run_daily_case_sync,
-                target_date
-            )
-
-            print(
-                f"✅ Auto Sheet Sync {target_date} | "
-                f"written={written} skipped={len(skipped)}"
-            )
-
-            # 🔔 แจ้งผลใน Discord
-            if channel:
-                embed = Embed(
-                    title="📊 Auto Sheet Sync Completed",
-                    description=f"📅 วันที่: {target_date.strftime('%d/%m/%Y')}",
-                    color=0x2ecc71
-                )
-                embed.add_field(
-                    name="✅ เขียนสำเร็จ",
-                    value=f"{written} คน",
-                    inline=False
-                )
-
-                if skipped:
-                    embed.add_field(
-                        name="⚠️ ไม่พบชื่อในชีท",
-                        value="\n".join(skipped),
-                        inline=False
-                    )
-
-                embed.set_footer(text="⏰ Auto Sync เวลา 23:59")
-                await channel.send(embed=embed)
+            # ผลการเขียน → on_sheet_outbox_result แจ้งในห้อง
+            await enqueue_case_sync(target_date, target_date, notify=True)
+            print(f"📤 Auto Sheet Sync {target_date} queued")
 
         except Exception as e:
             print("❌ Auto Sheet Sync error:", e)
@@ -1186,7 +1136,7 @@ async def body_case_auto_sync():
         work_date = today_th() - timedelta(days=1)
 
         # 🔒 LOCK กันยิงซ้ำ
-        last_synced = get_last_body_sync()
+        last_synced = await get_last_body_sync()
         if last_synced == work_date.isoformat():
             print("ℹ️ Body case already synced, skip")
             await asyncio.sleep(60)
@@ -1195,17 +1145,11 @@ async def body_case_auto_sync():
         # 🔢 นับเคส
         result = await count_body_cases_split(work_date)
 
-        # 💾 บันทึก DB
-        save_body_case_daily_split(result)
-
-        # 📊 เขียน Google Sheet (Body Case)
-        write_body_case_total(
-            work_date,
-            result["total"]
-        )
+        # 💾 บันทึก DB + 📊 คิวเขียน Google Sheet (Body Case) ใน transaction เดียว
+        await save_body_case_daily_split(result)
 
         # 🔒 set lock
-        set_last_body_sync(work_date.isoformat())
+        await set_last_body_sync(work_date.isoformat())
 
         # ======================
         # 🧾 BUILD DASHBOARD EMBED
@@ -1219,7 +1163,7 @@ async def body_case_auto_sync():
         # ======================
         # 📌 DASHBOARD MESSAGE (send ครั้งแรก / edit ครั้งถัดไป)
         # ======================
-        msg_id = get_body_dashboard_message_id()
+        msg_id = await get_body_dashboard_message_id()
 
         try:
             if msg_id:
@@ -1231,7 +1175,7 @@ async def body_case_auto_sync():
                 # 🆕 ครั้งแรก
                 msg = await channel.send(embed=embed)
                 await msg.pin()
-                set_body_dashboard_message_id(msg.id)
+                await set_body_dashboard_message_id(msg.id)
                 print("🆕 Body dashboard created")
 
         except Exception as e:
@@ -1267,81 +1211,72 @@ async def db_health_check():
     print("🩺 DB Health Check started")
 
     fail_count = 0
-    last_email_time = 0
     CHECK_INTERVAL = 3600      # เช็คทุก 1 ชั่วโมง
     ALERT_INTERVAL = 3600      # ส่งเมลซ้ำได้ทุก 1 ชม. (กัน spam)
 
     while not bot.is_closed():
         try:
-            with get_conn() as conn:
-                with conn.cursor() as cur:
-                    cur.execute("SELECT 1")
+            # probe → ข้าม circuit breaker / สำเร็จแล้วปิดวงจรให้เลย
+            await db_async.fetchval("SELECT 1", probe=True)
 
             if fail_count > 0:
                 print("🟢 DB RECOVERED")
 
-            print("🟢 DB Health: OK")
+            stats = pool_stats()
+            circuit = db_circuit.stats()
+            print(
+                f"🟢 DB Health: OK | "
+                f"pool in_use={stats['in_use']} idle={stats['idle']} "
+                f"avg_wait={stats['avg_wait_ms']:.1f}ms | "
+                f"circuit={circuit['state']} trips={circuit['trips']} "
+                f"rejected={circuit['rejected']}"
+            )
             fail_count = 0
-            last_email_time = 0  # รีเซ็ต cooldown เมล
+            alert_dispatcher.reset("db_down")  # รีเซ็ต cooldown เมล
 
         except Exception as e:
             fail_count += 1
-            print(f"🚨 DB Health Check FAILED ({fail_count}):", e)
-
-            now_ts = time.time()
+            circuit = db_circuit.stats()
+            print(
+                f"🚨 DB Health Check FAILED ({fail_count}) | "
+                f"circuit={circuit['state']}:",
+                e
+            )
 
-            # ล่ม 2 รอบติด (≈ 2 ชม.) ค่อยแจ้งเมล
+            # ล่ม 2 รอบติด (≈ 2 ชม.) ค่อยแจ้งเมล / key เดิมซ้ำได้ทุก ALERT_INTERVAL (กัน spam)
             if fail_count >= 2:
-                if last_email_time == 0 or (now_ts - last_email_time) >= ALERT_INTERVAL:
-                    send_email_alert(
-                        subject="🚨 Railway DB DOWN - Police Bot",
-                        body=(
-                            "Database connection failed.\n\n"
-                            "Railway PostgreSQL may be frozen or unreachable.\n"
-                            "Action: Restart DB plugin in Railway.\n\n"
-                            f"Fail count: {fail_count}\n"
-                            f"Time: {now_th().strftime('%d/%m/%Y %H:%M:%S')}\n"
-                            "Bot Status: ONLINE\n"
-                            "DB Status: UNREACHABLE"
-                        )
-                    )
-                    last_email_time = now_ts
-                    print("📧 Resend alert sent (anti-spam)")
+                queued = alert_dispatcher.notify(
+                    "db_down",
+                    subject="🚨 Railway DB DOWN - Police Bot",
+                    body=(
+                        "Database connection failed.\n\n"
+                        "Railway PostgreSQL may be frozen or unreachable.\n"
+                        "Action: Restart DB plugin in Railway.\n\n"
+                        f"Fail count: {fail_count}\n"
+                        f"Circuit: {circuit['state']} "
+                        f"(trips={circuit['trips']}, rejected={circuit['rejected']})\n"
+                        f"Time: {now_th().strftime('%d/%m/%Y %H:%M:%S')}\n"
+                        "Bot Status: ONLINE\n"
+                        "DB Status: UNREACHABLE"
+                    ),
+                    cooldown=ALERT_INTERVAL
+                )
+                if queued:
+                    print("📧 DB down alert queued (anti-spam)")
 
         await asyncio.sleep(CHECK_INTERVAL)
 
-def get_last_checked_time():
+async def get_last_checked_time():
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT value FROM bot_meta
-                    WHERE key = 'last_checked_message_time'
-                """)
-                row = cur.fetchone()
-                if not row:
-                    return None
-
-                dt = datetime.fromisoformat(row[0])
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=TH_TZ)
-
-                return dt
+        return await meta_store.get("last_checked_message_time")
     except Exception as e:
         print("❌ get_last_checked_time error:", e)
         return None
 
 
-def set_last_checked_time(dt: datetime):
+async def set_last_checked_time(dt: datetime):
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO bot_meta (key, value)
-                    VALUES ('last_checked_message_time', %s)
-                    ON CONFLICT (key)
-                    DO UPDATE SET value = EXCLUDED.value
-                """, (dt.isoformat(),))
+        await meta_store.set("last_checked_message_time", dt)
     except Exception as e:
         print("❌ set_last_checked_time error:", e)
 
@@ -1349,7 +1284,7 @@ def set_last_checked_time(dt: datetime):
 async def backfill_recent_cases(limit_per_channel=50):
     print("🔄 Backfill started")
 
-    last_online = get_last_online()
+    last_online = await get_last_online()
     now = now_th()
 
     checked = 0
@@ -1376,7 +1311,7 @@ async def backfill_recent_cases(limit_per_channel=50):
             if await is_message_saved_async(msg.id):
                 continue
 
-            process_case_message(msg)
+            await process_case_message(msg)
             recovered += 1
 
             print(
@@ -1386,10 +1321,10 @@ async def backfill_recent_cases(limit_per_channel=50):
             )
 
     # ✅ update เวลา หลัง backfill เสร็จ
-    set_last_online(now_th())
+    await set_last_online(now_th())
 
     print("✅ Backfill finished")
-    await write_audit_async(
+    write_audit(
         action="BACKFILL",
         detail=(
             f"checked={checked} "
@@ -1401,7 +1336,7 @@ async def backfill_recent_cases(limit_per_channel=50):
 async def recovery_backfill(limit_per_channel=200):
     print("🔄 Recovery backfill started")
 
-    last_time = get_last_checked_time()
+    last_time = await get_last_checked_time()
     now = now_th()
 
     # ถ้าไม่เคยเชคมาก่อน → ย้อนหลัง 1 วัน (กันพลาด deploy แรก)
@@ -1425,7 +1360,7 @@ async def recovery_backfill(limit_per_channel=200):
             if await is_message_saved_async(msg.id):
                 continue
 
-            process_case_message(msg)
+            await process_case_message(msg)
 
             print(
                 f"🧩 Recovered | "
@@ -1434,7 +1369,7 @@ async def recovery_backfill(limit_per_channel=200):
             )
 
     # อัปเดต checkpoint หลังเชคเสร็จ
-    set_last_checked_time(now)
+    await set_last_checked_time(now)
     print("✅ Recovery backfill finished")
 
 @bot.event
@@ -1464,9 +1399,6 @@ async def on_message(message):
     else:
         return
 
-    message_date = message.created_at.astimezone(TH_TZ).date()
-    uphill = is_uphill_case(message.content)
-
     mentions = message.mentions
     unique_members = set(mentions)
 
@@ -1477,18 +1409,10 @@ async def on_message(message):
             f"{len(mentions)} → {len(unique_members)}"
         )
 
-    for member in unique_members:
-        asyncio.create_task(
-            save_case_async(
-                member.display_name,
-                message.channel.name,
-                case_type,
-                case_value,
-                message.id,
-                message_date,
-                uphill
-            )
-        )
+    await case_queue.put(
+        message.id,
+        build_case_rows(message, case_type, case_value)
+    )
 
 
 @bot.event
@@ -1517,22 +1441,17 @@ async def on_message_delete(message):
         delete_type = "❓ unknown"
         deleted_by = "unknown"
 
+    # โพสอาจยังค้างในคิว → รอ flush ก่อนค่อย soft-delete
+    await case_queue.join()
+
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    UPDATE cases
-                    SET is_deleted = TRUE
-                    WHERE message_id = %s
-                      AND is_deleted = FALSE
-                    """,
-                    (str(message.id),)
-                )
-                deleted = cur.rowcount
+        deleted = await write_case_op({"op": "delete", "message_id": message.id})
+
+        if deleted is None:
+            print(f"📼 Delete spooled (DB unavailable) | msg={message.id}")
 
         # log เฉพาะตอนลบเคสจริง
-        if deleted > 0:
+        elif deleted > 0:
             print(
                 f"{delete_type} | "
                 f"msg={message.id} | "
@@ -1566,57 +1485,29 @@ async def on_message_edit(before, after):
 
     print(f"✏️ Message edited | msg={after.id}")
 
-    # 1️⃣ soft-delete เคสเดิมทั้งหมดของ message นี้
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    UPDATE cases
-                    SET is_deleted = TRUE
-                    WHERE message_id = %s
-                      AND is_deleted = FALSE
-                    """,
-                    (str(after.id),)
-                )
-                deleted = cur.rowcount
-        print(f"🗑️ Soft-deleted {deleted} old cases | msg={after.id}")
-    except Exception as e:
-        print("❌ DB delete error (edit):", e)
-        return
-
-    # 2️⃣ ถ้าแก้แล้วไม่มี mention → ถือว่าตั้งใจลบเคส
-    if not after.mentions:
-        print(f"ℹ️ Edit removed mentions | msg={after.id}")
-        return
-
-    # 3️⃣ นับใหม่จากข้อความล่าสุด
     if after.channel.id == CASE10_CHANNEL_ID:
         case_type = "case10"
         case_value = 2
-    elif after.channel.id in NORMAL_CHANNEL_IDS:
+    else:
         case_type = "normal"
         case_value = 1
-    else:
-        return
 
-    message_date = after.created_at.astimezone(TH_TZ).date()
-    uphill = is_uphill_case(after.content)
-    unique_members = set(after.mentions)
-
-    for member in unique_members:
-        asyncio.create_task(
-            save_case_async(
-                member.display_name,
-                after.channel.name,
-                case_type,
-                case_value,
-                after.id,
-                message_date,
-                uphill
-            )
-        )
+    # ถ้าแก้แล้วไม่มี mention → ถือว่าตั้งใจลบเคส (soft-delete อย่างเดียว)
+    rows = build_case_rows(after, case_type, case_value) if after.mentions else []
 
+    # โพสต้นฉบับอาจยังค้างในคิว → รอ flush ก่อน กันเขียนทับผลแก้ไข
+    await case_queue.join()
+
+    # 1️⃣ soft-delete เคสเดิม + 2️⃣ นับใหม่จากข้อความล่าสุด (transaction เดียว)
+    deleted = await replace_message_cases(after.id, rows)
+    if deleted is None:
+        print(f"📼 Edit spooled (DB unavailable) | msg={after.id}")
+    else:
+        print(f"🗑️ Soft-deleted {deleted} old cases | msg={after.id}")
+
+    if not rows:
+        print(f"ℹ️ Edit removed mentions | msg={after.id}")
+        return
 
     print(f"✅ Recounted cases | msg={after.id}")
 
@@ -1625,7 +1516,7 @@ async def on_message_edit(before, after):
         actor=after.author.display_name,
         channel=after.channel.name,
         message_id=str(after.id),
-        detail=f"mentions={len(unique_members)}"
+        detail=f"mentions={len(set(after.mentions))}"
     )
 
 # ======================
@@ -1634,7 +1525,7 @@ async def on_message_edit(before, after):
 
 @bot.command()
 async def today(ctx):
-    embed = build_today_embed()
+    embed = await build_today_embed()
     await ctx.send(embed=embed)
 
 @bot.command()
@@ -1642,17 +1533,15 @@ async def me(ctx):
     today = today_th()
     name = ctx.author.display_name
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT case_type, COUNT(*) AS inc, SUM(cases) AS total
-                FROM cases
-                WHERE date = %s
-                    AND name = %s
-                    AND is_deleted = FALSE
-                GROUP BY case_type
-            """, (today, name))
-            rows = cur.fetchall()
+    # ผูกกับ discord id → เปลี่ยนชื่อระหว่างวันก็ยังรวมเป็นคนเดียว
+    rows = await db_async.fetch("""
+        SELECT r.case_type, SUM(r.posts) AS inc, SUM(r.cases) AS total
+        FROM case_daily_rollup r
+        LEFT JOIN officers o ON o.id = r.officer_id
+        WHERE r.date = %s
+            AND o.discord_id = %s
+        GROUP BY r.case_type
+    """, (today, ctx.author.id))
 
     if not rows:
         embed = Embed(
@@ -1706,16 +1595,23 @@ async def date(ctx, date_str: str):
         await ctx.send("❌ ใช้ `!date DD/MM` หรือ `!date DD/MM/YYYY`")
         return
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT name, case_type, COUNT(*) AS inc, SUM(cases) AS total
-                FROM cases
-                WHERE date = %s
-                AND is_deleted = FALSE
-                GROUP BY name, case_type
-            """, (target,))
-            rows = cur.fetchall()
+    rows = await db_async.fetch("""
+        SELECT
+            r.officer_id,
+            COALESCE(o.display_name, r.name) AS name,
+            r.case_type,
+            SUM(r.posts) AS inc,
+            SUM(r.cases) AS total
+        FROM case_daily_rollup r
+        LEFT JOIN officers o ON o.id = r.officer_id
+        WHERE r.date = %s
+        GROUP BY
+            r.officer_id,
+            COALESCE(o.display_name, r.name),
+            COALESCE(o.norm_name, r.norm_name),
+            r.case_type
+        ORDER BY COALESCE(o.norm_name, r.norm_name), 2
+    """, (target,))
 
     if not rows:
         await ctx.send(embed=Embed(
@@ -1735,25 +1631,26 @@ async def date(ctx, date_str: str):
     total_normal_posts = 0
     total_point10_posts = 0
 
-    for name, ctype, inc, total in rows:
-        summary.setdefault(name, {
+    for officer_id, name, ctype, inc, total in rows:
+        summary.setdefault(officer_id, {
+            "name": name,
             "normal_cases": 0, "normal_posts": 0,
             "point10_cases": 0, "point10_posts": 0
         })
 
         if ctype == "normal":
-            summary[name]["normal_cases"] += total
-            summary[name]["normal_posts"] += inc
+            summary[officer_id]["normal_cases"] += total
+            summary[officer_id]["normal_posts"] += inc
             total_normal_posts += inc
         else:
-            summary[name]["point10_cases"] += total
-            summary[name]["point10_posts"] += inc
+            summary[officer_id]["point10_cases"] += total
+            summary[officer_id]["point10_posts"] += inc
             total_point10_posts += inc
 
         total_posts_all += inc
 
-    for name in sorted(summary.keys(), key=normalize_name):
-        data = summary[name]
+    for data in summary.values():
+        name = data["name"]
         value = ""
         if data["normal_cases"]:
             value += f"📂 คดีปกติ: {data['normal_cases']} เคส ({data['normal_posts']} คดี)\n"
@@ -1778,16 +1675,23 @@ async def date(ctx, date_str: str):
 async def week(ctx):
     start, end = get_week_range_sun_sat()
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT name, case_type, COUNT(*) AS inc, SUM(cases) AS total
-                FROM cases
-                WHERE date BETWEEN %s AND %s
-                    AND is_deleted = FALSE
-                GROUP BY name, case_type
-            """, (start, end))
-            rows = cur.fetchall()
+    rows = await db_async.fetch("""
+        SELECT
+            r.officer_id,
+            COALESCE(o.display_name, r.name) AS name,
+            r.case_type,
+            SUM(r.posts) AS inc,
+            SUM(r.cases) AS total
+        FROM case_daily_rollup r
+        LEFT JOIN officers o ON o.id = r.officer_id
+        WHERE r.date BETWEEN %s AND %s
+        GROUP BY
+            r.officer_id,
+            COALESCE(o.display_name, r.name),
+            COALESCE(o.norm_name, r.norm_name),
+            r.case_type
+        ORDER BY COALESCE(o.norm_name, r.norm_name), 2
+    """, (start, end))
 
     if not rows:
         await ctx.send(embed=Embed(
@@ -1808,25 +1712,26 @@ async def week(ctx):
     total_posts_all = 0
 
 
-    for name, ctype, inc, total in rows:
-        summary.setdefault(name, {
+    for officer_id, name, ctype, inc, total in rows:
+        summary.setdefault(officer_id, {
+            "name": name,
             "normal_cases": 0, "normal_posts": 0,
             "point10_cases": 0, "point10_posts": 0
         })
 
         if ctype == "normal":
-            summary[name]["normal_cases"] += total
-            summary[name]["normal_posts"] += inc
+            summary[officer_id]["normal_cases"] += total
+            summary[officer_id]["normal_posts"] += inc
             total_normal_posts += inc
         else:
-            summary[name]["point10_cases"] += total
-            summary[name]["point10_posts"] += inc
+            summary[officer_id]["point10_cases"] += total
+            summary[officer_id]["point10_posts"] += inc
             total_point10_posts += inc
 
         total_posts_all += inc
 
-    for name in sorted(summary.keys(), key=normalize_name):
-        data = summary[name]
+    for data in summary.values():
+        name = data["name"]
         value = ""
         if data["normal_cases"]:
             value += f"📂 คดีปกติ: {data['normal_cases']} เคส ({data['normal_posts']} คดี)\n"
@@ -1836,7 +1741,7 @@ async def week(ctx):
         value += f"📊 **รวมทั้งหมด: {data['normal_cases'] + data['point10_cases']} เคส**"
         embed.add_field(name=f"👤 {name}", value=value, inline=False)
 
-    normal_posts, point10_posts = get_post_summary_by_range(start, end)
+    normal_posts, point10_posts = await get_post_summary_by_range(start, end)
 
     embed.set_footer(
         text=build_case_footer(
@@ -1856,17 +1761,25 @@ async def check(ctx, *, keyword: str = None):
 
     today = today_th()
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT name, case_type, COUNT(*) AS inc, SUM(cases) AS total
-                FROM cases
-                WHERE date = %s
-                    AND name ILIKE %s
-                    AND is_deleted = FALSE
-                GROUP BY name, case_type
-            """, (today, f"%{keyword}%"))
-            rows = cur.fetchall()
+    rows = await db_async.fetch(f"""
+        SELECT
+            c.officer_id,
+            COALESCE(o.display_name, c.name) AS name,
+            c.case_type,
+            COUNT(*) AS inc,
+            SUM(c.cases) AS total
+        FROM cases c
+        LEFT JOIN officers o ON o.id = c.officer_id
+        WHERE c.date = %s
+            AND c.officer_id IN ({OFFICER_SEARCH_SQL})
+            AND c.is_deleted = FALSE
+        GROUP BY
+            c.officer_id,
+            COALESCE(o.display_name, c.name),
+            COALESCE(o.norm_name, c.norm_name),
+            c.case_type
+        ORDER BY COALESCE(o.norm_name, c.norm_name), 2
+    """, (today, f"%{keyword}%", f"%{keyword}%"))
 
     if not rows:
         await ctx.send("ไม่พบข้อมูล")
@@ -1883,23 +1796,24 @@ async def check(ctx, *, keyword: str = None):
     total_point10_posts = 0
     summary = {}
 
-    for name, ctype, inc, total in rows:
-        summary.setdefault(name, {
+    for officer_id, name, ctype, inc, total in rows:
+        summary.setdefault(officer_id, {
+            "name": name,
             "normal_cases": 0, "normal_posts": 0,
             "point10_cases": 0, "point10_posts": 0
         })
 
         if ctype == "normal":
-            summary[name]["normal_cases"] += total
-            summary[name]["normal_posts"] += inc         
+            summary[officer_id]["normal_cases"] += total
+            summary[officer_id]["normal_posts"] += inc         
         else:
-            summary[name]["point10_cases"] += total
-            summary[name]["point10_posts"] += inc
+            summary[officer_id]["point10_cases"] += total
+            summary[officer_id]["point10_posts"] += inc
 
         total_posts_all += inc
 
-    for name in sorted(summary.keys(), key=normalize_name):
-        data = summary[name]
+    for data in summary.values():
+        name = data["name"]
         value = ""
         if data["normal_cases"]:
             value += f"📂 คดีปกติ: {data['normal_cases']} เคส ({data['normal_posts']} คดี)\n"
@@ -1908,7 +1822,7 @@ async def check(ctx, *, keyword: str = None):
 
         embed.add_field(name=f"👤 {name}", value=value, inline=False)
 
-    normal_posts, point10_posts = get_post_summary_by_name_and_date(
+    normal_posts, point10_posts = await get_post_summary_by_name_and_date(
         keyword, today
     )
 
@@ -1930,17 +1844,25 @@ async def checkdate(ctx, date_str: str, *, keyword: str):
         await ctx.send("❌ ใช้ `!checkdate DD/MM ชื่อ` หรือ `!checkdate DD/MM/YYYY ชื่อ`")
         return
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT name, case_type, COUNT(*) AS inc, SUM(cases) AS total
-                FROM cases
-                WHERE date = %s
-                    AND name ILIKE %s
-                    AND is_deleted = FALSE
-                GROUP BY name, case_type
-            """, (target, f"%{keyword}%"))
-            rows = cur.fetchall()
+    rows = await db_async.fetch(f"""
+        SELECT
+            c.officer_id,
+            COALESCE(o.display_name, c.name) AS name,
+            c.case_type,
+            COUNT(*) AS inc,
+            SUM(c.cases) AS total
+        FROM cases c
+        LEFT JOIN officers o ON o.id = c.officer_id
+        WHERE c.date = %s
+            AND c.officer_id IN ({OFFICER_SEARCH_SQL})
+            AND c.is_deleted = FALSE
+        GROUP BY
+            c.officer_id,
+            COALESCE(o.display_name, c.name),
+            COALESCE(o.norm_name, c.norm_name),
+            c.case_type
+        ORDER BY COALESCE(o.norm_name, c.norm_name), 2
+    """, (target, f"%{keyword}%", f"%{keyword}%"))
 
     if not rows:
         await ctx.send("ไม่พบข้อมูล")
@@ -1955,23 +1877,24 @@ async def checkdate(ctx, date_str: str, *, keyword: str):
     total_posts_all = 0
     summary = {}
 
-    for name, ctype, inc, total in rows:
-        summary.setdefault(name, {
+    for officer_id, name, ctype, inc, total in rows:
+        summary.setdefault(officer_id, {
+            "name": name,
             "normal_cases": 0, "normal_posts": 0,
             "point10_cases": 0, "point10_posts": 0
         })
 
         if ctype == "normal":
-            summary[name]["normal_cases"] += total
-            summary[name]["normal_posts"] += inc
+            summary[officer_id]["normal_cases"] += total
+            summary[officer_id]["normal_posts"] += inc
         else:
-            summary[name]["point10_cases"] += total
-            summary[name]["point10_posts"] += inc
+            summary[officer_id]["point10_cases"] += total
+            summary[officer_id]["point10_posts"] += inc
 
         total_posts_all += inc
 
-    for name in sorted(summary.keys(), key=normalize_name):
-        data = summary[name]
+    for data in summary.values():
+        name = data["name"]
         value = ""
         if data["normal_cases"]:
             value += f"📂 คดีปกติ: {data['normal_cases']} เคส ({data['normal_posts']} คดี)\n"
@@ -1980,7 +1903,7 @@ async def checkdate(ctx, date_str: str, *, keyword: str):
 
         embed.add_field(name=f"👤 {name}", value=value, inline=False)
         
-    normal_posts, point10_posts = get_post_summary_by_name_and_date(
+    normal_posts, point10_posts = await get_post_summary_by_name_and_date(
         keyword, target
     )
 
@@ -2022,10 +1945,10 @@ async def posts(ctx):
     week_start, week_end = get_week_range_sun_sat()
 
     # วันนี้
-    t_normal, t_point10, t_total = count_posts_by_type(today)
+    t_normal, t_point10, t_total = await count_posts_by_type(today)
 
     # สัปดาห์นี้
-    w_normal, w_point10, w_total = count_posts_by_type(week_start, week_end)
+    w_normal, w_point10, w_total = await count_posts_by_type(week_start, week_end)
 
     embed = Embed(
         title="📊 สรุปคดี (นับจากโพส)",
@@ -2062,9 +1985,153 @@ async def posts(ctx):
 
     await ctx.send(embed=embed)
 
+@bot.command()
+@is_pbt()
+async def health(ctx):
+    stats = pool_stats()
+    async_stats = db_async.pool_stats()
+    queue_stats = case_queue.stats()
+    audit_stats = audit_sink.stats()
+    circuit = db_circuit.stats()
+
+    embed = Embed(
+        title="🩺 System Health",
+        color=0x3498db
+    )
+    circuit_icon = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}[circuit["state"]]
+    embed.add_field(
+        name="🔌 DB Circuit Breaker",
+        value=(
+            f"สถานะ: {circuit_icon} {circuit['state']}"
+            + (f" (ลองใหม่ใน {circuit['retry_in']:.0f}s)" if circuit["state"] == "open" else "")
+            + "\n"
+            f"ล้มติดกัน: {circuit['failures']} | ตัดวงจร: {circuit['trips']} ครั้ง | "
+            f"ปฏิเสธทันที: {circuit['rejected']}\n"
+            f"error ล่าสุด: {circuit['last_error'] or '-'}"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="🏊 DB Connection Pool",
+        value=(
+            f"ใช้งานอยู่: {stats['in_use']} / {stats['max']} (min {stats['min']})\n"
+            f"ว่าง: {stats['idle']}\n"
+            f"ยืมไปแล้ว: {stats['checkouts']} ครั้ง\n"
+            f"รอเฉลี่ย: {stats['avg_wait_ms']:.1f} ms (สูงสุด {stats['max_wait_ms']:.1f} ms)\n"
+            f"ทิ้ง connection เสีย: {stats['discarded']} | connect fail: {stats['connect_failures']}"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="⚡ Async DB Pool",
+        value=(
+            f"ขนาด pool: {async_stats.get('pool_size', 0)} / {async_stats.get('pool_max', 0)}\n"
+            f"ว่าง: {async_stats.get('pool_available', 0)}\n"
+            f"รอคิว: {async_stats.get('requests_waiting', 0)}\n"
+            f"ยืมไปแล้ว: {async_stats.get('requests_num', 0)} ครั้ง | "
+            f"timeout: {async_stats.get('requests_errors', 0)}"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="📥 Case Ingest Queue",
+        value=(
+            f"ค้างในคิว: {queue_stats['depth']} / {queue_stats['max_pending']} โพส\n"
+            f"flush แล้ว: {queue_stats['batches']} batch ({queue_stats['rows']} เคส)\n"
+            f"flush ล่าสุด: {queue_stats['last_flush_ms']:.1f} ms | "
+            f"เฉลี่ย: {queue_stats['avg_flush_ms']:.1f} ms | "
+            f"สูงสุด: {queue_stats['max_flush_ms']:.1f} ms\n"
+            f"คิวเต็มต้องรอ: {queue_stats['backpressure_waits']} ครั้ง | "
+            f"flush fail: {queue_stats['failures']}"
+        ),
+        inline=False
+    )
+    spool_stats = case_spool.stats()
+    embed.add_field(
+        name="📼 Case Spool (DB ล่ม)",
+        value=(
+            f"ค้างรอ replay: {spool_stats['pending']}\n"
+            f"spool แล้ว: {spool_stats['spooled']} | replay แล้ว: {spool_stats['replayed']} | "
+            f"ทิ้ง (.rejected): {spool_stats['rejected']}\n"
+            f"fsync: {spool_stats['fsyncs']} ครั้ง | replay ค้าง: {spool_stats['replay_errors']}"
+        ),
+        inline=False
+    )
+    alert_stats = alert_dispatcher.stats()
+    embed.add_field(
+        name="📧 Alert Dispatcher",
+        value=(
+            f"รอส่ง: {alert_stats['pending']} | ส่งแล้ว: {alert_stats['sent']} | "
+            f"fail: {alert_stats['failed']} | retry: {alert_stats['retries']}\n"
+            f"ข้าม (ซ้ำ): {alert_stats['deduped']} | คิวเต็มทิ้ง: {alert_stats['dropped']}"
+        ),
+        inline=False
+    )
+    sheets_stats = sheet_scheduler.stats()
+    sheets_calls = "\n".join(
+        f"{name}: {call['count']} ครั้ง | เฉลี่ย {call['avg_ms']:.0f} ms | "
+        f"สูงสุด {call['max_ms']:.0f} ms | error {call['errors']}"
+        for name, call in sorted(sheets_stats["calls"].items())
+    ) or "ยังไม่มี call"
+    embed.add_field(
+        name="📗 Google Sheets API",
+        value=(
+            f"retry: {sheets_stats['retries']} | โดน 429: {sheets_stats['throttled']} | "
+            f"read ที่รวมกัน: {sheets_stats['coalesced']} | "
+            f"รอ quota รวม: {sheets_stats['wait_total']:.1f} s\n"
+            f"{sheets_calls}"
+        )[:1024],
+        inline=False
+    )
+    outbox_stats = sheet_outbox.stats()
+    embed.add_field(
+        name="📤 Sheet Outbox",
+        value=(
+            f"ค้างรอเขียน: {outbox_stats['backlog']} | "
+            f"ค้างนานสุด: {int(outbox_stats['oldest_age'])} วินาที\n"
+            f"เขียนแล้ว: {outbox_stats['applied']} | retry: {outbox_stats['retries']} | "
+            f"เลิกลอง: {outbox_stats['failed']} (ในตาราง {outbox_stats['dead']})"
+            + (f"\nerror ล่าสุด: {outbox_stats['last_error']}" if outbox_stats["last_error"] else "")
+        )[:1024],
+        inline=False
+    )
+    embed.add_field(
+        name="🧾 Audit Sink",
+        value=(
+            f"รอเขียน: {audit_stats['pending']} event\n"
+            f"เขียนแล้ว: {audit_stats['written']} event ({audit_stats['batches']} batch)\n"
+            f"flush ล่าสุด: {audit_stats['last_flush_ms']:.1f} ms | "
+            f"fail: {audit_stats['failures']} | ทิ้ง: {audit_stats['dropped']}"
+        ),
+        inline=False
+    )
+    embed.set_footer(text=SYSTEM_FOOTER)
+    await ctx.send(embed=embed)
+
+@bot.command()
+@is_pbt()
+async def dbplan(ctx):
+    report = await explain_hot_queries()
+
+    embed = Embed(
+        title="🧭 Query Plan — Hot Queries",
+        description="index ที่ planner เลือกใช้ของ query หลัก",
+        color=0x9b59b6
+    )
+
+    for label, used in report:
+        embed.add_field(
+            name=f"🔎 {label}",
+            value="\n".join(used) or "-",
+            inline=False
+        )
+
+    embed.set_footer(text=SYSTEM_FOOTER)
+    await ctx.send(embed=embed)
+
 @bot.command()
 async def rankweek(ctx):
-    embed = build_weekly_ranking_embed()
+    embed = await build_weekly_ranking_embed()
     await ctx.send(embed=embed)
     
 @bot.command()
@@ -2089,35 +2156,39 @@ async def checkuphill(ctx, *, args: str = None):
             except:
                 search_name = parts[0]
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            if search_name:
-                cur.execute("""
-                    SELECT
-                        name,
-                        COUNT(DISTINCT message_id) AS posts,
-                        SUM(cases) AS total_cases
-                    FROM cases
-                    WHERE date = %s
-                      AND is_uphill = TRUE
-                      AND is_deleted = FALSE
-                      AND name ILIKE %s
-                    GROUP BY name
-                """, (target_date, f"%{search_name}%"))
-            else:
-                cur.execute("""
-                    SELECT
-                        name,
-                        COUNT(DISTINCT message_id) AS posts,
-                        SUM(cases) AS total_cases
-                    FROM cases
-                    WHERE date = %s
-                      AND is_uphill = TRUE
-                      AND is_deleted = FALSE
-                    GROUP BY name
-                """, (target_date,))
-
-            rows = cur.fetchall()
+    if search_name:
+        rows = await db_async.fetch(f"""
+            SELECT
+                COALESCE(o.display_name, r.name) AS name,
+                SUM(r.uphill_posts) AS posts,
+                SUM(r.uphill_cases) AS total_cases
+            FROM case_daily_rollup r
+            LEFT JOIN officers o ON o.id = r.officer_id
+            WHERE r.date = %s
+              AND r.uphill_posts > 0
+              AND r.officer_id IN ({OFFICER_SEARCH_SQL})
+            GROUP BY
+                r.officer_id,
+                COALESCE(o.display_name, r.name),
+                COALESCE(o.norm_name, r.norm_name)
+            ORDER BY COALESCE(o.norm_name, r.norm_name), 1
+        """, (target_date, f"%{search_name}%", f"%{search_name}%"))
+    else:
+        rows = await db_async.fetch("""
+            SELECT
+                COALESCE(o.display_name, r.name) AS name,
+                SUM(r.uphill_posts) AS posts,
+                SUM(r.uphill_cases) AS total_cases
+            FROM case_daily_rollup r
+            LEFT JOIN officers o ON o.id = r.officer_id
+            WHERE r.date = %s
+              AND r.uphill_posts > 0
+            GROUP BY
+                r.officer_id,
+                COALESCE(o.display_name, r.name),
+                COALESCE(o.norm_name, r.norm_name)
+            ORDER BY COALESCE(o.norm_name, r.norm_name), 1
+        """, (target_date,))
 
     if not rows:
         await ctx.send(
@@ -2137,11 +2208,8 @@ async def checkuphill(ctx, *, args: str = None):
         color=0xe67e22
     )
 
-    # ✅ เรียง A–Z ตามชื่อ (ไม่สนเลขหน้า)
-    for name, posts, total in sorted(
-        rows,
-        key=lambda x: normalize_name(x[0])
-    ):
+    # ✅ เรียง A–Z ตามชื่อ (ไม่สนเลขหน้า) — ORDER BY norm_name จาก SQL
+    for name, posts, total in rows:
         embed.add_field(
             name=f"👤 {name}",
             value=f"🏔️ {total} เคส ({posts} คดี)",
@@ -2153,110 +2221,303 @@ async def checkuphill(ctx, *, args: str = None):
 
 from gspread.utils import rowcol_to_a1
 
-def run_daily_case_sync(target_date):
+SYNC_MAX_DAYS = 93   # !sync ช่วงวันยาวสุด (~3 เดือน)
+
+def run_case_sync_range(start_date, end_date):
+    try:
+        return _write_case_sync_range(start_date, end_date)
+    except Exception as e:
+        # แท็บถูกลบ / เปลี่ยนชื่อ → ล้าง handle ใน cache ให้รอบหน้า (outbox retry / !sync ซ้ำ) เปิดใหม่
+        drop_stale_handles(e)
+        raise
+
+def _write_case_sync_range(start_date, end_date):
+    """
+    เขียนยอดเคสหลายวันลงชีท
+    query DB ครั้งเดียว / header อ่านครั้งเดียวต่อ worksheet / batch_update ครั้งเดียวต่อ worksheet
+    เขียนเฉพาะช่องที่ค่าเปลี่ยนจากที่เขียนไว้รอบก่อน
+    คืน {"written", "unchanged", "days", "skipped": [ชื่อที่ไม่พบ], "missing": [วันที่/เดือนที่ข้าม]}
+    """
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(r"""
+            # รวมต่อ officer ต่อวัน (เปลี่ยนชื่อกลางวันก็ยังเป็นแถวเดียว)
+            # sheet_name = key หาแถวในชีท / norm_name ล่าสุดเป็นตัวสำรอง
+            cur.execute("""
                 SELECT
-                    TRIM(
-                        LOWER(
-                            REGEXP_REPLACE(
-                                REGEXP_REPLACE(name, '^\+?\d+\s*', ''),
-                                '\[.*?\]\s*', '',
-                                'g'
-                            )
-                        )
-                    ) AS norm_name,
-                    SUM(cases)
-                    + COUNT(*) FILTER (WHERE is_uphill = TRUE)
-                    AS total_cases
-                FROM cases
-                WHERE date = %s
-                  AND is_deleted = FALSE
-                GROUP BY norm_name
-            """, (target_date,))
+                    r.date,
+                    COALESCE(o.sheet_name, r.norm_name) AS sheet_name,
+                    COALESCE(o.norm_name, r.norm_name) AS norm_name,
+                    SUM(r.cases) + SUM(r.uphill_posts) AS total_cases
+                FROM case_daily_rollup r
+                LEFT JOIN officers o ON o.id = r.officer_id
+                WHERE r.date BETWEEN %s AND %s
+                  AND r.norm_name IS NOT NULL
+                GROUP BY r.date, r.officer_id, 2, 3
+                ORDER BY r.date
+            """, (start_date, end_date))
             rows = cur.fetchall()
 
-    if not rows:
-        return 0, []
+    result = {
+        "written": 0,
+        "unchanged": 0,
+        "days": 0,
+        "skipped": [],
+        "missing": [],
+    }
 
-    # 🔥 แก้ตรงนี้บรรทัดเดียว (สำคัญมาก)
-    sheet = get_sheet_by_date(target_date)
+    # แยกตามเดือน (1 เดือน = 1 worksheet)
+    by_month = {}
+    for work_date, sheet_name, norm_name, total_cases in rows:
+        by_month.setdefault((work_date.year, work_date.month), []).append(
+            (work_date, sheet_name, norm_name, total_cases)
+        )
+
+    skipped = set()
+
+    for (year, month), month_rows in by_month.items():
+        try:
+            sheet = get_sheet_by_date(month_rows[0][0])
+        except ValueError as e:
+            result["missing"].append(f"{month:02d}/{year}: {e}")
+            continue
+
+        # header + ชื่อในชีท (cache ไว้ / โหลดใหม่เฉพาะตอนชีทถูกแก้)
+        layout = get_synced_case_layout(sheet)
+
+        columns = {}
+        totals = {}
+
+        for work_date, sheet_name, norm_name, total_cases in month_rows:
+            if work_date not in columns:
+                try:
+                    # column วันที่ / column ถัดไป = จำนวนเคส
+                    columns[work_date] = layout.day_column(work_date) + 1
+                except ValueError as e:
+                    columns[work_date] = None
+                    print(f"⚠️ Skip sync: {work_date:%d/%m/%Y} ({e})")
+                    result["missing"].append(f"{work_date:%d/%m/%Y}: {e}")
+
+            case_col = columns[work_date]
+            if case_col is None:
+                continue
+
+            row = layout.name_rows.get(sheet_name) or layout.name_rows.get(norm_name)
+            if row is None:
+                skipped.add(norm_name)
+                continue
+
+            key = (row, case_col)
+            totals[key] = totals.get(key, 0) + total_cases
+
+        # ส่งเฉพาะช่องที่เปลี่ยน (re-sync ซ้ำ ๆ ไม่เปลือง quota)
+        changed = layout.changed_cells(totals)
+
+        updates = [
+            {
+                "range": rowcol_to_a1(row, col),
+                "values": [[total]]
+            }
+            for (row, col), total in changed.items()
+        ]
+
+        if updates:
+            sheet_scheduler.write("batch_update", sheet.batch_update, updates)
+            layout.remember(changed)
+            note_own_write(layout.stamp)
+
+        result["written"] += len(updates)
+        result["unchanged"] += len(totals) - len(changed)
+        result["days"] += sum(1 for col in columns.values() if col is not None)
+
+    result["skipped"] = sorted(skipped)
+    return result
+
+def run_daily_case_sync(target_date):
+    return run_case_sync_range(target_date, target_date)
+
+async def enqueue_case_sync(start_date, end_date, notify=False):
+    async with db_async.transaction() as cur:
+        await enqueue_sheet_write(
+            cur,
+            "case_sync",
+            f"{start_date.isoformat()}:{end_date.isoformat()}",
+            {
+                "start": start_date.isoformat(),
+                "end": end_date.isoformat(),
+                "notify": notify,
+            }
+        )
+
+    sheet_outbox.poke()
+
+# ======================
+# SHEET OUTBOX HANDLERS (รันใน thread / ต้องเขียนซ้ำได้ผลเหมือนเดิม)
+# ======================
+def apply_case_sync(payload):
+    return run_case_sync_range(
+        datetime.fromisoformat(payload["start"]).date(),
+        datetime.fromisoformat(payload["end"]).date()
+    )
+
+def apply_body_total(payload):
+    write_body_case_total(
+        datetime.fromisoformat(payload["date"]).date(),
+        payload["total"]
+    )
+
+SHEET_OUTBOX_HANDLERS = {
+    "case_sync": apply_case_sync,
+    "body_total": apply_body_total,
+}
+
+async def on_sheet_outbox_result(kind, payload, result, error):
+    if kind == "case_sync" and payload.get("notify"):
+        channel = bot.get_channel(DAILY_REPORT_CHANNEL_ID)
+        if channel is None:
+            return
+
+        if error is not None:
+            await channel.send(f"❌ Auto Sheet Sync Error: `{error}`")
+            return
+
+        start_date = datetime.fromisoformat(payload["start"]).date()
+        end_date = datetime.fromisoformat(payload["end"]).date()
 
-    try:
-        col = find_day_column_safe(target_date)
-    except ValueError:
         print(
-            f"⚠️ Skip sync: {target_date:%d/%m/%Y} "
-            f"(ยังไม่มี column ใน worksheet)"
+            f"✅ Auto Sheet Sync {start_date} | "
+            f"written={result['written']} unchanged={result['unchanged']} "
+            f"skipped={len(result['skipped'])}"
         )
-        return 0, []
 
-    case_col = col + 1
+        embed = build_sync_embed(
+            "📊 Auto Sheet Sync Completed",
+            start_date,
+            end_date,
+            result,
+            "⏰ Auto Sync เวลา 23:59"
+        )
+        await channel.send(embed=embed)
 
-    name_row_map = build_name_row_map(sheet)
+    elif kind == "body_total" and error is not None:
+        channel = bot.get_channel(BODY_DASHBOARD_CHANNEL_ID)
+        if channel:
+            await channel.send(
+                f"❌ Body Case Sheet Error ({payload['date']}): `{error}`"
+            )
 
-    updates = []
-    written = 0
-    skipped = []
+def build_sync_embed(title, start_date, end_date, result, footer):
+    if start_date == end_date:
+        description = f"📅 วันที่: {start_date.strftime('%d/%m/%Y')}"
+    else:
+        description = (
+            f"📅 วันที่: {start_date.strftime('%d/%m/%Y')} - "
+            f"{end_date.strftime('%d/%m/%Y')} ({result['days']} วัน)"
+        )
 
-    for norm_name, total_cases in rows:
-        row = name_row_map.get(norm_name)
-        if row is None:
-            skipped.append(norm_name)
-            continue
+    embed = Embed(
+        title=title,
+        description=description,
+        color=0x2ecc71
+    )
+    # วันเดียว = 1 ช่องต่อคน
+    unit = "คน" if start_date == end_date else "ช่อง"
+    embed.add_field(
+        name="✅ เขียนสำเร็จ",
+        value=f"{result['written']} {unit}",
+        inline=True
+    )
+    embed.add_field(
+        name="➖ ไม่เปลี่ยนแปลง",
+        value=f"{result['unchanged']} {unit}",
+        inline=True
+    )
+    embed.add_field(
+        name="⚠️ ไม่พบชื่อ",
+        value=f"{len(result['skipped'])} คน",
+        inline=True
+    )
 
-        updates.append({
-            "range": rowcol_to_a1(row, case_col),
-            "values": [[total_cases]]
-        })
-        written += 1
+    if result["skipped"]:
+        embed.add_field(
+            name="⚠️ ไม่พบชื่อในชีท",
+            value="\n".join(result["skipped"])[:1024],
+            inline=False
+        )
 
-    if updates:
-        sheet.batch_update(updates)
+    if result["missing"]:
+        embed.add_field(
+            name="⏭️ ข้าม (ไม่มี worksheet / column)",
+            value="\n".join(result["missing"])[:1024],
+            inline=False
+        )
 
-    return written, skipped
+    embed.set_footer(text=footer)
+    return embed
 
 @bot.command()
 @is_pbt()
-async def sync(ctx, date_str: str):
+async def sync(ctx, date_str: str, end_str: str = None):
     try:
-        target_date = parse_date_smart(date_str)
+        start_date = parse_date_smart(date_str)
+        end_date = parse_date_smart(end_str) if end_str else start_date
     except:
-        await ctx.send("❌ ใช้ `!sync DD/MM/YYYY`")
+        await ctx.send("❌ ใช้ `!sync DD/MM/YYYY [DD/MM/YYYY]`")
+        return
+
+    if end_date < start_date:
+        start_date, end_date = end_date, start_date
+
+    if (end_date - start_date).days + 1 > SYNC_MAX_DAYS:
+        await ctx.send(f"❌ ช่วงวันยาวเกิน {SYNC_MAX_DAYS} วัน")
         return
 
     await ctx.send("⏳ กำลังเขียนข้อมูลลง Google Sheet...")
 
     try:
-        written, skipped = await asyncio.to_thread(
-            run_daily_case_sync,
-            target_date
+        result = await asyncio.to_thread(
+            run_case_sync_range,
+            start_date,
+            end_date
         )
     except Exception as e:
         await ctx.send(f"❌ Error: {e}")
         return
 
-    embed = Embed(
-        title="📊 เขียนข้อมูลลง Google Sheet",
-        description=f"📅 วันที่: {target_date.strftime('%d/%m/%Y')}",
-        color=0x2ecc71
-    )
-    embed.add_field(
-        name="✅ เขียนสำเร็จ",
-        value=f"{written} คน",
-        inline=False
+    embed = build_sync_embed(
+        "📊 เขียนข้อมูลลง Google Sheet",
+        start_date,
+        end_date,
+        result,
+        "เขียนลง Google Sheet เรียบร้อย"
     )
+    await ctx.send(embed=embed)
 
-    if skipped:
-        embed.add_field(
-            name="⚠️ ไม่พบชื่อในชีท",
-            value="\n".join(skipped),
-            inline=False
-        )
+@bot.command()
+@is_pbt()
+async def sheetname(ctx, member: discord.Member, *, sheet_name: str):
+    """ผูกเจ้าหน้าที่กับชื่อในชีท (ใช้ตอนชื่อในชีทไม่ตรงกับชื่อใน Discord)"""
+    key = normalize_name(sheet_name)
 
-    embed.set_footer(text="เขียนลง Google Sheet เรียบร้อย")
-    await ctx.send(embed=embed)
+    try:
+        async with db_async.transaction() as cur:
+            await upsert_officers(
+                cur,
+                {member.id: (member.display_name, normalize_name(member.display_name))}
+            )
+            await cur.execute(
+                """
+                UPDATE officers
+                SET sheet_name = %s,
+                    updated_at = NOW()
+                WHERE discord_id = %s
+                """,
+                (key, member.id)
+            )
+    except Exception as e:
+        await ctx.send(f"❌ Error: {e}")
+        return
+
+    await ctx.send(f"✅ {member.display_name} → แถวชื่อ `{key}` ในชีท")
 
 async def count_body_cases_split(work_date):
     start, end = get_body_work_window(work_date)
@@ -2301,7 +2562,7 @@ async def testbody(ctx, date_str: str):
     result = await count_body_cases_split(target_date)
 
     # ✅ SAVE DB
-    save_body_case_daily_split(result)
+    await save_body_case_daily_split(result)
 
     await ctx.send(
         "🧪 Body Case Test (Split)\n"
@@ -2318,24 +2579,36 @@ async def testbody(ctx, date_str: str):
 async def testmail(ctx):
     await ctx.send("📧 กำลังทดสอบส่งอีเมลแจ้งเตือน...")
 
+    result = alert_dispatcher.notify(
+        "testmail",
+        subject="🧪 TEST EMAIL - Police Bot",
+        body=(
+            "This is a test email from Railway Police Bot.\n\n"
+            "If you receive this email:\n"
+            "- Email system: OK\n"
+            "- Resend API: OK\n"
+            "- Environment Variables: OK\n\n"
+            "Time: " + now_th().strftime("%d/%m/%Y %H:%M:%S")
+        ),
+        cooldown=0
+    )
+
+    if result is None:
+        await ctx.send("❌ คิวแจ้งเตือนเต็ม ลองใหม่ภายหลัง")
+        return
+
+    # รอผลในคิว (ไม่บล็อก event loop)
     try:
-        send_email_alert(
-            subject="🧪 TEST EMAIL - Police Bot",
-            body=(
-                "This is a test email from Railway Police Bot.\n\n"
-                "If you receive this email:\n"
-                "- Email system: OK\n"
-                "- Resend API: OK\n"
-                "- Environment Variables: OK\n\n"
-                "Time: " + now_th().strftime("%d/%m/%Y %H:%M:%S")
-            )
-        )
+        error = await asyncio.wait_for(asyncio.shield(result), 60)
+    except asyncio.TimeoutError:
+        await ctx.send("⏳ ยังส่งไม่เสร็จ (อยู่ในคิว) เช็คกล่องเมลอีกครั้งภายหลัง")
+        return
 
+    if error:
+        await ctx.send(f"❌ ส่งเมลล้มเหลว: `{error}`")
+    else:
         await ctx.send("✅ ส่งอีเมลทดสอบแล้ว (เช็คกล่องเมล)")
 
-    except Exception as e:
-        await ctx.send(f"❌ ส่งเมลล้มเหลว: `{e}`")
-
 @bot.command()
 @is_pbt()
 async def bodytest(ctx, date_str: str = None):
@@ -2354,14 +2627,8 @@ async def bodytest(ctx, date_str: str = None):
     # 2️⃣ นับเคส
     result = await count_body_cases_split(work_date)
 
-    # 3️⃣ เขียน DB
-    save_body_case_daily_split(result)
-
-    # 4️⃣ เขียน Google Sheet
-    write_body_case_total(
-        work_date,
-        result["total"]
-    )
+    # 3️⃣ เขียน DB + 4️⃣ คิวเขียน Google Sheet (drainer เขียนให้)
+    await save_body_case_daily_split(result)
 
     # 5️⃣ สร้าง embed
     embed = build_body_dashboard_embed(result, work_date)
@@ -2372,7 +2639,7 @@ async def bodytest(ctx, date_str: str = None):
 
     # 6️⃣ ส่ง / แก้ dashboard
     channel = bot.get_channel(BODY_DASHBOARD_CHANNEL_ID)
-    msg_id = get_body_dashboard_message_id()
+    msg_id = await get_body_dashboard_message_id()
 
     try:
         if msg_id:
@@ -2382,7 +2649,7 @@ async def bodytest(ctx, date_str: str = None):
         else:
             msg = await channel.send(embed=embed)
             await msg.pin()
-            set_body_dashboard_message_id(msg.id)
+            await set_body_dashboard_message_id(msg.id)
             await ctx.send("🆕 สร้าง Dashboard ใหม่เรียบร้อย")
 
     except Exception as e:
@@ -2483,7 +2750,7 @@ async def cmd(ctx):
         name="🛠️ เครื่องมือ",
         value=(
             "`!time` — ⏰ ตรวจเวลาของบอท (TH / UTC+7)\n"
-            "`!sync DD/MM[/YYYY]` — 📊 เขียนจำนวนเคสลง Google Sheet\n"
+            "`!sync DD/MM[/YYYY] [ถึงวันที่]` — 📊 เขียนจำนวนเคสลง Google Sheet (ทีละวัน / ทั้งช่วง)\n"
             "`!cmd` — 📖 ดูคำสั่งทั้งหมด"
         ),
         inline=False
@@ -2510,6 +2777,7 @@ async def cmd(ctx):
                 "`!audit export DD/MM/YYYY DD/MM/YYYY` — export audit log ตามช่วงวัน (CSV + Excel)\n"
                 "`!audit export csv DD/MM/YYYY [DD/MM/YYYY]` — export เฉพาะ CSV\n"
                 "`!audit export excel DD/MM/YYYY [DD/MM/YYYY]` — export เฉพาะ Excel\n"
+                "`!audit jobs` / `!audit cancel <id>` — ดู / ยกเลิก export ที่กำลังทำ\n"
                 "  ↳ ใช้ได้เฉพาะห้อง **audit**"
             ),
             inline=False
@@ -2518,6 +2786,9 @@ async def cmd(ctx):
         embed.add_field(
             name="🛑 คำสั่งผู้บังคับบัญชา (ผบตร.)",
             value=(
+                "`!health` — 🩺 สถานะระบบ (DB pool / คิวบันทึกเคส)\n"
+                "`!dbplan` — 🧭 ดูว่า query หลักใช้ index ไหน\n"
+                "`!sheetname @คน ชื่อในชีท` — 🔗 ผูกเจ้าหน้าที่กับแถวในชีท\n"
                 "`!resetdb` — 🧨 ลบข้อมูลคดีทั้งหมด\n"
                 "`!confirm <password>` — ยืนยันการลบข้อมูล"
             ),
@@ -2570,25 +2841,19 @@ async def rebuilddate(ctx, date_str: str):
             if not msg.mentions:
                 continue
 
-            tasks = []
-
-            for member in set(msg.mentions):
-                uphill = is_uphill_case(msg.content)
-                tasks.append(
-                    save_case_async(
-                        member.display_name,
-                        msg.channel.name,
-                        "case10" if msg.channel.id == CASE10_CHANNEL_ID else "normal",
-                        2 if msg.channel.id == CASE10_CHANNEL_ID else 1,
-                        msg.id,
-                        msg.created_at.astimezone(TH_TZ).date(),
-                        uphill
-                    )
+            await case_queue.put(
+                msg.id,
+                build_case_rows(
+                    msg,
+                    "case10" if msg.channel.id == CASE10_CHANNEL_ID else "normal",
+                    2 if msg.channel.id == CASE10_CHANNEL_ID else 1
                 )
-
-            await asyncio.gather(*tasks)
+            )
             rebuilt += 1
 
+    # รอให้ทุกโพสถูกบันทึกจริงก่อนรายงานผล
+    await case_queue.join()
+
     write_audit(
         action="REBUILD_DATE",
         actor=ctx.author.display_name,
@@ -2626,9 +2891,9 @@ async def confirm(ctx, password: str):
 
     pending_reset.remove(ctx.author.id)
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("TRUNCATE TABLE cases RESTART IDENTITY;")
+    await db_async.execute(
+        "TRUNCATE TABLE cases, case_daily_rollup, case_daily_posts RESTART IDENTITY;"
+    )
     write_audit(
     action="RESET_DB",
     actor=ctx.author.display_name,
@@ -2662,14 +2927,17 @@ async def bodydash(ctx, date_str: str = None):
 
     msg = await ctx.send(embed=embed)
     await msg.pin()
-    set_body_dashboard_message_id(msg.id)
+    await set_body_dashboard_message_id(msg.id)
 
 
 # ======================
 # REGISTER AUDIT COMMANDS
 # ======================
-setup_audit_commands(bot, get_conn, is_pbt)   
+audit_export_jobs = setup_audit_commands(bot, get_conn, is_pbt)
 # ======================
 # RUN
 # ======================
-bot.run(TOKEN)
+try:
+    bot.run(TOKEN)
+finally:
+    close_pool()
@@ -0,0 +1,126 @@
+import random
+import threading
+import time
+
+# ======================
+# RETRY / CIRCUIT BREAKER
+# ======================
+# ใช้ร่วมกันทั้ง sync pool (db.py / worker thread) และ async pool (db_async.py)
+#   closed    : ปกติ
+#   open      : ล้มติดกัน ≥ failure_threshold → ปฏิเสธทันที (ไม่รอ timeout ซ้ำ ๆ)
+#   half_open : ครบ reset_timeout → ปล่อย 1 request ไปลอง สำเร็จ = closed / ล้ม = open ต่อ
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def backoff_delay(attempt, base=0.5, cap=5.0):
+    """exponential backoff + full jitter (กันทุก caller retry พร้อมกัน)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+        self._stats = {
+            "trips": 0,
+            "rejected": 0,
+            "last_error": None,
+            "last_change": time.time(),
+        }
+
+    # ======================
+    # GATE
+    # ======================
+    def allow(self):
+        """เรียกก่อนแตะ DB → โยน CircuitOpenError ถ้ารู้อยู่แล้วว่า DB ล่ม"""
+        with self._lock:
+            if self._state == "closed":
+                return
+
+            if self._state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(f"{self.name} circuit open")
+
+                self._set_state("half_open")
+
+            # half_open: ให้ผ่านทีละ 1 request (probe ที่ค้างนานเกิน = ถูกยกเลิกไป ให้ลองใหม่)
+            now = time.monotonic()
+            if self._probe_in_flight and now - self._probe_started < self.reset_timeout:
+                self._stats["rejected"] += 1
+                raise CircuitOpenError(f"{self.name} circuit half-open (probing)")
+
+            self._probe_in_flight = True
+            self._probe_started = now
+
+    # ======================
+    # RESULT
+    # ======================
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+
+            if self._state != "closed":
+                self._set_state("closed")
+                print(f"🟢 {self.name} circuit closed")
+
+    def record_failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            self._stats["last_error"] = str(error)[:200]
+
+            if self._state == "half_open" or (
+                self._state == "closed" and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._stats["trips"] += 1
+                self._set_state("open")
+                print(f"🔴 {self.name} circuit open ({self._failures} failures):", error)
+
+    def _set_state(self, state):
+        self._state = state
+        self._stats["last_change"] = time.time()
+
+    # ======================
+    # METRICS
+    # ======================
+    @property
+    def state(self):
+        return self._state
+
+    def available(self) -> bool:
+        """ยังไม่ถูกตัด หรือครบเวลารอแล้ว (request ถัดไปจะได้เป็น probe)"""
+        with self._lock:
+            if self._state != "open":
+                return True
+            return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["state"] = self._state
+            stats["failures"] = self._failures
+
+            if self._state == "open":
+                stats["retry_in"] = max(
+                    0.0,
+                    self.reset_timeout - (time.monotonic() - self._opened_at)
+                )
+            else:
+                stats["retry_in"] = 0.0
+
+        return stats
@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+from circuit import CircuitBreaker, CircuitOpenError, backoff_delay
+
+# ======================
+# CONFIG
+# ======================
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))   # รอ connection ว่างได้นานสุด (วินาที)
+DB_POOL_CHECK_IDLE = 30   # connection ที่ว่างเกิน 30 วิ → ping ก่อนใช้
+
+DB_CIRCUIT_FAILURES = int(os.getenv("DB_CIRCUIT_FAILURES", "3"))       # ล้มติดกันกี่ครั้งถึงตัดวงจร
+DB_CIRCUIT_RESET = float(os.getenv("DB_CIRCUIT_RESET", "30"))          # ตัดแล้วรอกี่วินาทีก่อนลองใหม่
+
+CONNECT_KWARGS = dict(
+    connect_timeout=10,
+    sslmode="require",
+    keepalives=1,
+    keepalives_idle=30,
+    keepalives_interval=10,
+    keepalives_count=5
+)
+
+# ======================
+# POOL STATE
+# ======================
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}   # id(conn) → time.monotonic() ตอนคืน pool
+
+_stats = {
+    "checkouts": 0,
+    "discarded": 0,
+    "connect_failures": 0,
+    "wait_total": 0.0,
+    "wait_max": 0.0,
+}
+_stats_lock = threading.Lock()
+
+# ใช้ร่วมกับ db_async (DB ตัวเดียวกัน ล่มก็ล่มพร้อมกัน)
+db_circuit = CircuitBreaker(
+    "DB",
+    failure_threshold=DB_CIRCUIT_FAILURES,
+    reset_timeout=DB_CIRCUIT_RESET
+)
+
+
+def _get_pool():
+    global _pool
+
+    if _pool is not None:
+        return _pool
+
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL not set")
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = pg_pool.ThreadedConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
+                DATABASE_URL,
+                **CONNECT_KWARGS
+            )
+            print(f"🏊 DB pool ready (min={DB_POOL_MIN}, max={DB_POOL_MAX})")
+
+    return _pool
+
+
+def _is_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+
+    idle = time.monotonic() - _last_used.get(id(conn), 0)
+    if idle < DB_POOL_CHECK_IDLE:
+        return True
+
+    # ว่างนาน → ping ก่อน กัน Railway ตัด connection ทิ้ง
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard(pool, conn):
+    _last_used.pop(id(conn), None)
+    try:
+        pool.putconn(conn, close=True)
+    except Exception:
+        pass
+
+    with _stats_lock:
+        _stats["discarded"] += 1
+
+
+def _checkout(retries, delay):
+    # DB ล่มอยู่แล้ว → fail ทันที ไม่ต้องรอ connect timeout ทุก thread
+    db_circuit.allow()
+    connect_failed = False
+
+    for attempt in range(retries):
+        try:
+            pool = _get_pool()
+            conn = pool.getconn()
+        except psycopg2.OperationalError as e:
+            with _stats_lock:
+                _stats["connect_failures"] += 1
+            print(f"⚠️ DB connect failed (attempt {attempt+1}/{retries}):", e)
+
+            connect_failed = True
+            db_circuit.record_failure(e)
+            if db_circuit.state == "open":
+                raise CircuitOpenError("DB circuit open") from e
+
+            # รันใน worker thread เท่านั้น (ไม่ใช่ event loop) / jitter กัน retry พร้อมกัน
+            if attempt < retries - 1:
+                time.sleep(backoff_delay(attempt, base=delay))
+            continue
+
+        if _is_healthy(conn):
+            db_circuit.record_success()
+            return conn
+
+        print("♻️ Drop dead pooled connection")
+        _discard(pool, conn)
+
+    error = RuntimeError("❌ Database connection failed after retries")
+    if not connect_failed:
+        # ได้แต่ connection ตายทุกรอบ → นับเป็น 1 ครั้ง
+        db_circuit.record_failure(error)
+    raise error
+
+
+@contextmanager
+def get_conn(retries=3, delay=2):
+    """
+    ยืม connection จาก pool (ใช้แทน psycopg2.connect เดิม)
+    commit เมื่อจบ block / rollback เมื่อ error แล้วคืน pool ทุกครั้ง
+    """
+    started = time.monotonic()
+    if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise RuntimeError("❌ DB pool exhausted")
+
+    waited = time.monotonic() - started
+
+    try:
+        conn = _checkout(retries, delay)
+    except Exception:
+        _slots.release()
+        raise
+
+    with _stats_lock:
+        _stats["checkouts"] += 1
+        _stats["wait_total"] += waited
+        _stats["wait_max"] = max(_stats["wait_max"], waited)
+
+    pool = _get_pool()
+    broken = False
+
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        raise
+    finally:
+        if broken or conn.closed:
+            _discard(pool, conn)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn)
+        _slots.release()
+
+
+def pool_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+
+    in_use = len(_pool._used) if _pool else 0
+    idle = len(_pool._pool) if _pool else 0
+    checkouts = stats["checkouts"]
+
+    return {
+        "min": DB_POOL_MIN,
+        "max": DB_POOL_MAX,
+        "in_use": in_use,
+        "idle": idle,
+        "checkouts": checkouts,
+        "discarded": stats["discarded"],
+        "connect_failures": stats["connect_failures"],
+        "avg_wait_ms": (stats["wait_total"] / checkouts * 1000) if checkouts else 0.0,
+        "max_wait_ms": stats["wait_max"] * 1000,
+    }
+
+
+def close_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+            print("🏊 DB pool closed")
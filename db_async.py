@@ -0,0 +1,216 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from circuit import backoff_delay
+from db import DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, db_circuit
+
+# ======================
+# CONFIG
+# ======================
+DB_STATEMENT_TIMEOUT = float(os.getenv("DB_STATEMENT_TIMEOUT", "10"))   # วินาที ต่อ statement
+
+# เผื่อเวลาให้ server ส่ง error statement_timeout กลับมาก่อนฝั่ง client ตัดเอง
+CLIENT_TIMEOUT_GRACE = 2
+
+DB_RETRIES = int(os.getenv("DB_RETRIES", "3"))   # ครั้งที่ลองได้ เมื่อ error เป็นปัญหา connection
+
+# error ที่แปลว่า "ต่อ DB ไม่ได้" (นับเข้า circuit breaker / retry ได้)
+# error อื่น เช่น SQL ผิด / unique violation แปลว่า DB ยังตอบอยู่
+CONNECT_ERRORS = (
+    psycopg.OperationalError,
+    asyncio.TimeoutError,
+    OSError,
+)
+
+# ลองใหม่ได้ทั้งหมด / PoolTimeout ตอน pool เต็ม = คนใช้เยอะ ไม่ใช่ DB ล่ม (ไม่นับเข้า circuit)
+TRANSIENT_ERRORS = CONNECT_ERRORS + (PoolTimeout,)
+
+CONNECT_KWARGS = dict(
+    connect_timeout=10,
+    sslmode="require",
+    keepalives=1,
+    keepalives_idle=30,
+    keepalives_interval=10,
+    keepalives_count=5,
+    options=f"-c statement_timeout={int(DB_STATEMENT_TIMEOUT * 1000)}"
+)
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+# ======================
+# POOL
+# ======================
+async def get_pool() -> AsyncConnectionPool:
+    global _pool
+
+    if _pool is not None:
+        return _pool
+
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL not set")
+
+    async with _pool_lock:
+        if _pool is None:
+            pool = AsyncConnectionPool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN,
+                max_size=DB_POOL_MAX,
+                timeout=DB_POOL_TIMEOUT,
+                kwargs=CONNECT_KWARGS,
+                check=AsyncConnectionPool.check_connection,
+                open=False
+            )
+            await pool.open()
+            _pool = pool
+            print(f"🏊 Async DB pool ready (min={DB_POOL_MIN}, max={DB_POOL_MAX})")
+
+    return _pool
+
+
+async def close_pool():
+    global _pool
+
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        print("🏊 Async DB pool closed")
+
+
+def pool_stats() -> dict:
+    if _pool is None:
+        return {}
+    return _pool.get_stats()
+
+
+# ======================
+# QUERY HELPERS
+# ======================
+def _pool_saturated(pool) -> bool:
+    """connection ครบ max แล้วทุกตัวถูกยืมอยู่ → รอคิว (ถ้ายังไม่ครบ max แปลว่าเปิด connection ใหม่ไม่ได้)"""
+    stats = pool.get_stats()
+    return stats.get("pool_size", 0) >= pool.max_size and not stats.get("pool_available", 0)
+
+
+async def _acquire(pool):
+    """ยืม connection / ลองใหม่แบบ backoff + jitter (await → ไม่บล็อก event loop)"""
+    for attempt in range(DB_RETRIES):
+        try:
+            return await pool.getconn()
+        except PoolTimeout as e:
+            if not _pool_saturated(pool):
+                db_circuit.record_failure(e)
+            elif attempt < DB_RETRIES - 1:
+                # backpressure: DB ปกติ แค่ connection ไม่พอ → รอแล้วต่อคิวใหม่
+                print(f"⚠️ Async DB pool busy (attempt {attempt+1}/{DB_RETRIES}), waiting")
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            if attempt == DB_RETRIES - 1 or db_circuit.state == "open":
+                raise
+
+            print(f"⚠️ Async DB connect failed (attempt {attempt+1}/{DB_RETRIES}):", e)
+            await asyncio.sleep(backoff_delay(attempt))
+        except CONNECT_ERRORS as e:
+            db_circuit.record_failure(e)
+            if attempt == DB_RETRIES - 1 or db_circuit.state == "open":
+                raise
+
+            print(f"⚠️ Async DB connect failed (attempt {attempt+1}/{DB_RETRIES}):", e)
+            await asyncio.sleep(backoff_delay(attempt))
+
+
+@asynccontextmanager
+async def transaction(timeout=None, probe=False):
+    """
+    เปิด transaction เดียว คืน cursor
+    commit เมื่อจบ block / rollback เมื่อ error
+    timeout = statement timeout (วินาที) เฉพาะ transaction นี้
+    probe = ข้าม circuit breaker (ใช้กับ health check เพื่อเช็คว่า DB กลับมาหรือยัง)
+    """
+    if not probe:
+        db_circuit.allow()
+
+    try:
+        pool = await get_pool()
+    except CONNECT_ERRORS as e:
+        db_circuit.record_failure(e)
+        raise
+
+    conn = await _acquire(pool)
+
+    try:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                if timeout is not None and timeout != DB_STATEMENT_TIMEOUT:
+                    await cur.execute(
+                        "SELECT set_config('statement_timeout', %s, true)",
+                        (str(int(timeout * 1000)),)
+                    )
+                yield cur
+    except CONNECT_ERRORS as e:
+        db_circuit.record_failure(e)
+        raise
+    except asyncio.CancelledError:
+        # ถูกยกเลิกจากข้างนอก (เช่นบอทปิด) → ไม่ได้บอกอะไรเรื่อง DB
+        raise
+    except Exception:
+        # error จาก SQL / โค้ดใน block → DB ยังตอบอยู่
+        db_circuit.record_success()
+        raise
+    else:
+        db_circuit.record_success()
+    finally:
+        await pool.putconn(conn)
+
+
+async def _run(sql, params, timeout, fetch_mode, probe=False):
+    async def statement(cur):
+        await cur.execute(sql, params)
+
+        if fetch_mode == "all":
+            return await cur.fetchall()
+        if fetch_mode == "one":
+            return await cur.fetchone()
+        return cur.rowcount
+
+    limit = (timeout if timeout is not None else DB_STATEMENT_TIMEOUT)
+
+    # อ่านอย่างเดียว → connection หลุดกลางทาง ลองใหม่ได้ปลอดภัย
+    retries = DB_RETRIES if fetch_mode != "rowcount" else 1
+
+    for attempt in range(retries):
+        try:
+            async with transaction(timeout, probe=probe) as cur:
+                # จับเวลาเฉพาะ statement หลังได้ connection แล้ว (การรอ pool มี backoff ของ _acquire เอง)
+                # หมดเวลา → TimeoutError เกิดใน block → transaction นับเข้า circuit ให้
+                return await asyncio.wait_for(statement(cur), limit + CLIENT_TIMEOUT_GRACE)
+        except TRANSIENT_ERRORS as e:
+            # PoolTimeout มาจาก _acquire ที่ลองครบรอบของมันแล้ว → ไม่วนซ้ำอีกชั้น
+            if isinstance(e, PoolTimeout) or attempt == retries - 1 or db_circuit.state == "open":
+                raise
+
+            print(f"⚠️ Async DB query failed (attempt {attempt+1}/{retries}):", e)
+            await asyncio.sleep(backoff_delay(attempt))
+
+
+async def fetch(sql, params=None, timeout=None) -> list:
+    return await _run(sql, params, timeout, "all")
+
+
+async def fetchrow(sql, params=None, timeout=None):
+    return await _run(sql, params, timeout, "one")
+
+
+async def fetchval(sql, params=None, timeout=None, probe=False):
+    row = await _run(sql, params, timeout, "one", probe=probe)
+    return row[0] if row else None
+
+
+async def execute(sql, params=None, timeout=None) -> int:
+    return await _run(sql, params, timeout, "rowcount")
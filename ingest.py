@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+# ======================
+# CONFIG
+# ======================
+INGEST_MAX_PENDING = 500      # จำนวนโพสที่รอได้สูงสุด (เกินนี้ put() ต้องรอ)
+INGEST_BATCH_ROWS = 200       # flush เมื่อสะสมครบกี่ row
+INGEST_FLUSH_INTERVAL = 1.0   # หรือเมื่อครบกี่วินาทีนับจากโพสแรกของ batch
+INGEST_STOP_TIMEOUT = 15      # ตอนปิดบอท รอ flush ที่ค้างได้นานสุด
+
+
+class CaseIngestQueue:
+    """
+    คิวบันทึกเคสแบบ write-behind
+    รวมหลายโพสเป็น batch เดียวแล้วส่งให้ flush(batch) ทีเดียว
+    คิวเต็ม → put() รอ (backpressure) แทนการสร้าง task ไม่จำกัด
+    """
+
+    def __init__(
+        self,
+        flush,
+        max_pending=INGEST_MAX_PENDING,
+        batch_rows=INGEST_BATCH_ROWS,
+        flush_interval=INGEST_FLUSH_INTERVAL
+    ):
+        self._flush = flush
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self._task = None
+
+        self._stats = {
+            "enqueued": 0,
+            "backpressure_waits": 0,
+            "batches": 0,
+            "rows": 0,
+            "failures": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    # ======================
+    # PRODUCER
+    # ======================
+    async def put(self, message_id, rows):
+        if not rows:
+            return
+
+        if self._queue.full():
+            self._stats["backpressure_waits"] += 1
+            print(f"⏳ Ingest queue full, waiting | msg={message_id}")
+
+        await self._queue.put((message_id, rows))
+        self._stats["enqueued"] += 1
+
+    async def join(self):
+        """รอจนทุกโพสในคิวถูก flush แล้ว (ใช้ก่อน edit/delete กันลำดับสลับ)"""
+        await self._queue.join()
+
+    # ======================
+    # LIFECYCLE
+    # ======================
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            print("📥 Case ingest queue started")
+
+    async def stop(self, timeout=INGEST_STOP_TIMEOUT):
+        if self._task is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Ingest queue stop timeout, pending={self._queue.qsize()}")
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self._task = None
+        print("📥 Case ingest queue stopped")
+
+    # ======================
+    # CONSUMER
+    # ======================
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            first = await self._queue.get()
+            batch = [first]
+            rows = len(first[1])
+            deadline = loop.time() + self.flush_interval
+
+            while rows < self.batch_rows:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+                batch.append(item)
+                rows += len(item[1])
+
+            await self._flush_batch(batch, rows)
+
+    async def _flush_batch(self, batch, rows):
+        started = time.perf_counter()
+
+        try:
+            await self._flush(batch)
+            self._stats["batches"] += 1
+            self._stats["rows"] += rows
+        except Exception as e:
+            self._stats["failures"] += 1
+            print(f"❌ Ingest flush error ({len(batch)} posts):", e)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self._stats["last_flush_ms"] = elapsed
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed)
+            self._stats["total_flush_ms"] += elapsed
+
+            for _ in batch:
+                self._queue.task_done()
+
+    # ======================
+    # METRICS
+    # ======================
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        flushes = stats["batches"] + stats["failures"]
+
+        stats["depth"] = self._queue.qsize()
+        stats["max_pending"] = self._queue.maxsize
+        stats["avg_flush_ms"] = (stats["total_flush_ms"] / flushes) if flushes else 0.0
+        return stats
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+
+import psycopg
+
+import db_async
+from db import DATABASE_URL
+
+# ======================
+# CONFIG
+# ======================
+BOT_META_CHANNEL = "bot_meta_changed"
+
+# เปิด LISTEN/NOTIFY เมื่อรันมากกว่า 1 instance (เช่นช่วง deploy ซ้อนกัน)
+BOT_META_LISTEN = os.getenv("BOT_META_LISTEN", "0") == "1"
+
+# key → type ของค่า (bot_meta เก็บเป็น text ทั้งหมด)
+BOT_META_KEYS = {
+    "dashboard_message_id": int,
+    "weekly_ranking_message_id": int,
+    "body_dashboard_message_id": int,
+    "last_daily_report": str,
+    "body_last_synced": str,
+    "last_online": datetime,
+    "last_checked_message_time": datetime,
+}
+
+
+class BotMetaStore:
+    """
+    cache ของตาราง bot_meta ในหน่วยความจำ
+    โหลดครั้งเดียวตอนเริ่ม / อ่านจาก memory / เขียนผ่านลง DB ทันที (write-through)
+    """
+
+    def __init__(self, default_tz):
+        self.default_tz = default_tz
+        self.instance_id = uuid.uuid4().hex
+        self._values = {}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._listen_task = None
+
+    # ======================
+    # (DE)SERIALIZE
+    # ======================
+    def _parse(self, key, raw):
+        if raw is None:
+            return None
+
+        kind = BOT_META_KEYS.get(key, str)
+
+        if kind is int:
+            return int(raw)
+
+        if kind is datetime:
+            dt = datetime.fromisoformat(raw)
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=self.default_tz)
+            return dt
+
+        return raw
+
+    @staticmethod
+    def _dump(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return str(value)
+
+    # ======================
+    # LOAD / READ
+    # ======================
+    async def load(self):
+        rows = await db_async.fetch(
+            "SELECT key, value FROM bot_meta WHERE key = ANY(%s)",
+            (list(BOT_META_KEYS),)
+        )
+
+        self._values = {key: self._parse(key, raw) for key, raw in rows}
+        self._loaded = True
+        print(f"🗂️ bot_meta loaded ({len(self._values)} keys)")
+
+    async def ensure_loaded(self):
+        if self._loaded:
+            return
+
+        # DB ล่มตอนบูต → ลองโหลดใหม่ตอนมีคนอ่านครั้งถัดไป
+        async with self._load_lock:
+            if not self._loaded:
+                await self.load()
+
+    async def get(self, key):
+        await self.ensure_loaded()
+        return self._values.get(key)
+
+    # ======================
+    # WRITE-THROUGH
+    # ======================
+    async def set(self, key, value):
+        raw = self._dump(value)
+        payload = json.dumps({
+            "key": key,
+            "value": raw,
+            "origin": self.instance_id
+        })
+
+        async with db_async.transaction() as cur:
+            await cur.execute("""
+                INSERT INTO bot_meta (key, value)
+                VALUES (%s, %s)
+                ON CONFLICT (key)
+                DO UPDATE SET value = EXCLUDED.value
+            """, (key, raw))
+
+            # ส่งตอน commit เท่านั้น (instance อื่นจะไม่เห็นค่าที่ rollback)
+            await cur.execute(
+                "SELECT pg_notify(%s, %s)",
+                (BOT_META_CHANNEL, payload)
+            )
+
+        self._values[key] = self._parse(key, raw)
+
+    # ======================
+    # CHANGE NOTIFICATION
+    # ======================
+    def start_listener(self):
+        if not BOT_META_LISTEN:
+            return
+
+        if self._listen_task is None or self._listen_task.done():
+            self._listen_task = asyncio.create_task(self._listen())
+
+    async def stop_listener(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+            self._listen_task = None
+
+    async def _listen(self):
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    DATABASE_URL,
+                    autocommit=True,
+                    **db_async.CONNECT_KWARGS
+                ) as conn:
+                    await conn.execute(f"LISTEN {BOT_META_CHANNEL}")
+                    print("👂 bot_meta listener started")
+
+                    # เผื่อพลาด notify ช่วงที่หลุด → โหลดใหม่ทั้งก้อน
+                    await self.load()
+
+                    async for notify in conn.notifies():
+                        self._apply_notify(notify.payload)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("⚠️ bot_meta listener error, retry in 30s:", e)
+                await asyncio.sleep(30)
+
+    def _apply_notify(self, payload):
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return
+
+        if data.get("origin") == self.instance_id:
+            return
+
+        key = data.get("key")
+        if key not in BOT_META_KEYS:
+            return
+
+        self._values[key] = self._parse(key, data.get("value"))
+        print(f"🔔 bot_meta changed by other instance | {key}")
@@ -0,0 +1,287 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import db_async
+from names import normalize_name
+from officers import (
+    OFFICERS_SCHEMA_SQL,
+    OFFICERS_INDEXES_SQL,
+    REKEY_CASES_SQL,
+    REKEY_ROLLUP_SQL,
+    backfill_legacy_officers,
+    drop_legacy_name_unique,
+)
+from rollup import create_rollup_tables
+from sheet_outbox import SHEET_OUTBOX_SCHEMA_SQL
+
+# ======================
+# SCHEMA MIGRATIONS
+# ======================
+# รันตอนบอทเริ่ม (setup_hook) เรียงตาม version
+# แต่ละ version = 1 transaction / บันทึกลง schema_migrations เมื่อสำเร็จ
+# step เป็นได้ทั้ง SQL (str) หรือ async function(cur)
+# ห้ามแก้ migration ที่ deploy ไปแล้ว → เพิ่ม version ใหม่เสมอ
+
+MIGRATION_LOCK_KEY = 72_460_001   # pg_advisory_xact_lock กัน 2 instance รันพร้อมกัน
+
+BASELINE_SQL = """
+    CREATE TABLE IF NOT EXISTS cases (
+        id          SERIAL PRIMARY KEY,
+        date        DATE    NOT NULL,
+        name        TEXT    NOT NULL,
+        channel     TEXT,
+        case_type   TEXT    NOT NULL DEFAULT 'normal',
+        cases       INTEGER NOT NULL DEFAULT 1,
+        message_id  TEXT    NOT NULL,
+        is_uphill   BOOLEAN NOT NULL DEFAULT FALSE,
+        is_deleted  BOOLEAN NOT NULL DEFAULT FALSE,
+        UNIQUE (message_id, name)
+    );
+
+    CREATE TABLE IF NOT EXISTS bot_meta (
+        key    TEXT PRIMARY KEY,
+        value  TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS audit_logs (
+        id          SERIAL PRIMARY KEY,
+        action      TEXT NOT NULL,
+        actor       TEXT,
+        target      TEXT,
+        channel     TEXT,
+        message_id  TEXT,
+        detail      TEXT,
+        created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS body_case_daily (
+        work_date    DATE PRIMARY KEY,
+        start_time   TIMESTAMPTZ,
+        end_time     TIMESTAMPTZ,
+        chub_posts   INTEGER NOT NULL DEFAULT 0,
+        wrap_posts   INTEGER NOT NULL DEFAULT 0,
+        total_posts  INTEGER NOT NULL DEFAULT 0,
+        synced_at    TIMESTAMPTZ
+    );
+"""
+
+HOT_INDEXES_SQL = """
+    -- สรุปรายวัน / refresh rollup: WHERE date = ... AND is_deleted = FALSE
+    CREATE INDEX IF NOT EXISTS idx_cases_live_date
+        ON cases (date, name, case_type)
+        WHERE is_deleted = FALSE;
+
+    -- audit export: ช่วงเวลา created_at
+    CREATE INDEX IF NOT EXISTS idx_audit_logs_created_at
+        ON audit_logs (created_at);
+"""
+
+TRGM_INDEX_SQL = """
+    -- !check / !checkdate: name ILIKE '%x%'
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+    CREATE INDEX IF NOT EXISTS idx_cases_name_trgm
+        ON cases USING gin (name gin_trgm_ops)
+        WHERE is_deleted = FALSE;
+"""
+
+NORM_NAME_COLUMNS_SQL = """
+    ALTER TABLE cases ADD COLUMN IF NOT EXISTS norm_name TEXT;
+    ALTER TABLE case_daily_rollup ADD COLUMN IF NOT EXISTS norm_name TEXT;
+"""
+
+NORM_NAME_INDEXES_SQL = """
+    -- sheet sync / embed เรียงชื่อ: GROUP BY / ORDER BY norm_name ของวัน
+    CREATE INDEX IF NOT EXISTS idx_cases_live_norm_name
+        ON cases (date, norm_name)
+        WHERE is_deleted = FALSE;
+
+    CREATE INDEX IF NOT EXISTS idx_case_daily_rollup_norm_name
+        ON case_daily_rollup (date, norm_name);
+"""
+
+
+async def backfill_norm_names(cur):
+    """
+    เติม norm_name ของ row เดิม ด้วยกติกาเดียวกับตอน insert (names.normalize_name)
+    คำนวณต่อชื่อไม่ซ้ำ แล้ว UPDATE ทีเดียวผ่าน unnest
+    """
+    await cur.execute("""
+        SELECT name FROM cases WHERE norm_name IS NULL
+        UNION
+        SELECT name FROM case_daily_rollup WHERE norm_name IS NULL
+    """)
+    names = [row[0] for row in await cur.fetchall()]
+    if not names:
+        return
+
+    norms = [normalize_name(name) for name in names]
+
+    for table in ("cases", "case_daily_rollup"):
+        await cur.execute(f"""
+            UPDATE {table} t
+            SET norm_name = v.norm_name
+            FROM unnest(%s::text[], %s::text[]) AS v(name, norm_name)
+            WHERE t.name = v.name
+              AND t.norm_name IS NULL
+        """, (names, norms))
+
+    print(f"🔤 norm_name backfilled for {len(names)} names")
+
+
+MIGRATIONS = [
+    (1, "baseline tables", [BASELINE_SQL]),
+    (2, "case daily rollup", [create_rollup_tables]),
+    (3, "hot query indexes", [HOT_INDEXES_SQL]),
+    (4, "pg_trgm name search", [TRGM_INDEX_SQL]),
+    (5, "persisted norm_name", [
+        NORM_NAME_COLUMNS_SQL,
+        backfill_norm_names,
+        NORM_NAME_INDEXES_SQL,
+    ]),
+    (6, "officer identity", [
+        OFFICERS_SCHEMA_SQL,
+        backfill_legacy_officers,
+        OFFICERS_INDEXES_SQL,
+    ]),
+    (7, "sheet write outbox", [SHEET_OUTBOX_SCHEMA_SQL]),
+    (8, "key cases and rollup by officer", [
+        # row ที่ยังไม่มี officer_id (ถ้ามี) ต้องได้ officer ก่อนตั้ง NOT NULL
+        backfill_legacy_officers,
+        REKEY_CASES_SQL,
+        drop_legacy_name_unique,
+        REKEY_ROLLUP_SQL,
+    ]),
+]
+
+
+async def run_migrations():
+    async with db_async.transaction() as cur:
+        await cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version     INTEGER PRIMARY KEY,
+                name        TEXT NOT NULL,
+                applied_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """)
+
+    for version, name, steps in MIGRATIONS:
+        # index / backfill อาจนานกว่า statement timeout ปกติ
+        async with db_async.transaction(timeout=300) as cur:
+            await cur.execute(
+                "SELECT pg_advisory_xact_lock(%s)",
+                (MIGRATION_LOCK_KEY,)
+            )
+            await cur.execute(
+                "SELECT 1 FROM schema_migrations WHERE version = %s",
+                (version,)
+            )
+            if await cur.fetchone():
+                continue
+
+            for step in steps:
+                if callable(step):
+                    await step(cur)
+                else:
+                    await cur.execute(step)
+
+            await cur.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+            print(f"🧱 Migration {version} applied: {name}")
+
+
+# ======================
+# QUERY PLAN REPORT
+# ======================
+# query หลักที่ควรใช้ index → ใช้กับ !dbplan ดูว่า planner เลือก index ไหน
+def _hot_queries():
+    today = datetime.now(timezone(timedelta(hours=7))).date()
+
+    return [
+        (
+            "cases ของวัน (date + is_deleted)",
+            """
+            SELECT name, case_type, SUM(cases) FROM cases
+            WHERE date = %s AND is_deleted = FALSE
+            GROUP BY name, case_type
+            """,
+            (today,)
+        ),
+        (
+            "หาโพสด้วย message_id",
+            "SELECT 1 FROM cases WHERE message_id = %s LIMIT 1",
+            ("0",)
+        ),
+        (
+            "!check ชื่อ (ILIKE → officer_id)",
+            """
+            SELECT officer_id, case_type, COUNT(*) FROM cases
+            WHERE date = %s AND is_deleted = FALSE
+              AND officer_id IN (
+                  SELECT officer_id FROM officer_names WHERE name ILIKE %s
+                  UNION
+                  SELECT id FROM officers WHERE norm_name ILIKE %s
+              )
+            GROUP BY officer_id, case_type
+            """,
+            (today, "%lion%", "%lion%")
+        ),
+        (
+            "rollup รายวัน",
+            "SELECT name, case_type, posts, cases FROM case_daily_rollup WHERE date = %s",
+            (today,)
+        ),
+        (
+            "audit export ช่วงวัน",
+            """
+            SELECT action FROM audit_logs
+            WHERE created_at >= %s::date
+              AND created_at < %s::date + 1
+            ORDER BY created_at ASC
+            """,
+            (today - timedelta(days=30), today)
+        ),
+    ]
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _summarize_plan(plan):
+    used = []
+    for node in _plan_nodes(plan):
+        node_type = node.get("Node Type", "")
+        relation = node.get("Relation Name")
+
+        if node.get("Index Name"):
+            used.append(f"{node_type} → {node['Index Name']}")
+        elif node_type == "Seq Scan" and relation:
+            used.append(f"Seq Scan → {relation}")
+
+    return used
+
+
+async def explain_hot_queries() -> list:
+    """คืน [(label, [index/scan ที่ใช้])] ของ query หลักแต่ละตัว"""
+    report = []
+
+    for label, sql, params in _hot_queries():
+        try:
+            row = await db_async.fetchrow(
+                "EXPLAIN (FORMAT JSON) " + sql,
+                params
+            )
+            plan = row[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+
+            report.append((label, _summarize_plan(plan[0]["Plan"])))
+        except Exception as e:
+            report.append((label, [f"❌ {e}"]))
+
+    return report
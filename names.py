@@ -0,0 +1,26 @@
+import re
+
+# ======================
+# NAME NORMALIZE (กติกาเดียวทั้งระบบ)
+# ======================
+# ใช้ทั้งตอนบันทึก cases.norm_name, ตอนสร้าง name→row map ของชีท
+# และตอนเรียงชื่อใน embed → ชื่อฝั่ง DB กับฝั่งชีทจับคู่กันได้เสมอ
+#   "+12 [SWAT]  Lion  Kuryu" → "lion kuryu"
+
+
+def normalize_name(name: str) -> str:
+    if not name:
+        return ""
+
+    name = name.lower()
+
+    # ลบ +เลขหน้า / เลขที่ติดมากับชื่อ
+    name = re.sub(r"\+?\d+", "", name)
+
+    # ลบ tag [xxx]
+    name = re.sub(r"\[.*?\]", "", name)
+
+    # เปลี่ยน whitespace ทุกชนิด → space เดียว
+    name = re.sub(r"\s+", " ", name)
+
+    return name.strip()
@@ -0,0 +1,242 @@
+# ======================
+# OFFICER IDENTITY
+# ======================
+# ตัวตนเจ้าหน้าที่ผูกกับ Discord user ID (ไม่ใช่ display name)
+#   officers       : id (int) ↔ discord_id + ชื่อล่าสุด + sheet_name
+#   officer_names  : ประวัติชื่อที่เคยใช้
+# cases / case_daily_rollup อ้างอิง officers.id → เปลี่ยนชื่อ/ใส่ +เลข แล้วสถิติไม่แตก
+
+OFFICERS_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS officers (
+        id            SERIAL PRIMARY KEY,
+        discord_id    BIGINT UNIQUE,          -- NULL = ข้อมูลเก่าก่อนมี discord id
+        display_name  TEXT NOT NULL,
+        norm_name     TEXT,
+        sheet_name    TEXT,                   -- key ที่ใช้หาแถวในชีท (ไม่เปลี่ยนตามชื่อเล่น)
+        created_at    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        updated_at    TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS officer_names (
+        officer_id  INTEGER NOT NULL REFERENCES officers(id),
+        name        TEXT    NOT NULL,
+        first_seen  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        last_seen   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (officer_id, name)
+    );
+
+    ALTER TABLE cases ADD COLUMN IF NOT EXISTS officer_id INTEGER REFERENCES officers(id);
+    ALTER TABLE case_daily_rollup ADD COLUMN IF NOT EXISTS officer_id INTEGER;
+"""
+
+OFFICERS_INDEXES_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_officers_legacy_norm_name
+        ON officers (norm_name)
+        WHERE discord_id IS NULL;
+
+    CREATE INDEX IF NOT EXISTS idx_cases_live_officer
+        ON cases (officer_id, date)
+        WHERE is_deleted = FALSE;
+
+    CREATE INDEX IF NOT EXISTS idx_case_daily_rollup_officer
+        ON case_daily_rollup (date, officer_id);
+"""
+
+# ======================
+# KEY BY OFFICER (migration 8)
+# ======================
+# cases: UNIQUE (message_id, officer_id) แทน (message_id, name)
+# case_daily_rollup: PK (date, officer_id, case_type) / name เป็นแค่ชื่อที่แสดง
+# → 2 คนชื่อเล่นเหมือนกันในโพส/วันเดียวกัน ไม่ถูกรวมเป็นคนเดียว
+
+REKEY_CASES_SQL = """
+    -- officer เดียวกันซ้ำในโพสเดียว (ชื่อดิบต่างกันแต่ normalize แล้วตรงกัน)
+    -- → เก็บ row ที่ยังไม่ถูกลบ / ล่าสุด
+    DELETE FROM cases
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT
+                id,
+                ROW_NUMBER() OVER (
+                    PARTITION BY message_id, officer_id
+                    ORDER BY is_deleted, id DESC
+                ) AS rn
+            FROM cases
+        ) dup
+        WHERE rn > 1
+    );
+
+    ALTER TABLE cases ALTER COLUMN officer_id SET NOT NULL;
+    ALTER TABLE cases
+        ADD CONSTRAINT cases_message_id_officer_id_key UNIQUE (message_id, officer_id);
+"""
+
+REKEY_ROLLUP_SQL = """
+    DELETE FROM case_daily_rollup;
+
+    ALTER TABLE case_daily_rollup DROP CONSTRAINT IF EXISTS case_daily_rollup_pkey;
+    ALTER TABLE case_daily_rollup ALTER COLUMN officer_id SET NOT NULL;
+    ALTER TABLE case_daily_rollup ADD PRIMARY KEY (date, officer_id, case_type);
+
+    INSERT INTO case_daily_rollup
+        (date, officer_id, case_type, name, norm_name,
+         cases, posts, uphill_cases, uphill_posts)
+    SELECT
+        date,
+        officer_id,
+        case_type,
+        (array_agg(name ORDER BY id DESC))[1],
+        (array_agg(norm_name ORDER BY id DESC))[1],
+        SUM(cases),
+        COUNT(*),
+        COALESCE(SUM(cases) FILTER (WHERE is_uphill = TRUE), 0),
+        COUNT(*) FILTER (WHERE is_uphill = TRUE)
+    FROM cases
+    WHERE is_deleted = FALSE
+    GROUP BY date, officer_id, case_type;
+"""
+
+# unique เดิมบน (message_id, name) → ชื่อ constraint/index ขึ้นกับว่า DB ถูกสร้างมายังไง
+# หาจาก catalog แทนการเดาชื่อ
+NAME_UNIQUE_COLUMNS_SQL = """
+    (SELECT array_agg(a.attname::text ORDER BY a.attname)
+     FROM pg_attribute a
+     WHERE a.attrelid = 'cases'::regclass
+       AND a.attnum = ANY({keys})) = ARRAY['message_id', 'name']
+"""
+
+
+async def drop_legacy_name_unique(cur):
+    """ลบ unique constraint / unique index ทุกตัวที่อยู่บน (message_id, name) พอดี"""
+    await cur.execute(f"""
+        SELECT quote_ident(con.conname)
+        FROM pg_constraint con
+        WHERE con.conrelid = 'cases'::regclass
+          AND con.contype = 'u'
+          AND {NAME_UNIQUE_COLUMNS_SQL.format(keys="con.conkey")}
+    """)
+    for (name,) in await cur.fetchall():
+        await cur.execute(f"ALTER TABLE cases DROP CONSTRAINT {name}")
+        print(f"🧹 dropped constraint {name}")
+
+    # unique index ที่สร้างเอง (ไม่ได้มาจาก constraint)
+    await cur.execute(f"""
+        SELECT i.indexrelid::regclass::text
+        FROM pg_index i
+        WHERE i.indrelid = 'cases'::regclass
+          AND i.indisunique
+          AND i.indnatts = 2
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid
+          )
+          AND {NAME_UNIQUE_COLUMNS_SQL.format(keys="i.indkey")}
+    """)
+    for (name,) in await cur.fetchall():
+        await cur.execute(f"DROP INDEX {name}")
+        print(f"🧹 dropped index {name}")
+
+
+# key ของเจ้าหน้าที่เก่า: norm_name (ถ้า normalize แล้วว่าง ใช้ชื่อดิบแทน)
+LEGACY_KEY = "COALESCE(NULLIF({t}.norm_name, ''), {t}.name)"
+
+
+async def backfill_legacy_officers(cur):
+    """
+    cases เก่าไม่มี discord id → สร้าง officer (discord_id = NULL) ต่อ 1 ชื่อ normalize
+    พอคนนั้นโพสครั้งถัดไป upsert_officers จะ "รับช่วง" officer นี้ให้ discord id ของเขา
+    """
+    key_c = LEGACY_KEY.format(t="c")
+
+    await cur.execute(f"""
+        INSERT INTO officers (display_name, norm_name, sheet_name)
+        SELECT DISTINCT ON ({key_c})
+            c.name,
+            {key_c},
+            {key_c}
+        FROM cases c
+        WHERE c.officer_id IS NULL
+        ORDER BY {key_c}, c.date DESC
+    """)
+
+    await cur.execute(f"""
+        UPDATE cases c
+        SET officer_id = o.id
+        FROM officers o
+        WHERE c.officer_id IS NULL
+          AND o.discord_id IS NULL
+          AND o.norm_name = {key_c}
+    """)
+
+    await cur.execute(f"""
+        UPDATE case_daily_rollup c
+        SET officer_id = o.id
+        FROM officers o
+        WHERE c.officer_id IS NULL
+          AND o.discord_id IS NULL
+          AND o.norm_name = {key_c}
+    """)
+
+    await cur.execute("""
+        INSERT INTO officer_names (officer_id, name, first_seen, last_seen)
+        SELECT officer_id, name, MIN(date), MAX(date)
+        FROM cases
+        WHERE officer_id IS NOT NULL
+        GROUP BY officer_id, name
+        ON CONFLICT DO NOTHING
+    """)
+
+    print("👮 legacy officers backfilled")
+
+
+async def upsert_officers(cur, members: dict) -> dict:
+    """
+    members = {discord_id: (display_name, norm_name)}
+    คืน {discord_id: officers.id}
+    ต้องเรียกใน transaction เดียวกับที่เขียน cases
+    """
+    if not members:
+        return {}
+
+    discord_ids = list(members)
+    names = [members[d][0] for d in discord_ids]
+    norms = [members[d][1] for d in discord_ids]
+
+    # 1️⃣ คนที่ยังไม่มี officer → รับช่วง officer เก่า (ชื่อ normalize ตรงกัน)
+    await cur.execute("""
+        UPDATE officers o
+        SET discord_id = v.discord_id,
+            updated_at = NOW()
+        FROM unnest(%s::bigint[], %s::text[]) AS v(discord_id, norm_name)
+        WHERE o.discord_id IS NULL
+          AND v.norm_name <> ''
+          AND o.norm_name = v.norm_name
+          AND NOT EXISTS (
+              SELECT 1 FROM officers x WHERE x.discord_id = v.discord_id
+          )
+    """, (discord_ids, norms))
+
+    # 2️⃣ upsert ชื่อล่าสุด (sheet_name ตั้งครั้งแรกครั้งเดียว)
+    await cur.execute("""
+        INSERT INTO officers (discord_id, display_name, norm_name, sheet_name)
+        SELECT discord_id, display_name, norm_name, norm_name
+        FROM unnest(%s::bigint[], %s::text[], %s::text[])
+            AS v(discord_id, display_name, norm_name)
+        ON CONFLICT (discord_id)
+        DO UPDATE SET
+            display_name = EXCLUDED.display_name,
+            norm_name = EXCLUDED.norm_name,
+            updated_at = NOW()
+        RETURNING discord_id, id
+    """, (discord_ids, names, norms))
+    officer_ids = dict(await cur.fetchall())
+
+    # 3️⃣ ประวัติชื่อ
+    await cur.execute("""
+        INSERT INTO officer_names (officer_id, name)
+        SELECT officer_id, name
+        FROM unnest(%s::int[], %s::text[]) AS v(officer_id, name)
+        ON CONFLICT (officer_id, name)
+        DO UPDATE SET last_seen = NOW()
+    """, ([officer_ids[d] for d in discord_ids], names))
+
+    return officer_ids
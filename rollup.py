@@ -0,0 +1,172 @@
+# ======================
+# CASE DAILY ROLLUP
+# ======================
+# สรุปรายวันที่อัปเดตพร้อมกับการเขียน cases (transaction เดียวกัน)
+#   case_daily_rollup : (date, officer_id, case_type) → name / norm_name (ชื่อล่าสุด ไว้แสดง) / cases / posts / uphill
+#   case_daily_posts  : (date, case_type) → จำนวนโพสไม่ซ้ำ (COUNT DISTINCT message_id)
+# คำสั่งสรุปอ่านจากตารางนี้แทนการ GROUP BY cases ทั้งวัน
+
+ROLLUP_LOCK_KEY = 72_460_002   # pg_advisory_xact_lock(key, hashtext(date)) ต่อวัน
+
+# transaction ที่แตะวันเดียวกัน (ingest flush / ลบ / แก้ / spool replay) ต้องคำนวณทีละอัน
+# READ COMMITTED: statement หลังได้ lock จะเห็นข้อมูลที่อีกฝั่ง commit แล้ว → ยอดไม่ทับกันด้วยค่าเก่า
+LOCK_ROLLUP_DATES_SQL = """
+    SELECT DISTINCT date
+    FROM cases
+    WHERE message_id = ANY(%s)
+    ORDER BY date
+"""
+
+ROLLUP_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS case_daily_rollup (
+        date          DATE    NOT NULL,
+        name          TEXT    NOT NULL,
+        case_type     TEXT    NOT NULL,
+        cases         INTEGER NOT NULL DEFAULT 0,
+        posts         INTEGER NOT NULL DEFAULT 0,
+        uphill_cases  INTEGER NOT NULL DEFAULT 0,
+        uphill_posts  INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (date, name, case_type)
+    );
+
+    CREATE TABLE IF NOT EXISTS case_daily_posts (
+        date       DATE    NOT NULL,
+        case_type  TEXT    NOT NULL,
+        posts      INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (date, case_type)
+    );
+"""
+
+ROLLUP_BACKFILL_SQL = """
+    INSERT INTO case_daily_rollup
+        (date, name, case_type, cases, posts, uphill_cases, uphill_posts)
+    SELECT
+        date,
+        name,
+        case_type,
+        SUM(cases),
+        COUNT(*),
+        COALESCE(SUM(cases) FILTER (WHERE is_uphill = TRUE), 0),
+        COUNT(*) FILTER (WHERE is_uphill = TRUE)
+    FROM cases
+    WHERE is_deleted = FALSE
+    GROUP BY date, name, case_type
+    ON CONFLICT DO NOTHING;
+
+    INSERT INTO case_daily_posts (date, case_type, posts)
+    SELECT date, case_type, COUNT(DISTINCT message_id)
+    FROM cases
+    WHERE is_deleted = FALSE
+    GROUP BY date, case_type
+    ON CONFLICT DO NOTHING;
+"""
+
+# คำนวณใหม่เฉพาะ key ที่โพสเหล่านี้แตะ
+# (date / officer_id / case_type ของ row เดิมไม่เปลี่ยน เพราะผูกกับโพสและคนที่ถูกแท็ก)
+# name / norm_name = ชื่อล่าสุดของ officer ในวันนั้น (ไว้แสดงเท่านั้น ไม่ใช่ key)
+REFRESH_ROLLUP_SQL = """
+    WITH keys AS (
+        SELECT DISTINCT date, officer_id, case_type
+        FROM cases
+        WHERE message_id = ANY(%s)
+    ),
+    agg AS (
+        SELECT
+            k.date,
+            k.officer_id,
+            k.case_type,
+            (array_agg(c.name ORDER BY c.id DESC))[1] AS name,
+            (array_agg(c.norm_name ORDER BY c.id DESC))[1] AS norm_name,
+            COALESCE(SUM(c.cases), 0) AS cases,
+            COUNT(c.message_id) AS posts,
+            COALESCE(SUM(c.cases) FILTER (WHERE c.is_uphill = TRUE), 0) AS uphill_cases,
+            COUNT(c.message_id) FILTER (WHERE c.is_uphill = TRUE) AS uphill_posts
+        FROM keys k
+        LEFT JOIN cases c
+          ON c.date = k.date
+         AND c.officer_id = k.officer_id
+         AND c.case_type = k.case_type
+         AND c.is_deleted = FALSE
+        GROUP BY k.date, k.officer_id, k.case_type
+    ),
+    upserted AS (
+        INSERT INTO case_daily_rollup
+            (date, officer_id, case_type, name, norm_name,
+             cases, posts, uphill_cases, uphill_posts)
+        SELECT date, officer_id, case_type, name, norm_name,
+               cases, posts, uphill_cases, uphill_posts
+        FROM agg
+        WHERE posts > 0
+        ON CONFLICT (date, officer_id, case_type)
+        DO UPDATE SET
+            name = EXCLUDED.name,
+            norm_name = EXCLUDED.norm_name,
+            cases = EXCLUDED.cases,
+            posts = EXCLUDED.posts,
+            uphill_cases = EXCLUDED.uphill_cases,
+            uphill_posts = EXCLUDED.uphill_posts
+    )
+    DELETE FROM case_daily_rollup r
+    USING agg
+    WHERE agg.posts = 0
+      AND r.date = agg.date
+      AND r.officer_id = agg.officer_id
+      AND r.case_type = agg.case_type;
+"""
+
+REFRESH_POSTS_SQL = """
+    WITH keys AS (
+        SELECT DISTINCT date, case_type
+        FROM cases
+        WHERE message_id = ANY(%s)
+    )
+    INSERT INTO case_daily_posts (date, case_type, posts)
+    SELECT
+        k.date,
+        k.case_type,
+        COUNT(DISTINCT c.message_id)
+    FROM keys k
+    LEFT JOIN cases c
+      ON c.date = k.date
+     AND c.case_type = k.case_type
+     AND c.is_deleted = FALSE
+    GROUP BY k.date, k.case_type
+    ON CONFLICT (date, case_type)
+    DO UPDATE SET posts = EXCLUDED.posts;
+"""
+
+
+async def create_rollup_tables(cur):
+    """
+    migration: สร้างตาราง rollup + เติมข้อมูลย้อนหลังครั้งแรกครั้งเดียว
+    (DB เก่าที่เคยสร้างตารางไว้แล้วจะไม่ backfill ซ้ำ)
+    """
+    await cur.execute("SELECT to_regclass('case_daily_rollup')")
+    exists = (await cur.fetchone())[0] is not None
+
+    await cur.execute(ROLLUP_SCHEMA_SQL)
+
+    if not exists:
+        await cur.execute(ROLLUP_BACKFILL_SQL)
+        print("📚 case_daily_rollup created + backfilled")
+
+
+async def refresh_rollup(cur, message_ids):
+    """
+    อัปเดต rollup ของโพสที่เพิ่งถูก insert / soft-delete / แก้ไข
+    ต้องเรียกด้วย cursor ของ transaction เดียวกับที่เขียน cases
+    """
+    ids = [str(m) for m in message_ids]
+    if not ids:
+        return
+
+    # lock ทีละวันตามลำดับ (หลายวันใน batch เดียวก็ไม่ deadlock กัน)
+    await cur.execute(LOCK_ROLLUP_DATES_SQL, (ids,))
+    for (day,) in await cur.fetchall():
+        await cur.execute(
+            "SELECT pg_advisory_xact_lock(%s::int, hashtext(%s::text))",
+            (ROLLUP_LOCK_KEY, day)
+        )
+
+    await cur.execute(REFRESH_ROLLUP_SQL, (ids,))
+    await cur.execute(REFRESH_POSTS_SQL, (ids,))
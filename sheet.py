@@ -2,7 +2,14 @@ import gspread
 import os
 import json
 import re
+import threading
+import time
 from google.oauth2.service_account import Credentials
+from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
+from gspread.utils import rowcol_to_a1
+
+from names import normalize_name
+from sheet_quota import SheetsScheduler
 
 # ======================
 # CONFIG
@@ -29,6 +36,17 @@ SCOPES = [
 BODY_HEADER_ROW = 5   # แถววันที่ (01/04)
 BODY_TOTAL_ROW = 6    # แถวรวมเคสอุ้ม/ชุบ
 
+# ======================
+# CACHE CONFIG
+# ======================
+WORKSHEET_INDEX_TTL = 600   # วินาที / รายชื่อ worksheet ไม่ค่อยเปลี่ยน (เพิ่มเดือนใหม่ = miss → โหลดใหม่เอง)
+
+# ชนิดชีท → คำที่ต้องมีในชื่อ worksheet
+SHEET_KINDS = {
+    "case": "เวลาและเคส",
+    "body": "รายชื่อร่วมเคสอุ้ม",
+}
+
 THAI_MONTHS = {
     1: "มกราคม",
     2: "กุมภาพันธ์",
@@ -44,35 +62,149 @@ THAI_MONTHS = {
     12: "ธันวาคม",
 }
 
+# ทุก call ไป Sheets API ผ่าน scheduler ตัวเดียว (quota / retry / latency)
+sheet_scheduler = SheetsScheduler()
+
 # ======================
-# CORE: AUTH
+# CORE: AUTH (client / spreadsheet ตัวเดียวตลอดอายุบอท)
 # ======================
+# gspread ใช้ AuthorizedSession ของ google-auth → token หมดอายุก็ refresh เองตอน request
+_client = None
+_spreadsheet = None
+_worksheet_index = {}       # (kind, month) → Worksheet
+_index_loaded_at = 0.0
+_cache_lock = threading.Lock()
+
+
+def _get_client():
+    """เรียกใต้ _cache_lock / authorize ไม่ยิง network (token ขอตอน request แรก)"""
+    global _client
+
+    if _client is None:
+        sa_json = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
+        if not sa_json:
+            raise RuntimeError("GOOGLE_SERVICE_ACCOUNT_JSON not set")
+
+        creds_info = json.loads(sa_json)
+        creds = Credentials.from_service_account_info(
+            creds_info,
+            scopes=SCOPES
+        )
+
+        _client = gspread.authorize(creds)
+        print("🔑 Google Sheets client authorized")
+
+    return _client
+
+
 def get_spreadsheet():
-    sa_json = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
-    if not sa_json:
-        raise RuntimeError("GOOGLE_SERVICE_ACCOUNT_JSON not set")
-
-    creds_info = json.loads(sa_json)
-    creds = Credentials.from_service_account_info(
-        creds_info,
-        scopes=SCOPES
-    )
+    global _spreadsheet
+
+    with _cache_lock:
+        if _spreadsheet is not None:
+            return _spreadsheet
+        client = _get_client()
 
-    gc = gspread.authorize(creds)
-    return gc.open(SHEET_NAME)
+    # เปิดนอก lock (network + retry) / หลาย thread เปิดพร้อมกัน → scheduler รวมเป็น call เดียว
+    ss = sheet_scheduler.read("open", ("open", SHEET_NAME), client.open, SHEET_NAME)
+
+    with _cache_lock:
+        if _spreadsheet is None:
+            _spreadsheet = ss
+            print(f"📗 Spreadsheet opened: {SHEET_NAME}")
+        return _spreadsheet
+
+
+def invalidate_sheet_cache():
+    """ล้าง handle ทั้งหมด (เช่น ชีทถูกลบ/ย้าย) → ครั้งหน้าเปิดใหม่"""
+    global _spreadsheet, _index_loaded_at
+
+    with _cache_lock:
+        _spreadsheet = None
+        _worksheet_index.clear()
+        _index_loaded_at = 0.0
+        _case_layouts.clear()
+        _body_layouts.clear()
+
+
+def is_stale_handle_error(error) -> bool:
+    """error ที่แปลว่า handle ใน cache ชี้ไปชีท/แท็บที่ไม่มีแล้ว (ลบ / เปลี่ยนชื่อ)"""
+    if isinstance(error, (SpreadsheetNotFound, WorksheetNotFound)):
+        return True
+
+    if isinstance(error, APIError):
+        status = getattr(error.response, "status_code", None)
+        if status == 404:
+            return True
+        # range อ้างชื่อแท็บเดิม → แท็บถูกเปลี่ยนชื่อ
+        return status == 400 and "Unable to parse range" in str(error)
+
+    return False
+
+
+def drop_stale_handles(error) -> bool:
+    """เรียกใน except ของงานเขียน/อ่านชีท → ล้าง cache ถ้า handle เก่าแล้ว (รอบหน้าเปิดใหม่)"""
+    if not is_stale_handle_error(error):
+        return False
+
+    print("♻️ Sheet handles stale, cache cleared:", error)
+    invalidate_sheet_cache()
+    return True
 
 # ======================
-# AUTO SELECT MAIN WORKSHEET (เวลาและเคส)
+# WORKSHEET INDEX (เดือน → worksheet)
 # ======================
-def get_sheet_by_date(target_date):
-    ss = get_spreadsheet()
-    month_th = THAI_MONTHS[target_date.month]
+def _fetch_worksheet_index(ss):
+    """list worksheet ครั้งเดียว แล้วจัดกลุ่มตามชนิด + เดือน (ไม่ถือ lock ระหว่างยิง API)"""
+    worksheets = sheet_scheduler.read("worksheets", ("worksheets", ss.id), ss.worksheets)
 
-    for ws in ss.worksheets():
+    index = {}
+    for ws in worksheets:
         title = ws.title.strip()
-        if "เวลาและเคส" in title and month_th in title:
-            return ws
 
+        for kind, marker in SHEET_KINDS.items():
+            if marker not in title:
+                continue
+
+            for month, month_th in THAI_MONTHS.items():
+                if month_th in title:
+                    # ชื่อซ้ำหลายอัน → ใช้อันแรกเหมือนเดิม
+                    index.setdefault((kind, month), ws)
+
+    return index
+
+
+def _find_worksheet(kind, month):
+    global _index_loaded_at
+
+    key = (kind, month)
+
+    with _cache_lock:
+        fresh = time.monotonic() - _index_loaded_at <= WORKSHEET_INDEX_TTL
+        ws = _worksheet_index.get(key) if fresh else None
+
+    if ws is not None:
+        return ws
+
+    # หมดอายุ / miss (อาจเพิ่งสร้างชีทเดือนใหม่) → โหลด index ใหม่ครั้งเดียว
+    index = _fetch_worksheet_index(get_spreadsheet())
+
+    with _cache_lock:
+        _worksheet_index.clear()
+        _worksheet_index.update(index)
+        _index_loaded_at = time.monotonic()
+
+    return index.get(key)
+
+# ======================
+# AUTO SELECT MAIN WORKSHEET (เวลาและเคส)
+# ======================
+def get_sheet_by_date(target_date):
+    ws = _find_worksheet("case", target_date.month)
+    if ws is not None:
+        return ws
+
+    month_th = THAI_MONTHS[target_date.month]
     raise ValueError(
         f"ไม่พบ worksheet ของเดือน {month_th} (เวลาและเคส)"
     )
@@ -83,87 +215,270 @@ def get_sheet():
     return get_sheet_by_date(datetime.now())
 
 # ======================
-# NAME NORMALIZE (เหมือนเดิม 100%)
+# LAYOUT CACHE (header วันที่ → column / ชื่อ → row)
 # ======================
-def normalize_name(name: str) -> str:
-    if not name:
-        return ""
-    name = re.sub(r"\+?\d+\s*", "", name)
-    name = re.sub(r"\[.*?\]\s*", "", name)
-    return name.strip().lower()
+# parse header ครั้งเดียวต่อ worksheet แล้ว lookup เป็น dict
+# column ที่หาไม่เจอ → โหลด header ใหม่ได้ (เผื่อเพิ่งเพิ่ม column) แต่ไม่ถี่กว่า LAYOUT_RELOAD_GAP
+LAYOUT_RELOAD_GAP = 60   # วินาที
 
-# ======================
-# SAFE DAY COLUMN (ของเดิมมึง ใช้ได้ต่อ)
-# ======================
-def find_day_column_safe(target_date):
-    sheet = get_sheet_by_date(target_date)
-    header = sheet.row_values(HEADER_ROW)
+# ใช้จากหลาย worker thread → อ่าน/เขียน dict ใต้ _cache_lock เสมอ (ยิง API นอก lock)
+_case_layouts = {}   # worksheet id → CaseSheetLayout
+_body_layouts = {}   # worksheet id → BodySheetLayout
 
-    target_day = target_date.day
-    target_month = target_date.month
+HEADER_FULL_RE = re.compile(r"วันที่\s*0*(\d{1,2})\s*/\s*0*(\d{1,2})")
+HEADER_DAY_RE = re.compile(r"วันที่\s*0*(\d{1,2})$")
 
-    full_matches = []  # สำหรับ 01/04
-    day_only_matches = []  # สำหรับ วันที่ 1
 
-    for idx, cell in enumerate(header, start=1):
-        if not cell:
-            continue
+def _column_letter(col):
+    return re.sub(r"\d+", "", rowcol_to_a1(1, col))
 
-        text = str(cell)
-        text = re.sub(r"\s+", " ", text).strip()
 
-        # ===== Phase 1: จับแบบ วันที่ dd/mm (แม่นที่สุด) =====
-        m_full = re.search(r"วันที่\s*0*(\d{1,2})\s*/\s*0*(\d{1,2})", text)
-        if m_full:
-            day = int(m_full.group(1))
-            month = int(m_full.group(2))
+def _name_row_map(names):
+    mapping = {}
 
-            if day == target_day and month == target_month:
-                full_matches.append(idx)
-            continue  # สำคัญมาก: ไม่ให้ไปติด day-only ซ้ำ
+    for idx, cell in enumerate(names, start=1):
+        norm = normalize_name(cell)
+        if norm:
+            mapping[norm] = idx
 
-        # ===== Phase 2: จับแบบ วันที่ dd (ใช้เมื่อไม่มี dd/mm) =====
-        m_day = re.search(r"วันที่\s*0*(\d{1,2})$", text)
-        if m_day:
-            day = int(m_day.group(1))
-            if day == target_day:
-                day_only_matches.append(idx)
+    return mapping
+
+
+class CaseSheetLayout:
+    """header + ชื่อของ worksheet เวลาและเคส 1 เดือน (โหลดด้วย batch_get ครั้งเดียว)"""
+
+    def __init__(self, header, names):
+        self.full = {}        # (day, month) → [col]  จาก "วันที่ dd/mm"
+        self.day_only = {}    # day → [col]           จาก "วันที่ dd"
+        self.name_rows = _name_row_map(names)
+        self.loaded_at = time.monotonic()
+        self.stamp = None     # modifiedTime ของ spreadsheet ตอนโหลด (ดู get_synced_case_layout)
+        # (row, col) → ค่าที่บอทเขียนล่าสุด / layout ถูกโหลดใหม่ (มีคนแก้ชีท) = เริ่มนับใหม่
+        self.written = {}
+
+        for idx, cell in enumerate(header, start=1):
+            if not cell:
+                continue
+
+            text = str(cell)
+            text = re.sub(r"\s+", " ", text).strip()
+
+            # ===== Phase 1: จับแบบ วันที่ dd/mm (แม่นที่สุด) =====
+            m_full = HEADER_FULL_RE.search(text)
+            if m_full:
+                key = (int(m_full.group(1)), int(m_full.group(2)))
+                self.full.setdefault(key, []).append(idx)
+                continue  # สำคัญมาก: ไม่ให้ไปติด day-only ซ้ำ
+
+            # ===== Phase 2: จับแบบ วันที่ dd (ใช้เมื่อไม่มี dd/mm) =====
+            m_day = HEADER_DAY_RE.search(text)
+            if m_day:
+                self.day_only.setdefault(int(m_day.group(1)), []).append(idx)
+
+    def changed_cells(self, cells):
+        """cells = {(row, col): ค่า} → เหลือเฉพาะช่องที่ต่างจากที่บอทเขียนไว้ล่าสุด"""
+        return {
+            key: value
+            for key, value in cells.items()
+            if self.written.get(key) != value
+        }
+
+    def remember(self, cells):
+        self.written.update(cells)
+
+    def day_column(self, target_date):
+        target_day = target_date.day
+
+        full_matches = self.full.get((target_day, target_date.month), [])
+        day_only_matches = self.day_only.get(target_day, [])
+
+        # 🔥 Priority: ใช้ dd/mm ก่อนเสมอ
+        if full_matches:
+            if len(full_matches) == 1:
+                return full_matches[0]
+            raise ValueError(
+                f"พบ column dd/mm ซ้ำของวันที่ {target_date.strftime('%d/%m')} "
+                f"{full_matches}"
+            )
+
+        # ถ้าไม่มี dd/mm ค่อยใช้ day-only
+        if len(day_only_matches) == 1:
+            return day_only_matches[0]
+
+        if len(day_only_matches) == 0:
+            raise ValueError(
+                f"ไม่พบ column ของวันที่ {target_date.strftime('%d/%m')}"
+            )
 
-    # 🔥 Priority: ใช้ dd/mm ก่อนเสมอ
-    if full_matches:
-        if len(full_matches) == 1:
-            return full_matches[0]
         raise ValueError(
-            f"พบ column dd/mm ซ้ำของวันที่ {target_date.strftime('%d/%m')} "
-            f"{full_matches}"
+            f"พบ column 'วันที่ {target_day}' ซ้ำ {day_only_matches} "
+            f"— เสี่ยงเขียนผิดช่อง"
         )
 
-    # ถ้าไม่มี dd/mm ค่อยใช้ day-only
-    if len(day_only_matches) == 1:
-        return day_only_matches[0]
 
-    if len(day_only_matches) == 0:
-        raise ValueError(
-            f"ไม่พบ column ของวันที่ {target_date.strftime('%d/%m')}"
-        )
+class BodySheetLayout:
+    """header "dd/mm" → column ของ worksheet รายชื่อร่วมเคสอุ้ม"""
 
-    raise ValueError(
-        f"พบ column 'วันที่ {target_day}' ซ้ำ {day_only_matches} "
-        f"— เสี่ยงเขียนผิดช่อง"
+    def __init__(self, header):
+        self.columns = {}
+        self.loaded_at = time.monotonic()
+
+        for idx, cell in enumerate(header, start=1):
+            if cell:
+                # ซ้ำ → ใช้อันแรกเหมือนเดิม
+                self.columns.setdefault(cell.strip(), idx)
+
+    def day_column(self, work_date):
+        target = work_date.strftime("%d/%m")  # เช่น 01/04
+
+        col = self.columns.get(target)
+        if col is None:
+            raise ValueError(
+                f"ไม่พบ column ของวันที่ {target} ใน Body Case Sheet"
+            )
+        return col
+
+
+def get_case_layout(sheet, refresh=False, stamp=None):
+    """
+    header + ชื่อของ worksheet (cache ต่อ worksheet)
+    refresh=True → ดึงใหม่ (ทั้ง 2 ช่วงใน batch_get เดียว)
+    """
+    with _cache_lock:
+        layout = _case_layouts.get(sheet.id)
+    if layout is not None and not refresh:
+        return layout
+
+    name_col = _column_letter(NAME_COLUMN)
+    ranges = [
+        f"{HEADER_ROW}:{HEADER_ROW}",
+        f"{name_col}:{name_col}",
+    ]
+    header_range, names_range = sheet_scheduler.read(
+        "batch_get",
+        ("batch_get", sheet.id, tuple(ranges)),
+        sheet.batch_get,
+        ranges
     )
 
+    header = header_range[0] if header_range else []
+    names = [row[0] if row else "" for row in names_range]
+
+    layout = CaseSheetLayout(header, names)
+    layout.stamp = stamp
+
+    with _cache_lock:
+        _case_layouts[sheet.id] = layout
+    return layout
+
+
+def get_sheet_stamp():
+    """
+    เวลาแก้ไขล่าสุดของ spreadsheet (Drive modifiedTime)
+    เรียก API ครั้งเดียว ได้แค่ metadata ไม่โหลดข้อมูลในชีท
+    """
+    ss = get_spreadsheet()
+
+    getter = getattr(ss, "get_lastUpdateTime", None)
+    if getter is None:
+        # gspread รุ่นเก่า: property ดึงจาก Drive ทุกครั้งที่อ่าน
+        getter = lambda: ss.lastUpdateTime
+
+    return sheet_scheduler.read("modified_time", ("modified_time", ss.id), getter)
+
+
+def get_synced_case_layout(sheet):
+    """
+    layout ที่ตรงกับชีทตอนนี้
+    ชีทไม่ถูกแก้ตั้งแต่โหลดล่าสุด → ใช้ชื่อ → row เดิม (ไม่ต้องโหลด column ชื่อ + normalize ใหม่)
+    ถูกแก้ (เพิ่ม/ย้าย/แก้ชื่อ) → batch_get ใหม่
+    """
+    # อ่าน stamp ก่อนโหลด → ถ้ามีคนแก้ระหว่างโหลด รอบหน้าจะเห็นว่าเปลี่ยน
+    stamp = get_sheet_stamp()
+
+    with _cache_lock:
+        layout = _case_layouts.get(sheet.id)
+    if layout is not None and layout.stamp == stamp:
+        return layout
+
+    layout = get_case_layout(sheet, refresh=True, stamp=stamp)
+    print(f"📇 Sheet layout reloaded | {sheet.title} names={len(layout.name_rows)}")
+    return layout
+
+
+def note_own_write(before):
+    """
+    บอทเขียนชีทเอง (case หรือ body) → modifiedTime ของทั้ง spreadsheet เปลี่ยน แต่ชื่อไม่ได้เปลี่ยน
+    before = stamp ก่อนเขียน / case layout ที่ยังเป็น stamp นั้น → เลื่อนเป็น stamp ใหม่ ไม่ต้องโหลดใหม่รอบหน้า
+    """
+    if before is None:
+        return
+
+    try:
+        after = get_sheet_stamp()
+    except Exception as e:
+        # แค่ทำให้รอบหน้าโหลด layout ใหม่ ไม่ใช่ error ของการเขียน
+        print("⚠️ Sheet stamp refresh error:", e)
+        return
+
+    with _cache_lock:
+        for layout in _case_layouts.values():
+            if layout.stamp == before:
+                layout.stamp = after
+
+
+def _stamp_before_write():
+    """stamp ตอนนี้ (เฉพาะเมื่อมี case layout ที่ใช้ stamp อยู่ ไม่งั้นไม่ต้องเปลือง quota)"""
+    with _cache_lock:
+        synced = any(layout.stamp is not None for layout in _case_layouts.values())
+    if not synced:
+        return None
+
+    try:
+        return get_sheet_stamp()
+    except Exception as e:
+        print("⚠️ Sheet stamp read error:", e)
+        return None
+
+
+def get_body_layout(sheet, refresh=False):
+    with _cache_lock:
+        layout = _body_layouts.get(sheet.id)
+    if layout is not None and not refresh:
+        return layout
+
+    header = sheet_scheduler.read(
+        "row_values",
+        ("row_values", sheet.id, BODY_HEADER_ROW),
+        sheet.row_values,
+        BODY_HEADER_ROW
+    )
+    layout = BodySheetLayout(header)
+
+    with _cache_lock:
+        _body_layouts[sheet.id] = layout
+    return layout
+
+
+def _resolve_column(get_layout, sheet, day):
+    layout = get_layout(sheet)
+    try:
+        return layout.day_column(day)
+    except ValueError:
+        # header อาจเพิ่งถูกแก้ → โหลดใหม่แล้วลองอีกครั้ง
+        if time.monotonic() - layout.loaded_at < LAYOUT_RELOAD_GAP:
+            raise
+        return get_layout(sheet, refresh=True).day_column(day)
+
 # ======================
 # BODY SHEET (AUTO MONTH) 🔥
 # ======================
 def get_body_sheet_by_date(work_date):
-    ss = get_spreadsheet()
-    month_th = THAI_MONTHS[work_date.month]
-
-    for ws in ss.worksheets():
-        title = ws.title.strip()
-        if "รายชื่อร่วมเคสอุ้ม" in title and month_th in title:
-            return ws
+    ws = _find_worksheet("body", work_date.month)
+    if ws is not None:
+        return ws
 
+    month_th = THAI_MONTHS[work_date.month]
     raise ValueError(
         f"ไม่พบ Body worksheet ของเดือน {month_th}"
     )
@@ -171,47 +486,33 @@ def get_body_sheet_by_date(work_date):
 # ======================
 # BODY COLUMN (ใช้ 01/04 ล้วน = PERFECT)
 # ======================
-def find_body_day_column(work_date):
+def find_body_day_column(work_date, sheet=None):
     """
     หา column จาก format 01/04 (ตามที่มึงใช้จริง)
     """
-    sheet = get_body_sheet_by_date(work_date)
-    header = sheet.row_values(BODY_HEADER_ROW)
-
-    target = work_date.strftime("%d/%m")  # เช่น 01/04
-
-    for idx, cell in enumerate(header, start=1):
-        if cell and cell.strip() == target:
-            return idx
+    if sheet is None:
+        sheet = get_body_sheet_by_date(work_date)
 
-    raise ValueError(
-        f"ไม่พบ column ของวันที่ {target} ใน Body Case Sheet"
-    )
+    return _resolve_column(get_body_layout, sheet, work_date)
 
 # ======================
 # WRITE BODY TOTAL (ไม่เปลี่ยน logic เดิม)
 # ======================
 def write_body_case_total(work_date, total):
-    sheet = get_body_sheet_by_date(work_date)
-    col = find_body_day_column(work_date)
+    try:
+        sheet = get_body_sheet_by_date(work_date)
+        col = find_body_day_column(work_date, sheet)
 
-    sheet.update_cell(BODY_TOTAL_ROW, col, total)
+        before = _stamp_before_write()
+        sheet_scheduler.write("update_cell", sheet.update_cell, BODY_TOTAL_ROW, col, total)
+    except Exception as e:
+        drop_stale_handles(e)
+        raise
+
+    # ไม่งั้น case sync รอบหน้าเห็น stamp เปลี่ยน → โหลด column ชื่อใหม่ทุกครั้งหลังเขียน body
+    note_own_write(before)
 
     print(
         f"🧾 Body Case Sheet updated | "
         f"date={work_date} col={col} total={total}"
     )
-
-# ======================
-# NAME MAP (เหมือนเดิม)
-# ======================
-def build_name_row_map(sheet):
-    names = sheet.col_values(NAME_COLUMN)
-    mapping = {}
-
-    for idx, cell in enumerate(names, start=1):
-        norm = normalize_name(cell)
-        if norm:
-            mapping[norm] = idx
-
-    return mapping
\ No newline at end of file
@@ -0,0 +1,238 @@
+import asyncio
+import json
+
+from circuit import backoff_delay
+
+# ======================
+# SHEET OUTBOX
+# ======================
+# งานเขียน Google Sheet ถูกบันทึกลงตารางนี้ใน transaction เดียวกับข้อมูลที่มันสะท้อน
+# → DB commit แล้ว = ชีทจะถูกเขียนแน่นอน (drainer ทำให้ทีหลัง / ลองใหม่จนสำเร็จ)
+# handler ต้อง idempotent (เขียนค่าสุทธิ ไม่ใช่บวกเพิ่ม) เพราะอาจถูกรันซ้ำ
+
+OUTBOX_POLL_INTERVAL = 30.0   # วินาที (poke() ปลุกก่อนได้)
+OUTBOX_BATCH = 20
+OUTBOX_MAX_ATTEMPTS = 8       # เกินนี้ → failed (ต้องดูเอง)
+OUTBOX_RETENTION_DAYS = 30    # ลบ row ที่เสร็จแล้วเก่ากว่านี้
+
+SHEET_OUTBOX_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS sheet_outbox (
+        id               BIGSERIAL PRIMARY KEY,
+        kind             TEXT    NOT NULL,
+        dedupe_key       TEXT    NOT NULL,
+        payload          JSONB   NOT NULL,
+        version          INTEGER NOT NULL DEFAULT 1,
+        attempts         INTEGER NOT NULL DEFAULT 0,
+        last_error       TEXT,
+        created_at       TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        next_attempt_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        done_at          TIMESTAMPTZ,
+        failed_at        TIMESTAMPTZ
+    );
+
+    -- งานค้างของ key เดียวกันมีได้ 1 row (เขียนซ้ำ = แทน payload เดิม)
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_sheet_outbox_pending_key
+        ON sheet_outbox (kind, dedupe_key)
+        WHERE done_at IS NULL AND failed_at IS NULL;
+
+    CREATE INDEX IF NOT EXISTS idx_sheet_outbox_due
+        ON sheet_outbox (next_attempt_at)
+        WHERE done_at IS NULL AND failed_at IS NULL;
+"""
+
+
+async def enqueue_sheet_write(cur, kind, dedupe_key, payload):
+    """
+    เรียกใน transaction เดียวกับข้อมูล (cur จาก db_async.transaction)
+    มีงาน key เดิมค้างอยู่ → ใช้ payload ใหม่แทน + version+1 (drainer ที่กำลังเขียนของเก่าจะไม่ปิดงานนี้)
+    """
+    await cur.execute("""
+        INSERT INTO sheet_outbox (kind, dedupe_key, payload)
+        VALUES (%s, %s, %s::jsonb)
+        ON CONFLICT (kind, dedupe_key)
+            WHERE done_at IS NULL AND failed_at IS NULL
+        DO UPDATE SET
+            payload = EXCLUDED.payload,
+            version = sheet_outbox.version + 1,
+            attempts = 0,
+            last_error = NULL,
+            next_attempt_at = NOW()
+    """, (kind, dedupe_key, json.dumps(payload, ensure_ascii=False)))
+
+
+class SheetOutbox:
+    """
+    drainer: อ่านงานที่ถึงเวลา → handler[kind](payload) ใน thread → ปิดงาน / เลื่อนไปลองใหม่
+    on_result(kind, payload, result, error) ถูกเรียกเมื่อสำเร็จ หรือเมื่อเลิกลอง (failed)
+    """
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+
+        self._handlers = {}
+        self._on_result = None
+        self._ready = None
+        self._wake = asyncio.Event()
+        self._task = None
+
+        self._stats = {
+            "applied": 0,
+            "retries": 0,
+            "failed": 0,
+            "backlog": 0,
+            "dead": 0,
+            "oldest_age": 0.0,
+            "last_error": None,
+        }
+
+    # ======================
+    # LIFECYCLE
+    # ======================
+    def start(self, handlers, on_result=None, ready=None):
+        """ready() = DB น่าจะพร้อม (เช่น circuit ไม่ open)"""
+        self._handlers = handlers
+        self._on_result = on_result
+        self._ready = ready
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    def poke(self):
+        """มีงานใหม่ → ปลุก drainer ไม่ต้องรอรอบ poll"""
+        self._wake.set()
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    # ======================
+    # DRAIN
+    # ======================
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            if self._ready is not None and not self._ready():
+                continue
+
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("❌ Sheet outbox drain error:", e)
+
+    async def drain(self):
+        async with self.transaction() as cur:
+            await cur.execute("""
+                SELECT id, kind, payload, version, attempts
+                FROM sheet_outbox
+                WHERE done_at IS NULL
+                  AND failed_at IS NULL
+                  AND next_attempt_at <= NOW()
+                ORDER BY id
+                LIMIT %s
+            """, (OUTBOX_BATCH,))
+            jobs = await cur.fetchall()
+
+        for job_id, kind, payload, version, attempts in jobs:
+            await self._apply(job_id, kind, payload, version, attempts)
+
+        await self._refresh_backlog()
+
+        # มีงานเหลือ (เกิน batch) → วนต่อทันที
+        if len(jobs) == OUTBOX_BATCH:
+            self.poke()
+
+    async def _apply(self, job_id, kind, payload, version, attempts):
+        handler = self._handlers.get(kind)
+
+        try:
+            if handler is None:
+                raise RuntimeError(f"no sheet outbox handler for {kind}")
+            result = await asyncio.to_thread(handler, payload)
+
+        except Exception as e:
+            attempts += 1
+            give_up = handler is None or attempts >= OUTBOX_MAX_ATTEMPTS
+            delay = backoff_delay(attempts, base=30.0, cap=1800.0)
+            self._stats["last_error"] = str(e)[:200]
+
+            async with self.transaction() as cur:
+                await cur.execute("""
+                    UPDATE sheet_outbox
+                    SET attempts = %s,
+                        last_error = %s,
+                        next_attempt_at = NOW() + make_interval(secs => %s),
+                        failed_at = CASE WHEN %s THEN NOW() END
+                    WHERE id = %s AND version = %s
+                """, (attempts, str(e)[:500], delay, give_up, job_id, version))
+
+            if give_up:
+                self._stats["failed"] += 1
+                print(f"❌ Sheet outbox #{job_id} {kind} failed after {attempts} attempts:", e)
+                await self._report(kind, payload, None, e)
+            else:
+                self._stats["retries"] += 1
+                print(
+                    f"⚠️ Sheet outbox #{job_id} {kind} retry "
+                    f"{attempts}/{OUTBOX_MAX_ATTEMPTS} in {int(delay)}s:", e
+                )
+            return
+
+        # version เปลี่ยนระหว่างเขียน = มี payload ใหม่กว่า → ปล่อยค้างไว้ให้รอบหน้า
+        async with self.transaction() as cur:
+            await cur.execute("""
+                UPDATE sheet_outbox
+                SET done_at = NOW(), attempts = attempts + 1
+                WHERE id = %s AND version = %s
+            """, (job_id, version))
+
+        self._stats["applied"] += 1
+        await self._report(kind, payload, result, None)
+
+    async def _report(self, kind, payload, result, error):
+        if self._on_result is None:
+            return
+        try:
+            await self._on_result(kind, payload, result, error)
+        except Exception as e:
+            print("⚠️ Sheet outbox result callback error:", e)
+
+    async def _refresh_backlog(self):
+        async with self.transaction() as cur:
+            await cur.execute("""
+                SELECT
+                    COUNT(*) FILTER (WHERE done_at IS NULL AND failed_at IS NULL),
+                    COUNT(*) FILTER (WHERE failed_at IS NOT NULL),
+                    COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_at)
+                        FILTER (WHERE done_at IS NULL AND failed_at IS NULL)), 0)
+                FROM sheet_outbox
+            """)
+            backlog, dead, oldest = await cur.fetchone()
+
+            await cur.execute("""
+                DELETE FROM sheet_outbox
+                WHERE done_at < NOW() - make_interval(days => %s)
+            """, (OUTBOX_RETENTION_DAYS,))
+
+        self._stats["backlog"] = backlog
+        self._stats["dead"] = dead
+        self._stats["oldest_age"] = float(oldest)
+
+    # ======================
+    # METRICS
+    # ======================
+    def stats(self) -> dict:
+        return dict(self._stats)
@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+
+from gspread.exceptions import APIError
+
+from circuit import backoff_delay
+
+# ======================
+# CONFIG
+# ======================
+# quota ของ Sheets API = ต่อนาที ต่อ user (service account = user เดียว) แยก read / write
+SHEETS_READ_PER_MINUTE = int(os.getenv("SHEETS_READ_PER_MINUTE", "60"))
+SHEETS_WRITE_PER_MINUTE = int(os.getenv("SHEETS_WRITE_PER_MINUTE", "60"))
+SHEETS_RETRIES = 5
+SHEETS_RETRY_CAP = 64.0        # วินาที (ตามที่ Google แนะนำสำหรับ exponential backoff)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """เติม token ต่อเนื่อง rate_per_minute / 60 ต่อวินาที / เต็มได้ไม่เกิน capacity"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1, rate_per_minute // 6)   # burst ~10 วินาที
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """บล็อกจนได้ token / คืนเวลาที่ต้องรอ (วินาที)"""
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+    def drain(self):
+        """โดน 429 → ถือว่า quota นาทีนี้หมดแล้ว ให้ทุก caller ชะลอตาม"""
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = time.monotonic()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _retry_status(error):
+    """คืน (retry ได้ไหม, Retry-After วินาที)"""
+    if isinstance(error, APIError):
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+        if status not in RETRYABLE_STATUS:
+            return False, None
+
+        retry_after = None
+        try:
+            retry_after = float(response.headers.get("Retry-After"))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        return True, retry_after
+
+    # network (requests.RequestException เป็น OSError)
+    if isinstance(error, OSError):
+        return True, None
+
+    return False, None
+
+
+class SheetsScheduler:
+    """
+    ทุก call ไป Google Sheets ผ่านตัวนี้ (ใช้จาก worker thread)
+    - token bucket แยก read / write ตาม quota ต่อนาที
+    - 429 / 5xx / network → retry แบบ exponential backoff + jitter (เคารพ Retry-After)
+    - read ที่ key เดียวกันซ้อนกัน → ยิงจริงครั้งเดียว แบ่งผลกัน
+    - เก็บ latency ต่อชนิด call
+    """
+
+    def __init__(
+        self,
+        read_per_minute=SHEETS_READ_PER_MINUTE,
+        write_per_minute=SHEETS_WRITE_PER_MINUTE,
+        retries=SHEETS_RETRIES
+    ):
+        self.retries = retries
+        self._buckets = {
+            "read": TokenBucket(read_per_minute),
+            "write": TokenBucket(write_per_minute),
+        }
+
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+        self._calls = {}    # name → {"count", "errors", "total", "max"}
+        self._stats = {
+            "retries": 0,
+            "throttled": 0,
+            "coalesced": 0,
+            "wait_total": 0.0,
+        }
+        self._stats_lock = threading.Lock()
+
+    # ======================
+    # PUBLIC
+    # ======================
+    def read(self, name, key, func, *args, **kwargs):
+        """key = ตัวระบุ range (None = ไม่รวม call)"""
+        if key is None:
+            return self._call("read", name, func, args, kwargs)
+
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+
+        if not leader:
+            with self._stats_lock:
+                self._stats["coalesced"] += 1
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._call("read", name, func, args, kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def write(self, name, func, *args, **kwargs):
+        return self._call("write", name, func, args, kwargs)
+
+    # ======================
+    # CORE
+    # ======================
+    def _call(self, kind, name, func, args, kwargs):
+        bucket = self._buckets[kind]
+
+        for attempt in range(self.retries):
+            waited = bucket.acquire()
+            started = time.monotonic()
+
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._record(name, time.monotonic() - started, waited, error=True)
+
+                retry, retry_after = _retry_status(e)
+                if not retry or attempt == self.retries - 1:
+                    raise
+
+                if isinstance(e, APIError) and getattr(e.response, "status_code", None) == 429:
+                    bucket.drain()
+                    with self._stats_lock:
+                        self._stats["throttled"] += 1
+
+                delay = max(
+                    retry_after or 0.0,
+                    backoff_delay(attempt, base=1.0, cap=SHEETS_RETRY_CAP)
+                )
+                with self._stats_lock:
+                    self._stats["retries"] += 1
+                print(f"⚠️ Sheets {name} retry {attempt+1}/{self.retries} in {delay:.1f}s:", e)
+                time.sleep(delay)
+                continue
+
+            self._record(name, time.monotonic() - started, waited)
+            return result
+
+    def _record(self, name, elapsed, waited, error=False):
+        with self._stats_lock:
+            call = self._calls.setdefault(
+                name,
+                {"count": 0, "errors": 0, "total": 0.0, "max": 0.0}
+            )
+            call["count"] += 1
+            call["total"] += elapsed
+            call["max"] = max(call["max"], elapsed)
+            if error:
+                call["errors"] += 1
+
+            self._stats["wait_total"] += waited
+
+    # ======================
+    # METRICS
+    # ======================
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats["calls"] = {
+                name: {
+                    "count": call["count"],
+                    "errors": call["errors"],
+                    "avg_ms": call["total"] / call["count"] * 1000 if call["count"] else 0.0,
+                    "max_ms": call["max"] * 1000,
+                }
+                for name, call in self._calls.items()
+            }
+        return stats
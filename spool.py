@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import time
+from datetime import date, datetime
+
+# ======================
+# CONFIG
+# ======================
+CASE_SPOOL_PATH = os.getenv("CASE_SPOOL_PATH", "case_spool.jsonl")
+SPOOL_REPLAY_INTERVAL = 5.0   # เช็คทุกกี่วินาทีว่า DB กลับมาหรือยัง
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+class CaseSpool:
+    """
+    journal บนดิสก์ (JSONL, append-only) สำหรับงานเขียนเคสที่ DB ปฏิเสธ
+    - append หลายครั้งพร้อมกัน → รวมเป็น write + fsync เดียว (group commit)
+    - replay ตามลำดับเมื่อ DB กลับมา / record ที่ replay แล้ว error ถาวร → ย้ายไป .rejected
+    - ระหว่างที่ยังมีของค้าง งานเขียนใหม่ต้องต่อท้าย spool ด้วย (กันลำดับสลับ)
+    """
+
+    def __init__(self, path=CASE_SPOOL_PATH):
+        self.path = path
+        self.rejected_path = path + ".rejected"
+
+        self._group = None          # (lines, future) ที่รอ fsync รอบถัดไป
+        self._writer = None
+        self._file_lock = asyncio.Lock()
+        self._replay_lock = asyncio.Lock()
+        self._replay_task = None
+
+        self._pending = self._count_lines()
+        self._inflight = 0          # record ที่ append แล้วแต่ยังไม่ fsync
+
+        self._stats = {
+            "spooled": 0,
+            "replayed": 0,
+            "rejected": 0,
+            "fsyncs": 0,
+            "replay_errors": 0,
+            "last_replay": None,
+        }
+
+        if self._pending:
+            print(f"📼 Case spool has {self._pending} pending writes from last run")
+
+    # ======================
+    # FILE I/O (รันใน thread)
+    # ======================
+    def _count_lines(self):
+        try:
+            with open(self.path, "rb") as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def _append_lines(self, path, lines):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_lines(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return [line for line in f.read().splitlines() if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _drop_head(self, count):
+        """ตัด count บรรทัดแรก (ที่ replay แล้ว) / เขียนไฟล์ใหม่แล้ว rename ทับ"""
+        remaining = self._read_lines()[count:]
+
+        if not remaining:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            return 0
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in remaining))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        return len(remaining)
+
+    # ======================
+    # APPEND (group commit)
+    # ======================
+    @property
+    def pending(self):
+        """ของค้างในไฟล์ + ที่กำลังเขียนลงไฟล์ (เช็คตัวนี้ก่อนเขียน DB ตรง กันแซงคิว)"""
+        return self._pending + self._inflight
+
+    async def append(self, records):
+        loop = asyncio.get_running_loop()
+        records = list(records)
+
+        if self._group is None:
+            self._group = ([], loop.create_future())
+
+        lines, done = self._group
+        lines.extend(
+            json.dumps(record, ensure_ascii=False, default=_json_default)
+            for record in records
+        )
+
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._commit_groups())
+
+        # นับตั้งแต่ก่อน await แรก → งานเขียนที่ตามมาเห็นว่า spool ไม่ว่างทันที
+        self._inflight += len(records)
+        try:
+            # กลับเมื่อ fsync แล้วเท่านั้น
+            await done
+        finally:
+            self._inflight -= len(records)
+
+    async def _commit_groups(self):
+        while self._group is not None:
+            lines, done = self._group
+            self._group = None
+
+            try:
+                async with self._file_lock:
+                    await asyncio.to_thread(self._append_lines, self.path, lines)
+                    self._pending += len(lines)
+
+                self._stats["spooled"] += len(lines)
+                self._stats["fsyncs"] += 1
+                done.set_result(None)
+            except Exception as e:
+                print("❌ Case spool write error:", e)
+                done.set_exception(e)
+
+    # ======================
+    # REPLAY
+    # ======================
+    async def replay(self, apply, is_transient):
+        """
+        apply(record) ทีละ record ตามลำดับ
+        error ชั่วคราว (DB ยังล่ม) → หยุด เก็บที่เหลือไว้รอบหน้า
+        error ถาวร → ย้าย record ไป .rejected แล้วไปต่อ
+        """
+        async with self._replay_lock:
+            while self._pending:
+                # อ่านใต้ lock เดียวกับ append → ไม่เจอบรรทัดที่กำลังเขียนค้างครึ่งเดียว
+                async with self._file_lock:
+                    lines = await asyncio.to_thread(self._read_lines)
+                if not lines:
+                    self._pending = 0
+                    break
+
+                done = 0
+                stopped = False
+
+                for line in lines:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # บรรทัดเขียนไม่ครบ (เครื่องดับกลาง write)
+                        record = line
+
+                    try:
+                        if not isinstance(record, dict):
+                            raise ValueError("corrupt spool line")
+                        await apply(record)
+                        self._stats["replayed"] += 1
+                    except Exception as e:
+                        if is_transient(e):
+                            self._stats["replay_errors"] += 1
+                            print("⚠️ Case spool replay paused, DB still unavailable:", e)
+                            stopped = True
+                            break
+
+                        print("❌ Case spool record rejected:", e)
+                        await asyncio.to_thread(
+                            self._append_lines,
+                            self.rejected_path,
+                            [json.dumps({"error": str(e), "record": record}, ensure_ascii=False)]
+                        )
+                        self._stats["rejected"] += 1
+
+                    done += 1
+
+                if done:
+                    async with self._file_lock:
+                        self._pending = await asyncio.to_thread(self._drop_head, done)
+                    self._stats["last_replay"] = time.time()
+                    print(f"📼 Case spool replayed {done} writes | pending={self._pending}")
+
+                if stopped:
+                    break
+
+    def start_replayer(self, apply, is_transient, ready, interval=SPOOL_REPLAY_INTERVAL):
+        """ready() = DB น่าจะพร้อมแล้ว (เช่น circuit ไม่ open)"""
+        async def loop():
+            while True:
+                await asyncio.sleep(interval)
+                if self._pending and ready():
+                    try:
+                        await self.replay(apply, is_transient)
+                    except Exception as e:
+                        print("❌ Case spool replay error:", e)
+
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = asyncio.create_task(loop())
+
+    async def stop(self):
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            try:
+                await self._replay_task
+            except asyncio.CancelledError:
+                pass
+            self._replay_task = None
+
+        if self._writer is not None:
+            await self._writer
+
+        if self._pending:
+            print(f"📼 Case spool stopped with {self._pending} pending writes (replay next start)")
+
+    # ======================
+    # METRICS
+    # ======================
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["pending"] = self._pending
+        return stats
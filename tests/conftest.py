@@ -0,0 +1,5 @@
+import os
+import sys
+
+# ให้ import โมดูลบนสุดของ repo ได้ (rollup / migrations / ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
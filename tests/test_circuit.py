@@ -0,0 +1,79 @@
+import pytest
+
+import circuit
+from circuit import CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit.time, "monotonic", fake)
+    return fake
+
+
+def test_opens_after_threshold(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30.0)
+
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure(OSError("down"))
+    assert breaker.state == "closed"
+
+    breaker.allow()
+    breaker.record_failure(OSError("down"))
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    assert not breaker.available()
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+
+    breaker.record_failure(OSError("down"))
+    breaker.record_success()
+    breaker.record_failure(OSError("down"))
+
+    assert breaker.state == "closed"
+
+
+def test_half_open_probe_then_closed(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure(OSError("down"))
+    assert breaker.state == "open"
+
+    clock.now += 30.0
+    assert breaker.available()
+
+    # ครบเวลา → request แรกเป็น probe / ตัวที่สองถูกปฏิเสธระหว่างรอผล
+    breaker.allow()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+
+
+def test_half_open_failure_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure(OSError("down"))
+
+    clock.now += 30.0
+    breaker.allow()
+    breaker.record_failure(OSError("still down"))
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    assert breaker.stats()["trips"] == 2
@@ -0,0 +1,93 @@
+import asyncio
+
+from ingest import CaseIngestQueue
+
+
+def test_posts_are_batched_by_rows():
+    batches = []
+
+    async def flush(batch):
+        batches.append([message_id for message_id, rows in batch])
+
+    async def run():
+        queue = CaseIngestQueue(flush, batch_rows=4, flush_interval=5.0)
+        queue.start()
+
+        for n in range(4):
+            await queue.put(f"m{n}", [("row", n), ("row", n)])
+
+        # ครบ batch_rows → flush ทันที ไม่ต้องรอ flush_interval
+        await asyncio.wait_for(queue.join(), 1.0)
+        await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(run())
+
+    assert batches == [["m0", "m1"], ["m2", "m3"]]
+    assert stats["batches"] == 2
+    assert stats["rows"] == 8
+
+
+def test_partial_batch_flushes_after_interval():
+    batches = []
+
+    async def flush(batch):
+        batches.append(len(batch))
+
+    async def run():
+        queue = CaseIngestQueue(flush, batch_rows=100, flush_interval=0.05)
+        queue.start()
+        await queue.put("m1", [("row",)])
+        await asyncio.sleep(0.2)
+        flushed = list(batches)
+        await queue.stop()
+        return flushed
+
+    assert asyncio.run(run()) == [1]
+
+
+def test_stop_flushes_pending_posts():
+    flushed = []
+
+    async def flush(batch):
+        await asyncio.sleep(0.01)
+        flushed.extend(message_id for message_id, rows in batch)
+
+    async def run():
+        queue = CaseIngestQueue(flush, batch_rows=100, flush_interval=0.2)
+        queue.start()
+        for n in range(3):
+            await queue.put(f"m{n}", [("row",)])
+
+        # batch ยังไม่ถูก flush → stop ต้องรอให้ flush ครบก่อนปิด
+        assert flushed == []
+        await queue.stop(timeout=2.0)
+        return queue.stats()
+
+    stats = asyncio.run(run())
+
+    assert flushed == ["m0", "m1", "m2"]
+    assert stats["depth"] == 0
+
+
+def test_flush_error_is_counted_and_queue_keeps_going():
+    calls = []
+
+    async def flush(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("db down")
+
+    async def run():
+        queue = CaseIngestQueue(flush, batch_rows=1, flush_interval=1.0)
+        queue.start()
+        await queue.put("m1", [("row",)])
+        await queue.put("m2", [("row",)])
+        await queue.stop(timeout=1.0)
+        return queue.stats()
+
+    stats = asyncio.run(run())
+
+    assert calls == [1, 1]
+    assert stats["failures"] == 1
+    assert stats["batches"] == 1
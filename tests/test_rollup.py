@@ -0,0 +1,148 @@
+import asyncio
+import os
+import uuid
+from datetime import date
+
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+
+from migrations import MIGRATIONS
+from rollup import refresh_rollup
+
+# ต้องมี PostgreSQL จริง (ใช้ schema ชั่วคราว ลบทิ้งตอนจบ)
+DATABASE_URL = os.getenv("DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL not set")
+
+DAY = date(2026, 10, 1)
+
+
+async def _connect(schema):
+    conn = await psycopg.AsyncConnection.connect(DATABASE_URL)
+    await conn.execute(f"SET search_path TO {schema}, public")
+    await conn.commit()
+    return conn
+
+
+async def _migrate(conn):
+    async with conn.cursor() as cur:
+        for version, name, steps in MIGRATIONS:
+            for step in steps:
+                if callable(step):
+                    await step(cur)
+                else:
+                    await cur.execute(step)
+    await conn.commit()
+
+
+async def _insert_case(cur, message_id, officer_id, name):
+    await cur.execute("""
+        INSERT INTO cases (date, name, norm_name, case_type, cases, message_id, officer_id)
+        VALUES (%s, %s, %s, 'normal', 1, %s, %s)
+    """, (DAY, name, name.lower(), message_id, officer_id))
+    await refresh_rollup(cur, [message_id])
+
+
+async def _add_officer(conn, discord_id, name):
+    async with conn.cursor() as cur:
+        await cur.execute("""
+            INSERT INTO officers (discord_id, display_name, norm_name)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        """, (discord_id, name, name.lower()))
+        officer_id = (await cur.fetchone())[0]
+    await conn.commit()
+    return officer_id
+
+
+async def _run_concurrent_refresh(schema):
+    setup = await _connect(schema)
+    await _migrate(setup)
+    officer_id = await _add_officer(setup, 1, "Alpha")
+
+    first = await _connect(schema)
+    second = await _connect(schema)
+
+    try:
+        # A เขียน + refresh แต่ยังไม่ commit
+        async with first.cursor() as cur:
+            await _insert_case(cur, "1001", officer_id, "Alpha")
+
+        # B แตะวันเดียวกันระหว่างนั้น → ต้องรอ A ไม่ใช่คำนวณจาก snapshot ที่ยังไม่เห็น A
+        async def other():
+            async with second.cursor() as cur:
+                await _insert_case(cur, "1002", officer_id, "Alpha")
+            await second.commit()
+
+        task = asyncio.create_task(other())
+        await asyncio.sleep(0.5)
+        assert not task.done()
+
+        await first.commit()
+        await asyncio.wait_for(task, 10)
+
+        async with setup.cursor() as cur:
+            await cur.execute(
+                "SELECT SUM(posts), SUM(cases) FROM case_daily_rollup WHERE date = %s",
+                (DAY,)
+            )
+            rollup = await cur.fetchone()
+            await cur.execute(
+                "SELECT posts FROM case_daily_posts WHERE date = %s",
+                (DAY,)
+            )
+            posts = await cur.fetchone()
+
+        return rollup, posts
+
+    finally:
+        await first.close()
+        await second.close()
+        await setup.close()
+
+
+async def _with_schema(func):
+    schema = f"test_rollup_{uuid.uuid4().hex[:8]}"
+    admin = await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True)
+    await admin.execute(f"CREATE SCHEMA {schema}")
+    try:
+        return await func(schema)
+    finally:
+        await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
+
+
+def test_concurrent_refresh_same_day_keeps_both_posts():
+    rollup, posts = asyncio.run(_with_schema(_run_concurrent_refresh))
+
+    assert rollup == (2, 2)
+    assert posts == (2,)
+
+
+async def _run_same_nickname(schema):
+    conn = await _connect(schema)
+    try:
+        await _migrate(conn)
+        first = await _add_officer(conn, 1, "Alpha")
+        second = await _add_officer(conn, 2, "Alpha")
+
+        # 2 คนชื่อเล่นเดียวกันในโพสเดียว → 2 row ทั้งใน cases และ rollup
+        async with conn.cursor() as cur:
+            await _insert_case(cur, "2001", first, "Alpha")
+            await _insert_case(cur, "2001", second, "Alpha")
+            await cur.execute(
+                "SELECT officer_id, posts FROM case_daily_rollup WHERE date = %s ORDER BY 1",
+                (DAY,)
+            )
+            rows = await cur.fetchall()
+        await conn.commit()
+
+        return rows, first, second
+    finally:
+        await conn.close()
+
+
+def test_same_nickname_officers_stay_separate():
+    rows, first, second = asyncio.run(_with_schema(_run_same_nickname))
+
+    assert rows == [(first, 1), (second, 1)]
@@ -0,0 +1,138 @@
+import asyncio
+import json
+from datetime import date
+
+from spool import CaseSpool
+
+
+class Transient(Exception):
+    pass
+
+
+def _is_transient(error):
+    return isinstance(error, Transient)
+
+
+def test_append_then_replay_in_order(tmp_path):
+    path = str(tmp_path / "spool.jsonl")
+    applied = []
+
+    async def apply(record):
+        applied.append(record)
+
+    async def run():
+        spool = CaseSpool(path)
+        # append พร้อมกัน → รวมเป็น group commit แต่ลำดับต้องคงเดิม
+        await asyncio.gather(
+            spool.append([{"op": "upsert", "n": 1, "date": date(2026, 10, 1)}]),
+            spool.append([{"op": "upsert", "n": 2}, {"op": "delete", "n": 3}]),
+        )
+        assert spool.pending == 3
+
+        await spool.replay(apply, _is_transient)
+        return spool
+
+    spool = asyncio.run(run())
+
+    assert [record["n"] for record in applied] == [1, 2, 3]
+    assert applied[0]["date"] == "2026-10-01"
+    assert spool.pending == 0
+    assert not (tmp_path / "spool.jsonl").exists()
+
+
+def test_pending_survives_restart(tmp_path):
+    path = str(tmp_path / "spool.jsonl")
+
+    async def write():
+        await CaseSpool(path).append([{"op": "upsert", "n": 1}, {"op": "upsert", "n": 2}])
+
+    asyncio.run(write())
+
+    assert CaseSpool(path).pending == 2
+
+
+def test_permanent_error_moves_record_to_rejected(tmp_path):
+    path = str(tmp_path / "spool.jsonl")
+    applied = []
+
+    async def apply(record):
+        if record["n"] == 2:
+            raise ValueError("bad record")
+        applied.append(record["n"])
+
+    async def run():
+        spool = CaseSpool(path)
+        await spool.append([{"op": "upsert", "n": n} for n in (1, 2, 3)])
+        await spool.replay(apply, _is_transient)
+        return spool
+
+    spool = asyncio.run(run())
+
+    assert applied == [1, 3]
+    assert spool.pending == 0
+
+    rejected = [json.loads(line) for line in open(spool.rejected_path, encoding="utf-8")]
+    assert rejected == [{"error": "bad record", "record": {"op": "upsert", "n": 2}}]
+
+
+def test_corrupt_line_is_rejected(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    path.write_text('{"op": "upsert", "n": 1}\n{"op": "ups\n', encoding="utf-8")
+    applied = []
+
+    async def apply(record):
+        applied.append(record["n"])
+
+    async def run():
+        spool = CaseSpool(str(path))
+        await spool.replay(apply, _is_transient)
+        return spool
+
+    spool = asyncio.run(run())
+
+    assert applied == [1]
+    assert spool.stats()["rejected"] == 1
+
+
+def test_transient_error_pauses_and_keeps_rest(tmp_path):
+    path = str(tmp_path / "spool.jsonl")
+    applied = []
+    down = {"value": True}
+
+    async def apply(record):
+        if record["n"] == 2 and down["value"]:
+            raise Transient("db down")
+        applied.append(record["n"])
+
+    async def run():
+        spool = CaseSpool(path)
+        await spool.append([{"op": "upsert", "n": n} for n in (1, 2, 3)])
+
+        await spool.replay(apply, _is_transient)
+        paused = spool.pending
+
+        down["value"] = False
+        await spool.replay(apply, _is_transient)
+        return paused, spool.pending
+
+    paused, pending = asyncio.run(run())
+
+    assert paused == 2
+    assert pending == 0
+    assert applied == [1, 2, 3]
+
+
+def test_pending_counts_append_before_fsync(tmp_path):
+    path = str(tmp_path / "spool.jsonl")
+
+    async def run():
+        spool = CaseSpool(path)
+        task = asyncio.create_task(spool.append([{"op": "upsert", "n": 1}]))
+        await asyncio.sleep(0)
+
+        # ยังไม่ fsync แต่งานเขียนที่ตามมาต้องเห็นว่า spool ไม่ว่าง
+        seen = spool.pending
+        await task
+        return seen, spool.pending
+
+    assert asyncio.run(run()) == (1, 1)